@@ -0,0 +1,214 @@
+# admission.py
+"""
+Admission control (virtual waiting room) for seat selection.
+
+Each bus has a FIFO queue and a token bucket:
+- a user joining the queue gets the next ticket number n for that bus (the same ticket again while
+  it is valid), signed with HMAC so any worker can verify it without a lookup
+- an admission cursor advances at ADMISSION_RATE_PER_SECOND; ticket n is admitted once
+  n < cursor. While nobody is waiting the cursor is capped at issued + ADMISSION_BURST, so a quiet
+  bus admits up to BURST users immediately and a rush is metered at RATE
+- a waiting ticket reports its position and ETA; select_seats answers 429 + Retry-After until the
+  ticket is admitted, and joining is refused with 429 once ADMISSION_MAX_QUEUE users are waiting,
+  all before any seat query reaches MongoDB
+
+The cursor only moves at RATE while people wait, so a ticket's admission time is known when it is
+issued; the ticket stays usable for ADMISSION_WINDOW_SECONDS after that.
+
+Stores: "memory" (single worker) or "mongo" (shared by all workers through admission_col and
+admission_tickets_col), chosen by ADMISSION_STORE.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from bson import ObjectId
+from fastapi import Depends, Header, HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import admission_col, admission_tickets_col
+from routers.deps import get_current_user
+
+# (ticket number, issued_at, expires_at)
+Ticket = Tuple[int, float, float]
+
+
+def _advance(cursor: float, last: float, issued: int, now: float) -> float:
+    return min(cursor + settings.ADMISSION_RATE_PER_SECOND * max(0.0, now - last), issued + settings.ADMISSION_BURST)
+
+
+def _expiry(n: int, cursor: float, now: float) -> float:
+    """When ticket n stops being usable: its admission time plus the admission window."""
+    wait = max(0.0, (n + 1 - cursor) / settings.ADMISSION_RATE_PER_SECOND)
+    return now + wait + settings.ADMISSION_WINDOW_SECONDS
+
+
+class MemoryAdmissionStore:
+    def __init__(self):
+        self._buckets: Dict[str, list] = {}   # bus_id -> [cursor, last refill, issued]
+        self._tickets: Dict[Tuple[str, str], Ticket] = {}
+
+    def _bucket(self, bus_id: str, now: float) -> list:
+        b = self._buckets.get(bus_id)
+        if b is None:
+            b = self._buckets[bus_id] = [float(settings.ADMISSION_BURST), now, 0]
+        b[0] = _advance(b[0], b[1], b[2], now)
+        b[1] = now
+        return b
+
+    async def state(self, bus_id: str, now: float) -> Tuple[float, int]:
+        b = self._bucket(bus_id, now)
+        return b[0], b[2]
+
+    async def take(self, bus_id: str, user_id: str, now: float) -> Optional[Ticket]:
+        """The user's valid ticket, or a new one at the back; None when the queue is full."""
+        held = self._tickets.get((bus_id, user_id))
+        if held and held[2] > now:
+            return held
+        b = self._bucket(bus_id, now)
+        if b[2] - b[0] >= settings.ADMISSION_MAX_QUEUE:
+            return None
+        n = b[2]
+        b[2] += 1
+        ticket = (n, now, _expiry(n, b[0], now))
+        self._tickets[(bus_id, user_id)] = ticket
+        if len(self._tickets) > 100_000:
+            self._tickets = {k: t for k, t in self._tickets.items() if t[2] > now}
+        return ticket
+
+
+class MongoAdmissionStore:
+    """
+    Same model shared by all workers: one document per bus in admission_col
+    ({_id: bus_id, cursor, last, issued}) updated by compare-and-set on `last`, and one document per
+    (bus, user) in admission_tickets_col removed by a TTL index after it expires.
+    """
+
+    async def state(self, bus_id: str, now: float) -> Tuple[float, int]:
+        for _ in range(5):
+            doc = await admission_col.find_one({"_id": bus_id})
+            if doc is None:
+                try:
+                    await admission_col.insert_one({"_id": bus_id, "cursor": float(settings.ADMISSION_BURST), "last": now, "issued": 0})
+                except DuplicateKeyError:
+                    pass
+                continue
+            cursor = _advance(doc["cursor"], doc["last"], doc["issued"], now)
+            if now <= doc["last"]:
+                return cursor, doc["issued"]
+            res = await admission_col.update_one({"_id": bus_id, "last": doc["last"]}, {"$set": {"cursor": cursor, "last": now}})
+            if res.modified_count:
+                return cursor, doc["issued"]
+        # heavy contention on the bucket document: the other writers already refilled it
+        doc = await admission_col.find_one({"_id": bus_id})
+        return _advance(doc["cursor"], doc["last"], doc["issued"], now), doc["issued"]
+
+    async def take(self, bus_id: str, user_id: str, now: float) -> Optional[Ticket]:
+        key = f"{bus_id}:{user_id}"
+        held = await admission_tickets_col.find_one({"_id": key})
+        if held and held["expires_at_ts"] > now:
+            return held["n"], held["issued_at"], held["expires_at_ts"]
+
+        cursor, issued = await self.state(bus_id, now)
+        if issued - cursor >= settings.ADMISSION_MAX_QUEUE:
+            return None
+        doc = await admission_col.find_one_and_update({"_id": bus_id}, {"$inc": {"issued": 1}}, return_document=ReturnDocument.BEFORE)
+        n = doc["issued"]
+        ticket = (n, now, _expiry(n, cursor, now))
+        await admission_tickets_col.replace_one(
+            {"_id": key},
+            {"_id": key, "n": n, "issued_at": now, "expires_at_ts": ticket[2],
+             "expires_at": datetime.utcfromtimestamp(ticket[2])},   # TTL index field
+            upsert=True,
+        )
+        return ticket
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _secret() -> bytes:
+    return (settings.ADMISSION_SECRET or settings.JWT_SECRET).encode()
+
+
+def sign_ticket(bus_id: str, user_id: str, ticket: Ticket) -> str:
+    payload = _b64(json.dumps({"b": bus_id, "u": user_id, "n": ticket[0], "exp": round(ticket[2], 3)}, separators=(",", ":")).encode())
+    sig = _b64(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest()[:16])
+    return f"{payload}.{sig}"
+
+
+def verify_ticket(token: str, bus_id: str, user_id: str, now: float) -> Optional[Ticket]:
+    """The ticket if the signature, bus, user and expiry check out, else None."""
+    try:
+        payload, sig = token.split(".", 1)
+        expected = _b64(hmac.new(_secret(), payload.encode(), hashlib.sha256).digest()[:16])
+        if not hmac.compare_digest(sig, expected):
+            return None
+        data = json.loads(_unb64(payload))
+    except (ValueError, TypeError):
+        return None
+    if data.get("b") != bus_id or data.get("u") != user_id or data.get("exp", 0) <= now:
+        return None
+    return int(data["n"]), 0.0, float(data["exp"])
+
+
+class AdmissionController:
+    def __init__(self):
+        self._memory = MemoryAdmissionStore()
+        self._mongo = MongoAdmissionStore()
+
+    @property
+    def store(self):
+        return self._mongo if settings.ADMISSION_STORE == "mongo" else self._memory
+
+    def _status(self, bus_id: str, user_id: str, ticket: Ticket, cursor: float) -> Dict[str, Any]:
+        n = ticket[0]
+        admitted = n < cursor
+        return {
+            "ticket": sign_ticket(bus_id, user_id, ticket),
+            "admitted": admitted,
+            "position": 0 if admitted else n - math.ceil(cursor) + 1,
+            "eta_seconds": 0 if admitted else math.ceil((n + 1 - cursor) / settings.ADMISSION_RATE_PER_SECOND),
+        }
+
+    async def join(self, bus_id: str, user_id: str, token: Optional[str] = None) -> Dict[str, Any]:
+        """Ticket status for the user, joining the queue if they hold no valid ticket (429 when full)."""
+        now = time.time()
+        ticket = verify_ticket(token, bus_id, user_id, now) if token else None
+        if ticket is None:
+            ticket = await self.store.take(bus_id, user_id, now)
+        cursor, issued = await self.store.state(bus_id, now)
+        if ticket is None:
+            retry = math.ceil((issued - cursor) / settings.ADMISSION_RATE_PER_SECOND)
+            raise HTTPException(status_code=429, detail="Too many users waiting for this bus, try again later",
+                                headers={"Retry-After": str(max(1, retry))})
+        return self._status(bus_id, user_id, ticket, cursor)
+
+
+admission = AdmissionController()
+
+
+async def ensure_admission_indexes():
+    await admission_tickets_col.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def require_admission(bus_id: str, x_queue_ticket: Optional[str] = Header(None), user=Depends(get_current_user)):
+    """Dependency for seat selection: pass admitted users, answer 429 with queue status otherwise."""
+    if not settings.ADMISSION_CONTROL:
+        return None
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    status = await admission.join(bus_id, str(user["_id"]), x_queue_ticket)
+    if not status["admitted"]:
+        raise HTTPException(status_code=429, detail=status, headers={"Retry-After": str(max(1, status["eta_seconds"]))})
+    return status
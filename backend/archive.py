@@ -0,0 +1,125 @@
+# archive.py
+"""
+Hot/cold tiering: finalized departures move out of the OLTP collections.
+
+ARCHIVE_GRACE_DAYS after departure a finalized bus is archived:
+- archive_buses: one summary document per bus (_id = bus id) holding the bus document, its seats
+  (seat number, status, booking id) and its reservations, compacted
+- archive_bookings: the bus's bookings as they are (passengers embedded; bookings written before
+  migrate_embed_passengers.py get theirs from the passenger collections), so reports and booking
+  history can read them like live bookings
+
+Each bus goes through archive_state "copying" -> "copied" -> removed from the hot collections
+(passenger documents, bookings, reservations, seats, then the bus itself). Copies are upserts and deletes
+are by bus, so a run interrupted at any point is finished by the next one; a bus whose copy is
+complete is never copied again from partially deleted hot data.
+
+Reads through to the archive: admin reports and top-buses ($unionWith archive_bookings),
+/users/me/bookings (archived_bookings, and archive_buses for their buses) and the pricing route load factors
+($unionWith archive_buses).
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+from config import settings
+from db import (archive_bookings_col, archive_buses_col, bookings_col, buses_col, passenger_collections,
+                reservations_col, seats_col)
+from event_bus import event_bus
+from job_runner import ALL, Shard
+
+logger = logging.getLogger(__name__)
+
+PASSENGER_FIELDS = ("seat_number", "passenger_name", "passenger_email", "passenger_mobile")
+
+# collection names, for $unionWith in read-through aggregations
+ARCHIVE_BUSES = "archive_buses"
+ARCHIVE_BOOKINGS = "archive_bookings"
+
+
+def _bus_keys(bus_id: ObjectId) -> Dict[str, Any]:
+    # bus ids are stored as ObjectId on seats and bookings, as strings on reservations (and some bookings)
+    return {"$in": [bus_id, str(bus_id)]}
+
+
+async def _copy(bus: Dict[str, Any]):
+    bus_id = bus["_id"]
+    seats = [
+        {"seat_number": s.get("seat_number"), "status": s.get("status"), "booking_id": s.get("booked_by_booking_id")}
+        async for s in seats_col.find({"bus_id": _bus_keys(bus_id)}, {"seat_number": 1, "status": 1, "booked_by_booking_id": 1})
+    ]
+    reservations = [
+        {"_id": r["_id"], "user_id": r.get("user_id"), "status": r.get("status"), "seat_numbers": r.get("seat_numbers"),
+         "total_price": r.get("total_price"), "created_at": r.get("created_at")}
+        async for r in reservations_col.find({"bus_id": _bus_keys(bus_id)})
+    ]
+    bookings = await bookings_col.find({"bus_id": _bus_keys(bus_id)}).to_list(length=None)
+    unmigrated = [b["_id"] for b in bookings if "passengers" not in b]
+    if unmigrated:
+        by_booking: Dict[str, List[Dict[str, Any]]] = {}
+        for col in await passenger_collections():
+            async for p in col.find({"booking_id": {"$in": unmigrated + [str(i) for i in unmigrated]}}):
+                by_booking.setdefault(str(p["booking_id"]), []).append({k: p.get(k) for k in PASSENGER_FIELDS})
+        for b in bookings:
+            if "passengers" not in b:
+                b["passengers"] = by_booking.get(str(b["_id"]), [])
+    if bookings:
+        await archive_bookings_col.bulk_write(
+            [ReplaceOne({"_id": b["_id"]}, {**b, "archived_at": datetime.utcnow()}, upsert=True) for b in bookings],
+            ordered=False)
+    summary = {k: v for k, v in bus.items() if k != "archive_state"}
+    await archive_buses_col.replace_one({"_id": bus_id}, {
+        "bus": summary,
+        "seats": seats,
+        "reservations": reservations,
+        "bookings": len(bookings),
+        "archived_at": datetime.utcnow(),
+    }, upsert=True)
+
+
+async def _purge(bus_id: ObjectId):
+    booking_ids = [b["_id"] async for b in bookings_col.find({"bus_id": _bus_keys(bus_id)}, {"_id": 1})]
+    if booking_ids:
+        for col in await passenger_collections():
+            await col.delete_many({"booking_id": {"$in": booking_ids + [str(i) for i in booking_ids]}})
+    await bookings_col.delete_many({"bus_id": _bus_keys(bus_id)})
+    await reservations_col.delete_many({"bus_id": _bus_keys(bus_id)})
+    await seats_col.delete_many({"bus_id": _bus_keys(bus_id)})
+    await buses_col.delete_one({"_id": bus_id})
+    event_bus.emit("buses", "delete", bus_id, bus_id)
+
+
+async def archive_finalized_buses(shard: Shard = ALL) -> int:
+    """Archive up to ARCHIVE_BATCH_BUSES finalized buses past the grace period; returns how many."""
+    cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_GRACE_DAYS)
+    cursor = buses_col.find({"status": "finalized", "start_time": {"$lte": cutoff}, **shard.query()}).sort("start_time", ASCENDING)
+    archived = 0
+    async for bus in cursor:
+        if bus.get("archive_state") != "copied":
+            await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"archive_state": "copying"}})
+            await _copy(bus)
+            await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"archive_state": "copied"}})
+        await _purge(bus["_id"])
+        archived += 1
+        if archived >= settings.ARCHIVE_BATCH_BUSES:
+            break
+    if archived:
+        logger.info("archived buses", extra={"buses": archived})
+    return archived
+
+
+# --- read-through ---
+
+async def archived_bookings(user_filter: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """A user's archived bookings, most recent first (passengers embedded)."""
+    cursor = archive_bookings_col.find(user_filter).sort("created_at", DESCENDING).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+async def ensure_archive_indexes():
+    await archive_bookings_col.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    await archive_bookings_col.create_index("created_at")
+    await archive_bookings_col.create_index("bus_id")
+    # route load factors (pricing) read finalized departures of the last PRICING_HISTORY_DAYS
+    await archive_buses_col.create_index([("bus.status", ASCENDING), ("bus.start_time", ASCENDING)])
@@ -1,42 +1,100 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from db import reservations_col, buses_col, transactions_col, seats_col
-from datetime import datetime, timedelta
-from config import settings
-from seat_lock_manager import SeatLockManager
-from bson import ObjectId
-
-sched = AsyncIOScheduler()
-lock_manager = SeatLockManager()
-
-async def cleanup_expired_reservations():
-    now = datetime.utcnow()
-    cursor = reservations_col.find({"status": "pending", "expires_at": {"$lte": now}})
-    async for res in cursor:
-        # mark seats available if still reserved by this reservation
-        await seats_col.update_many(
-            {"bus_id": res["bus_id"], "seat_number": {"$in": res["seat_numbers"]},
-             "reserved_by_reservation_id": res["_id"]},
-            {"$set": {"status": "available", "reserved_by_reservation_id": None}}
-        )
-        await reservations_col.update_one({"_id": res["_id"]}, {"$set": {"status": "cancelled"}})
-        lock_manager.release_many(str(res["bus_id"]), res["seat_numbers"], str(res["_id"]))
-
-async def finalize_buses():
-    now = datetime.utcnow()
-    threshold = now + timedelta(minutes=20)
-    cursor = buses_col.find({"status": "published", "start_time": {"$lte": threshold}})
-    async for bus in cursor:
-        # finalize bus: mark as finalized
-        await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"status": "finalized"}})
-        # settle transactions for this bus
-        await transactions_col.update_many(
-            {"description": {"$regex": str(bus["_id"])}, "status": "held"},
-            {"$set": {"status": "settled", "settled_at": datetime.utcnow()}}
-        )
-        # optionally unpublish or remove bus from search
-        # await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"status": "finalized", "published": False}})
-
-def start_scheduler():
-    sched.add_job(cleanup_expired_reservations, 'interval', seconds=30, id="cleanup_reservations")
-    sched.add_job(finalize_buses, 'interval', seconds=60, id="finalize_buses")
-    sched.start()
+import asyncio
+from db import reservations_col, buses_col, transactions_col
+from datetime import datetime, timedelta
+from config import settings
+from seat_allocator import seat_allocator
+from bson import ObjectId
+from route_catalogue import route_catalogue
+from journey_planner import journey_planner
+from pymongo import UpdateOne
+from job_runner import ALL, Shard, job_runner, shard_key
+from waitlist import waitlist
+from event_bus import event_bus
+from pricing import record_load_factor, reprice_buses
+from archive import archive_finalized_buses
+from purge import purger
+from cancellations import departure_canceller
+
+async def cleanup_expired_reservations(shard: Shard = ALL):
+    now = datetime.utcnow()
+    # each worker reads only the reservations of its shard's buses
+    cursor = reservations_col.find({"status": "pending", "expires_at": {"$lte": now}, **shard.query()},
+                                   {"bus_id": 1, "seat_numbers": 1, "waitlist_id": 1})
+    expired = await cursor.to_list(length=None)
+    if not expired:
+        return 0
+    # mark seats available if still reserved by these reservations; releases for the same bus are
+    # batched by its allocator into one bulk write
+    await asyncio.gather(*(seat_allocator.release(res["bus_id"], res["seat_numbers"], str(res["_id"])) for res in expired))
+    await reservations_col.update_many(
+        {"_id": {"$in": [res["_id"] for res in expired]}, "status": "pending"},
+        {"$set": {"status": "cancelled"}}
+    )
+    # lapsed waitlist offers move on, and every bus with freed seats offers them to its waitlist
+    await waitlist.lapsed(str(res["_id"]) for res in expired if res.get("waitlist_id"))
+    await asyncio.gather(*(waitlist.hand_off(bus_id) for bus_id in {res["bus_id"] for res in expired}))
+    return len(expired)
+
+async def finalize_buses(shard: Shard = ALL):
+    now = datetime.utcnow()
+    threshold = now + timedelta(minutes=20)
+    cursor = buses_col.find({"status": "published", "start_time": {"$lte": threshold}, **shard.query()})
+    processed = 0
+    async for bus in cursor:
+        processed += 1
+        # finalize bus: mark as finalized
+        await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"status": "finalized"}})
+        event_bus.emit("buses", "update", bus["_id"], bus["_id"], ("status",))
+        journey_planner.remove_bus(bus["_id"])
+        await record_load_factor(bus)
+        # settle transactions for this bus
+        await transactions_col.update_many(
+            {"description": {"$regex": str(bus["_id"])}, "status": "held"},
+            {"$set": {"status": "settled", "settled_at": datetime.utcnow()}}
+        )
+        # optionally unpublish or remove bus from search
+        # await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"status": "finalized", "published": False}})
+    return processed
+
+async def refresh_route_catalogue():
+    # routes created/deleted through another worker become visible here within one interval
+    await route_catalogue.load()
+
+async def reload_journey_planner():
+    # full rebuild: picks up writes from other workers and drops departed buses
+    await journey_planner.load()
+
+async def ensure_shard_keys(batch: int = 1000):
+    """Indexes for the sharded jobs' queries, and shard_key on buses and pending reservations written without one."""
+    await reservations_col.create_index([("status", 1), ("expires_at", 1), ("shard_key", 1)])
+    await buses_col.create_index([("status", 1), ("start_time", 1), ("shard_key", 1)])
+    for col, query, field in ((buses_col, {}, "_id"), (reservations_col, {"status": "pending"}, "bus_id")):
+        ops = []
+        async for doc in col.find({**query, "shard_key": {"$exists": False}}, {field: 1}):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"shard_key": shard_key(doc[field])}}))
+            if len(ops) >= batch:
+                await col.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await col.bulk_write(ops, ordered=False)
+
+async def start_scheduler():
+    # per-bus jobs are split across live workers, whole-fleet batches run on the leader only and
+    # in-memory caches are refreshed on every worker (duration, lag, outcome and backlog on /metrics)
+    await ensure_shard_keys()
+    job_runner.add("cleanup_reservations", cleanup_expired_reservations, 30, mode="sharded")
+    job_runner.add("finalize_buses", finalize_buses, 60, mode="sharded")
+    if settings.PRICING_ENABLED:
+        job_runner.add("reprice_buses", reprice_buses, settings.PRICING_INTERVAL_SECONDS, mode="leader")
+    if settings.ARCHIVE_ENABLED:
+        job_runner.add("archive_buses", archive_finalized_buses, settings.ARCHIVE_INTERVAL_SECONDS, mode="sharded")
+    job_runner.add("purge", purger.run_pending, settings.PURGE_INTERVAL_SECONDS, mode="leader",
+                   max_runtime=settings.PURGE_RUN_SECONDS * 2)
+    job_runner.add("cancel_departures", departure_canceller.run_pending, settings.CANCEL_INTERVAL_SECONDS, mode="leader",
+                   max_runtime=30 * 60)
+    job_runner.add("refresh_route_catalogue", refresh_route_catalogue, 60, mode="local")
+    job_runner.add("reload_journey_planner", reload_journey_planner, 300, mode="local")
+    await job_runner.start()
+
+async def stop_scheduler():
+    await job_runner.stop()
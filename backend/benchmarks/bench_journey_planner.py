@@ -0,0 +1,87 @@
+# benchmarks/bench_journey_planner.py
+"""
+Journey planner latency on a synthetic network.
+
+Builds a random network of cities and direct routes with several departures per route per day,
+loads it straight into a JourneyPlanner (no database), and times random two-transfer queries.
+
+Run from backend/:
+    python -m benchmarks.bench_journey_planner --cities 300 --routes 3000 --departures 4 --queries 500
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from journey_planner import Connection, JourneyPlanner, _ts  # noqa: E402
+
+
+def build_network(args, rng):
+    planner = JourneyPlanner()
+    cities = [f"city{i}" for i in range(args.cities)]
+    base = datetime(2030, 1, 1)
+    pairs = set()
+    while len(pairs) < args.routes:
+        a, b = rng.sample(cities, 2)
+        pairs.add((a, b))
+
+    bus_no = 0
+    for a, b in pairs:
+        duration = rng.randint(60, 12 * 60)
+        fare = float(rng.randint(200, 2000))
+        for day in range(args.days):
+            for _ in range(args.departures):
+                dep = base + timedelta(days=day, minutes=rng.randint(0, 24 * 60 - 1))
+                arr = dep + timedelta(minutes=duration)
+                planner.add_connection(Connection(_ts(dep), _ts(arr), a, b, fare * rng.uniform(0.8, 1.2), str(bus_no), 0.0))
+                bus_no += 1
+    return planner, cities, base
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    planner, cities, base = build_network(args, rng)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    timings = []
+    found = 0
+    for _ in range(args.queries):
+        src, dst = rng.sample(cities, 2)
+        depart_after = base + timedelta(hours=rng.randint(0, 12))
+        t = time.perf_counter()
+        res = planner.plan(src, dst, depart_after, depart_after + timedelta(hours=24), max_transfers=2, now=base)
+        timings.append((time.perf_counter() - t) * 1000)
+        found += res["earliest_arrival"] is not None
+
+    timings.sort()
+    pct = lambda p: round(timings[min(len(timings) - 1, int(len(timings) * p))], 3)
+    print(json.dumps({
+        "cities": args.cities,
+        "routes": args.routes,
+        "connections": len(planner._conns),
+        "build_ms": round(build_ms, 1),
+        "queries": args.queries,
+        "found_ratio": round(found / args.queries, 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(timings[-1], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", type=int, default=300)
+    parser.add_argument("--routes", type=int, default=3000)
+    parser.add_argument("--departures", type=int, default=4, help="departures per route per day")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
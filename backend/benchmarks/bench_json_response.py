@@ -0,0 +1,134 @@
+# benchmarks/bench_json_response.py
+"""
+Requests/sec for the search and seat-map response shapes, before and after FastJSONResponse.
+
+"before" handlers return plain dicts (ids converted to str per document, then jsonable_encoder +
+stdlib json); "after" handlers hand raw documents to FastJSONResponse. Both are served from the
+same in-process app over httpx's ASGI transport, with synthetic Mongo-shaped documents, so the
+numbers isolate serialization cost from database latency.
+
+Run from backend/:
+    python -m benchmarks.bench_json_response --buses 200 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from bson import ObjectId
+from fastapi import FastAPI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.json_response import FastJSONResponse, orjson  # noqa: E402
+
+
+def _bus_docs(n):
+    now = datetime.utcnow()
+    route_id = ObjectId()
+    return [{
+        "_id": ObjectId(),
+        "route_id": route_id,
+        "name": f"Bus {i}",
+        "start_time": now + timedelta(hours=i),
+        "seats_count": 40,
+        "price_per_seat": 450.0,
+        "sales_open_time": now - timedelta(days=7),
+        "status": "published",
+        "layout": "2+2",
+        "created_at": now,
+    } for i in range(n)]
+
+
+def _seat_docs(n=40):
+    out = []
+    for i in range(n):
+        row, pos = divmod(i, 4)
+        out.append({
+            "_id": ObjectId(),
+            "seat_number": str(i + 1),
+            "status": "available" if i % 3 else "booked",
+            "side": "left" if pos < 2 else "right",
+            "row": row + 1,
+            "col": pos % 2 + 1,
+        })
+    return out
+
+
+def build_app(buses, seats):
+    app = FastAPI()
+    bus = buses[0]
+
+    @app.get("/before/search")
+    async def before_search():
+        out = []
+        for b in buses:
+            b = dict(b)
+            b["_id"] = str(b["_id"])
+            b["route_id"] = str(b["route_id"])
+            out.append(b)
+        return {"buses": out}
+
+    @app.get("/after/search")
+    async def after_search():
+        return FastJSONResponse({"buses": buses})
+
+    @app.get("/before/seatmap")
+    async def before_seatmap():
+        b = dict(bus)
+        b["_id"] = str(b["_id"])
+        b["route_id"] = str(b["route_id"])
+        shaped = [{
+            "_id": str(s["_id"]),
+            "seat_number": str(s["seat_number"]),
+            "status": s["status"],
+            "side": s["side"],
+            "row": s["row"],
+            "col": s["col"],
+        } for s in seats]
+        return {"bus": b, "seats": shaped}
+
+    @app.get("/after/seatmap")
+    async def after_seatmap():
+        return FastJSONResponse({"bus": bus, "seats": seats})
+
+    return app
+
+
+async def _drive(client, path, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            r = await client.get(path)
+            r.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return requests / elapsed
+
+
+async def main(args):
+    app = build_app(_bus_docs(args.buses), _seat_docs())
+    transport = httpx.ASGITransport(app=app)
+    results = {"orjson": orjson is not None, "buses": args.buses, "requests": args.requests}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for endpoint in ("search", "seatmap"):
+            for variant in ("before", "after"):
+                path = f"/{variant}/{endpoint}"
+                await _drive(client, path, min(50, args.requests), args.concurrency)  # warm-up
+                results[f"{endpoint}_{variant}_rps"] = round(await _drive(client, path, args.requests, args.concurrency), 1)
+            results[f"{endpoint}_speedup"] = round(results[f"{endpoint}_after_rps"] / results[f"{endpoint}_before_rps"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buses", type=int, default=200, help="buses per search response")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
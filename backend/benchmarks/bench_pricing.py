@@ -0,0 +1,76 @@
+# benchmarks/bench_pricing.py
+"""
+Batch repricing throughput.
+
+Generates random departures (base fare, occupancy, hours to departure, weekday, route load factor)
+and times pricing.compute_prices over all of them at once, against a per-bus Python loop applying
+the same formula. Database reads and the bulk write are not included.
+
+Run from backend/:
+    python -m benchmarks.bench_pricing --buses 10000 --repeat 20
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import pricing  # noqa: E402
+from config import settings  # noqa: E402
+
+
+def python_prices(base, occ, hours, dow, hist):
+    out = []
+    for b, o, h, d, lf in zip(base.tolist(), occ.tolist(), hours.tolist(), dow.tolist(), hist.tolist()):
+        o = min(max(o, 0.0), 1.0)
+        f = 1.0 + pricing.OCC_WEIGHT * o * o
+        f *= float(np.interp(h, pricing.TIME_CURVE_HOURS, pricing.TIME_CURVE_FACTORS))
+        f *= float(pricing.DOW_FACTORS[d])
+        f *= 1.0 + pricing.HIST_WEIGHT * ((pricing.NEUTRAL_LOAD_FACTOR if lf != lf else lf) - pricing.NEUTRAL_LOAD_FACTOR)
+        f = min(max(f, settings.PRICING_MIN_MULTIPLIER), settings.PRICING_MAX_MULTIPLIER)
+        out.append(round(b * f / settings.PRICING_ROUNDING) * settings.PRICING_ROUNDING)
+    return out
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        runs.append((time.perf_counter() - t) * 1000)
+    return result, runs
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    n = args.buses
+    base = rng.integers(200, 2000, n).astype(float)
+    occ = rng.beta(2, 3, n)
+    hours = rng.uniform(0.5, 60 * 24, n)
+    dow = rng.integers(0, 7, n)
+    hist = np.where(rng.random(n) < 0.2, np.nan, rng.beta(5, 2, n))
+
+    vec, vec_runs = timed(lambda: pricing.compute_prices(base, occ, hours, dow, hist), args.repeat)
+    py, py_runs = timed(lambda: python_prices(base, occ, hours, dow, hist), max(1, args.repeat // 5))
+    assert np.allclose(vec, py), "vectorized and loop prices differ"
+
+    print(json.dumps({
+        "buses": n,
+        "numpy_median_ms": round(statistics.median(vec_runs), 3),
+        "numpy_max_ms": round(max(vec_runs), 3),
+        "python_loop_median_ms": round(statistics.median(py_runs), 3),
+        "speedup": round(statistics.median(py_runs) / statistics.median(vec_runs), 1),
+        "mean_multiplier": round(float((vec / base).mean()), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buses", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,306 @@
+# benchmarks/load_bench.py
+"""
+Sales-open load benchmark.
+
+Boots main:app in-process (httpx ASGI transport) or drives an already running server (--base-url),
+seeds routes, buses and seats through the admin APIs, then runs the scenarios that matter when
+sales open:
+
+  search        search storm over the seeded city pairs
+  seatmap       seat-map refresh storm (GET /buses/{id} and the v2 status vector)
+  race          N users racing for the same seats through select -> confirm
+  expiry        cleanup of a backlog of expired pending reservations
+  profile       /users/me and /users/me/bookings for users holding bookings
+
+Each scenario reports throughput, p50/p95/p99 latency, status-code counts and the 409 rate;
+the race scenario also counts double-booking violations (a seat held by more than one confirmed
+reservation). The report is printed as JSON and optionally written to --out.
+
+Database: --mongo-uri mongodb://localhost:27017 for a local mongod (recommended for absolute numbers)
+or mongomock:// for the in-process stand-in (needs mongomock-motor; good for relative comparisons).
+A fresh database named --db-name is used and dropped first.
+
+Run from backend/:
+    python -m benchmarks.load_bench --mongo-uri mongomock:// --users 20 --out bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class Recorder:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.started = 0.0
+        self.elapsed = 0.0
+        self.extra: Dict[str, Any] = {}
+
+    async def call(self, client, method: str, url: str, **kwargs):
+        t = time.perf_counter()
+        r = await client.request(method, url, **kwargs)
+        self.latencies.append((time.perf_counter() - t) * 1000)
+        self.statuses[r.status_code] += 1
+        return r
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+    def report(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        total = len(lat)
+        return {
+            "requests": total,
+            "duration_s": round(self.elapsed, 3),
+            "throughput_rps": round(total / self.elapsed, 1) if self.elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(statistics.mean(lat), 2) if lat else 0.0,
+                "p50": round(_percentile(lat, 0.50), 2),
+                "p95": round(_percentile(lat, 0.95), 2),
+                "p99": round(_percentile(lat, 0.99), 2),
+                "max": round(lat[-1], 2) if lat else 0.0,
+            },
+            "status_counts": {str(k): v for k, v in sorted(self.statuses.items())},
+            "rate_409": round(self.statuses.get(409, 0) / total, 4) if total else 0.0,
+            **self.extra,
+        }
+
+
+async def _bounded(concurrency: int, jobs):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with sem:
+            return await job()
+
+    return await asyncio.gather(*(run(j) for j in jobs))
+
+
+def _auth(token: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def seed(client, args, mods) -> Dict[str, Any]:
+    db, auth = mods["db"], mods["auth"]
+    admin_email = "bench-admin@example.com"
+    await db.users_col.insert_one({
+        "name": "Bench Admin", "email": admin_email, "password_hash": auth.hash_password("bench-pass"),
+        "mobile": "0", "balance": 0.0, "created_at": datetime.utcnow(), "role": "admin",
+    })
+    r = await client.post("/auth/signin", json={"email": admin_email, "password": "bench-pass"})
+    r.raise_for_status()
+    admin = _auth(r.json()["access_token"])
+
+    pairs, bus_ids = [], []
+    start = datetime.utcnow() + timedelta(days=2)
+    for i in range(args.routes):
+        src, dst = f"City{i}", f"City{i + 1}"
+        r = await client.post("/admin/routes", json={"src_city": src, "dst_city": dst}, headers=admin)
+        r.raise_for_status()
+        route_id = r.json()["id"]
+        pairs.append((src, dst))
+        for j in range(args.buses_per_route):
+            r = await client.post("/admin/buses", headers=admin, json={
+                "route_id": route_id, "name": f"B{i}-{j}",
+                "start_time": (start + timedelta(hours=j)).isoformat(),
+                "seats_count": args.seats, "price_per_seat": 100.0,
+            })
+            r.raise_for_status()
+            bus_ids.append(r.json()["id"])
+
+    async def signup(n):
+        r = await client.post("/auth/signup", json={
+            "name": f"User {n}", "email": f"bench-user-{n}@example.com", "password": "bench-pass", "mobile": "1",
+        })
+        r.raise_for_status()
+        return _auth(r.json()["access_token"])
+
+    users = await _bounded(args.concurrency, [lambda n=n: signup(n) for n in range(args.users)])
+    # plenty of balance so the race measures seat contention, not 402s
+    await db.users_col.update_many({"role": "user"}, {"$set": {"balance": 1_000_000.0}})
+    return {"admin": admin, "pairs": pairs, "bus_ids": bus_ids, "users": users}
+
+
+async def scenario_search(client, args, ctx):
+    rec = Recorder("search")
+    rng = random.Random(1)
+    with rec:
+        await _bounded(args.concurrency, [
+            (lambda p=rng.choice(ctx["pairs"]): rec.call(client, "GET", "/buses/search", params={"src": p[0], "dst": p[1]}))
+            for _ in range(args.requests)
+        ])
+    return rec.report()
+
+
+async def scenario_seatmap(client, args, ctx):
+    rec = Recorder("seatmap")
+    rng = random.Random(2)
+    jobs = []
+    for n in range(args.requests):
+        bus_id = rng.choice(ctx["bus_ids"])
+        url = f"/buses/{bus_id}" if n % 2 == 0 else f"/v2/buses/{bus_id}/status"
+        jobs.append(lambda url=url: rec.call(client, "GET", url))
+    with rec:
+        await _bounded(args.concurrency, jobs)
+    return rec.report()
+
+
+async def scenario_race(client, args, ctx, mods):
+    """Every user tries to grab the same seats on one bus at once, then confirms."""
+    rec = Recorder("race")
+    bus_id = ctx["bus_ids"][0]
+    seats = [str(n) for n in range(1, args.race_seats + 1)]
+
+    async def attempt(headers):
+        r = await rec.call(client, "POST", f"/reservations/select/{bus_id}", json={"seat_numbers": seats}, headers=headers)
+        if r.status_code != 201:
+            return
+        reservation_id = r.json()["id"]
+        passengers = [{"seat_number": s, "name": "P", "email": "p@example.com", "mobile": "1"} for s in seats]
+        await rec.call(client, "POST", f"/reservations/confirm/{reservation_id}", json={"passengers": passengers}, headers=headers)
+
+    with rec:
+        await asyncio.gather(*(attempt(h) for h in ctx["users"]))
+
+    # double booking: a seat that appears in more than one confirmed reservation
+    seat_owners: Counter = Counter()
+    confirmed = 0
+    async for res in mods["db"].reservations_col.find({"bus_id": bus_id, "status": "confirmed"}):
+        confirmed += 1
+        seat_owners.update(res.get("seat_numbers", []))
+    rec.extra["confirmed_reservations"] = confirmed
+    rec.extra["double_booking_violations"] = sum(1 for c in seat_owners.values() if c > 1)
+    return rec.report()
+
+
+async def scenario_expiry(client, args, ctx, mods):
+    """Insert a backlog of already-expired pending reservations and time one cleanup pass."""
+    from bson import ObjectId
+    db = mods["db"]
+    rec = Recorder("expiry")
+    rng = random.Random(3)
+    past = datetime.utcnow() - timedelta(minutes=5)
+    docs = []
+    for _ in range(args.expired):
+        bus_id = rng.choice(ctx["bus_ids"][1:] or ctx["bus_ids"])
+        seat = str(rng.randint(1, args.seats))
+        rid = ObjectId()
+        docs.append({"_id": rid, "user_id": None, "bus_id": bus_id, "seat_numbers": [seat], "total_price": 100.0,
+                     "status": "pending", "expires_at": past, "created_at": past})
+        await db.seats_col.update_one({"bus_id": ObjectId(bus_id), "seat_number": seat, "status": "available"},
+                                      {"$set": {"status": "reserved", "reserved_by_reservation_id": str(rid)}})
+    if docs:
+        await db.reservations_col.insert_many(docs)
+
+    with rec:
+        t = time.perf_counter()
+        await mods["background_tasks"].cleanup_expired_reservations()
+        rec.latencies.append((time.perf_counter() - t) * 1000)
+    remaining = await db.reservations_col.count_documents({"status": "pending", "expires_at": {"$lte": datetime.utcnow()}})
+    report = rec.report()
+    report.update({
+        "backlog": len(docs),
+        "remaining_after_cleanup": remaining,
+        "reservations_per_s": round(len(docs) / rec.elapsed, 1) if rec.elapsed else 0.0,
+    })
+    return report
+
+
+async def scenario_profile(client, args, ctx):
+    rec = Recorder("profile")
+    rng = random.Random(4)
+    jobs = []
+    for n in range(args.requests):
+        headers = rng.choice(ctx["users"])
+        url = "/users/me" if n % 2 == 0 else "/users/me/bookings"
+        jobs.append(lambda url=url, headers=headers: rec.call(client, "GET", url, headers=headers))
+    with rec:
+        await _bounded(args.concurrency, jobs)
+    return rec.report()
+
+
+async def main(args):
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["DB_NAME"] = args.db_name
+    os.environ.setdefault("LOG_LEVEL", "ERROR")   # app logs share stdout with the JSON report
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    import httpx
+    import auth
+    import background_tasks
+    import db
+
+    mods = {"db": db, "auth": auth, "background_tasks": background_tasks}
+    await db.client.drop_database(args.db_name)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        import main as app_module
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://bench", timeout=60)
+
+    report: Dict[str, Any] = {
+        "started_at": datetime.utcnow().isoformat(),
+        "target": args.base_url or "in-process",
+        "mongo_uri": args.mongo_uri.split("@")[-1],
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "mongo_uri")},
+        "scenarios": {},
+    }
+    async with client:
+        t = time.perf_counter()
+        ctx = await seed(client, args, mods)
+        report["seed_s"] = round(time.perf_counter() - t, 2)
+        selected = args.scenarios.split(",")
+        if "search" in selected:
+            report["scenarios"]["search"] = await scenario_search(client, args, ctx)
+        if "seatmap" in selected:
+            report["scenarios"]["seatmap"] = await scenario_seatmap(client, args, ctx)
+        if "race" in selected:
+            report["scenarios"]["race"] = await scenario_race(client, args, ctx, mods)
+        if "expiry" in selected:
+            report["scenarios"]["expiry"] = await scenario_expiry(client, args, ctx, mods)
+        if "profile" in selected:
+            report["scenarios"]["profile"] = await scenario_profile(client, args, ctx)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        Path(args.out).write_text(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="bus_booking_bench")
+    parser.add_argument("--base-url", default=None, help="drive a running server instead of the in-process app")
+    parser.add_argument("--scenarios", default="search,seatmap,race,expiry,profile")
+    parser.add_argument("--routes", type=int, default=10)
+    parser.add_argument("--buses-per-route", type=int, default=3)
+    parser.add_argument("--seats", type=int, default=40)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per storm scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--race-seats", type=int, default=2, help="seats every racer asks for")
+    parser.add_argument("--expired", type=int, default=500, help="expired reservations in the cleanup backlog")
+    parser.add_argument("--out", default=None, help="also write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
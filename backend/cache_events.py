@@ -0,0 +1,59 @@
+# cache_events.py
+"""
+Event bus subscribers keeping this worker's in-memory caches current:
+- route catalogue and journey planner routes: reloaded on any routes write
+- journey planner connections: refreshed per changed bus (fully reloaded for large batches)
+- free-seat index (group_allocator) and static seat layouts (seat_layouts): dropped per bus
+A "reset" event (subscriber overflow, lost change stream history) rebuilds or drops everything.
+"""
+from typing import List, Set
+from event_bus import RESET, Event, event_bus
+from group_allocator import invalidate_free_seat_index
+from journey_planner import journey_planner
+from route_catalogue import route_catalogue
+from seat_layouts import invalidate_bus_layout
+
+# above this many changed buses in one batch a full planner reload is cheaper than per-bus reads
+PLANNER_RELOAD_THRESHOLD = 50
+
+
+async def _on_routes(events: List[Event]):
+    if route_catalogue.loaded:
+        await route_catalogue.load()
+    if journey_planner.loaded:
+        await journey_planner.load()
+
+
+async def _on_buses(events: List[Event]):
+    if any(e.op == RESET for e in events):
+        if journey_planner.loaded:
+            await journey_planner.load()
+        return
+    changed: Set[str] = set()
+    for e in events:
+        if e.op == "delete":
+            journey_planner.remove_bus(e.doc_id)
+            invalidate_bus_layout(e.doc_id)
+        else:
+            changed.add(e.bus_id)
+            if e.op != "update" or "layout_version" in e.fields:
+                invalidate_bus_layout(e.bus_id)
+    if not journey_planner.loaded:
+        return
+    if len(changed) > PLANNER_RELOAD_THRESHOLD:
+        await journey_planner.load()
+        return
+    for bus_id in changed:
+        await journey_planner.refresh_bus(bus_id)
+
+
+def _on_seats(events: List[Event]):
+    for e in events:
+        # an event without a bus id (reset) drops every index
+        invalidate_free_seat_index(None if e.op == RESET or e.bus_id is None else e.bus_id)
+
+
+def register():
+    event_bus.subscribe("route_catalogue", _on_routes, collections=["routes"])
+    event_bus.subscribe("journey_planner", _on_buses, collections=["buses"])
+    event_bus.subscribe("free_seat_index", _on_seats, collections=["seats"])
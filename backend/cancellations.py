@@ -0,0 +1,190 @@
+# cancellations.py
+"""
+Operator cancellation of a whole departure: every booking on the bus refunded in bulk.
+
+POST /admin/buses/{id}/cancel marks the bus "cancelled" (no new reservations, dropped from search)
+and creates its cancellation job (one per bus, _id = bus id, so repeating the request is a no-op).
+The "cancel_departures" scheduler job works through open jobs on the leader:
+1. pending reservations on the bus are released and cancelled, active waitlist entries cancelled
+2. bookings are refunded CANCEL_BATCH_SIZE at a time, each batch in a handful of bulk operations:
+   claim the batch (status "cancelling"), insert all refund transactions (insert_many), credit
+   balances with one $inc per user (bulk_write), mark bookings cancelled and free their seats
+   (update_many), settle the transactions, then email the affected users CANCEL_NOTIFY_CONCURRENCY
+   at a time
+3. the loop ends when the bus has no uncancelled booking left (so a booking confirmed meanwhile
+   is caught too) and the job is marked done
+
+Resumable and idempotent: the current batch (booking ids + a batch token) is saved on the job before
+any money moves and only cleared once the batch is complete, so an interrupted batch is redone with
+the same token. Refund transactions carry refund_booking_id (unique index: inserted once), and each
+balance $inc only matches a user whose refund_batches does not yet contain the token (credited once);
+the token is $pull'ed when the batch completes. Notifications are at-least-once.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import settings
+from db import bookings_col, buses_col, cancellations_col, reservations_col, seats_col, transactions_col, users_col, waitlist_col
+from event_bus import event_bus
+from journey_planner import journey_planner
+from seat_allocator import seat_allocator
+from utils.email_utils import send_email_async
+from waitlist import ACTIVE_STATUSES, closing_update
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+def _id_keys(oid: ObjectId) -> Dict[str, Any]:
+    # bus ids are stored as ObjectId on seats and bookings, as strings on reservations (and some bookings)
+    return {"$in": [oid, str(oid)]}
+
+
+def _user_key(user_id: Any) -> Any:
+    return ObjectId(user_id) if isinstance(user_id, str) and ObjectId.is_valid(user_id) else user_id
+
+
+async def cancel_departure(bus: Dict[str, Any], reason: Optional[str] = None) -> Dict[str, Any]:
+    """Stop sales on the bus and open its cancellation job (the existing job if already cancelled)."""
+    now = datetime.utcnow()
+    await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"status": "cancelled", "cancelled_at": now}})
+    event_bus.emit("buses", "update", bus["_id"], bus["_id"], ("status",))
+    journey_planner.remove_bus(bus["_id"])
+    await cancellations_col.update_one({"_id": bus["_id"]}, {"$setOnInsert": {
+        "status": "queued", "reason": reason, "progress": {"bookings": 0, "refunded": 0.0, "notified": 0},
+        "created_at": now,
+    }}, upsert=True)
+    return await cancellations_col.find_one({"_id": bus["_id"]}, {"batch": 0})
+
+
+class DepartureCanceller:
+    async def _release_holds(self, bus_id: ObjectId):
+        pending = await reservations_col.find({"bus_id": _id_keys(bus_id), "status": "pending"},
+                                              {"bus_id": 1, "seat_numbers": 1}).to_list(length=None)
+        if pending:
+            await asyncio.gather(*(seat_allocator.release(r["bus_id"], r["seat_numbers"], str(r["_id"])) for r in pending))
+            await reservations_col.update_many({"_id": {"$in": [r["_id"] for r in pending]}, "status": "pending"},
+                                               {"$set": {"status": "cancelled"}})
+        await waitlist_col.update_many({"bus_id": str(bus_id), "status": {"$in": ACTIVE_STATUSES}},
+                                       closing_update("cancelled"))
+
+    async def _next_batch(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if job.get("batch"):
+            return job["batch"]   # interrupted: redo it with the same token
+        ids = [b["_id"] async for b in bookings_col.find(
+            {"bus_id": _id_keys(job["_id"]), "status": {"$nin": ["cancelled", "cancelling"]}}, {"_id": 1}
+        ).limit(settings.CANCEL_BATCH_SIZE)]
+        if not ids:
+            return None
+        batch = {"token": ObjectId(), "booking_ids": ids}
+        await cancellations_col.update_one({"_id": job["_id"]}, {"$set": {"batch": batch, "status": "running"}})
+        # claim: a user cancelling one of these bookings now is refused (see users_routes.cancel_booking)
+        await bookings_col.update_many({"_id": {"$in": ids}, "status": {"$ne": "cancelled"}}, {"$set": {"status": "cancelling"}})
+        return batch
+
+    async def _refund(self, bus_id: ObjectId, batch: Dict[str, Any]) -> Dict[str, Any]:
+        token, ids = batch["token"], batch["booking_ids"]
+        bookings = await bookings_col.find({"_id": {"$in": ids}, "status": "cancelling"},
+                                           {"user_id": 1, "total_price": 1}).to_list(length=None)
+        now = datetime.utcnow()
+        if bookings:
+            txs = [{
+                "from_user_id": None,
+                "to_user_id": str(b.get("user_id")),
+                "amount": float(b.get("total_price", 0.0)),
+                "status": "pending",
+                "type": "refund",
+                "refund_booking_id": b["_id"],
+                "bus_id": bus_id,
+                "description": f"Refund for cancelled departure {bus_id} (booking {b['_id']})",
+                "timestamp": now,
+            } for b in bookings]
+            try:
+                await transactions_col.insert_many(txs, ordered=False)
+            except BulkWriteError as e:
+                # already inserted by the interrupted attempt of this batch
+                if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                    raise
+
+            per_user: Dict[Any, float] = defaultdict(float)
+            for b in bookings:
+                per_user[_user_key(b.get("user_id"))] += float(b.get("total_price", 0.0))
+            await users_col.bulk_write([
+                UpdateOne({"_id": uid, "refund_batches": {"$ne": token}},
+                          {"$inc": {"balance": amount}, "$push": {"refund_batches": token}})
+                for uid, amount in per_user.items()
+            ], ordered=False)
+
+            booking_ids = [b["_id"] for b in bookings]
+            await bookings_col.update_many({"_id": {"$in": booking_ids}}, {"$set": {
+                "status": "cancelled", "cancelled_at": now, "cancel_reason": "departure_cancelled"}})
+            await seats_col.update_many(
+                {"bus_id": _id_keys(bus_id), "booked_by_booking_id": {"$in": [str(i) for i in booking_ids]}},
+                {"$set": {"status": "available"}, "$unset": {"booked_by_booking_id": "", "reserved_by_reservation_id": ""}})
+            await event_bus.seats_changed(bus_id)
+        await transactions_col.update_many({"refund_booking_id": {"$in": ids}, "status": "pending"},
+                                           {"$set": {"status": "settled"}})
+        await users_col.update_many({"refund_batches": token}, {"$pull": {"refund_batches": token}})
+        return {"bookings": len(bookings), "refunded": sum(float(b.get("total_price", 0.0)) for b in bookings),
+                "users": [_user_key(b.get("user_id")) for b in bookings]}
+
+    async def _notify(self, bus: Optional[Dict[str, Any]], user_ids: List[Any], reason: Optional[str]) -> int:
+        if not user_ids:
+            return 0
+        users = await users_col.find({"_id": {"$in": list(set(user_ids))}}, {"email": 1, "name": 1}).to_list(length=None)
+        when = bus.get("start_time") if bus else None
+        subject = "Your departure has been cancelled"
+        body = (f"The bus departing {when:%Y-%m-%d %H:%M} has been cancelled by the operator"
+                if isinstance(when, datetime) else "A bus you booked has been cancelled by the operator")
+        body += (f" ({reason})." if reason else ".") + " Your booking has been refunded to your balance."
+        sent = 0
+        targets = [u["email"] for u in users if u.get("email")]
+        step = max(1, settings.CANCEL_NOTIFY_CONCURRENCY)
+        for i in range(0, len(targets), step):
+            results = await asyncio.gather(*(send_email_async(to, subject, body) for to in targets[i:i + step]),
+                                           return_exceptions=True)
+            sent += sum(1 for r in results if r is True)
+        return sent
+
+    async def run_job(self, job: Dict[str, Any]):
+        bus_id = job["_id"]
+        await self._release_holds(bus_id)
+        bus = await buses_col.find_one({"_id": bus_id}, {"start_time": 1})
+        while True:
+            batch = await self._next_batch(job)
+            if batch is None:
+                break
+            done = await self._refund(bus_id, batch)
+            notified = await self._notify(bus, done["users"], job.get("reason"))
+            await cancellations_col.update_one({"_id": bus_id}, {
+                "$inc": {"progress.bookings": done["bookings"], "progress.refunded": done["refunded"],
+                         "progress.notified": notified},
+                "$unset": {"batch": ""},
+                "$set": {"updated_at": datetime.utcnow()},
+            })
+            job.pop("batch", None)
+        await cancellations_col.update_one({"_id": bus_id}, {"$set": {"status": "done", "finished_at": datetime.utcnow()}})
+        logger.info("departure cancelled", extra={"bus_id": str(bus_id)})
+
+    async def run_pending(self) -> int:
+        """Process every open cancellation job; returns how many finished."""
+        finished = 0
+        async for job in cancellations_col.find({"status": {"$in": ["queued", "running"]}}).sort("created_at", 1):
+            await self.run_job(job)
+            finished += 1
+        return finished
+
+
+departure_canceller = DepartureCanceller()
+
+
+async def ensure_cancellation_indexes():
+    await transactions_col.create_index("refund_booking_id", unique=True,
+                                        partialFilterExpression={"refund_booking_id": {"$exists": True}})
+    await cancellations_col.create_index([("status", 1), ("created_at", 1)])
@@ -1,29 +1,133 @@
-
-
-# config.py (add these fields to your existing Settings class)
-from pydantic import BaseSettings
-from typing import Optional  # 👈 add this
-
-class Settings(BaseSettings):
-    # ... existing fields ...
-    MONGO_URI: str = "mongodb://localhost:27017"
-    DB_NAME: str = "bus_booking"
-    JWT_SECRET: str = "..."  # your secret
-    JWT_ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
-    RESERVATION_TTL_SECONDS: int = 10 * 60
-    INITIAL_BALANCE: float = 1000.0
-
-    # --- SMTP settings for outgoing email ---
-    SMTP_HOST: Optional[str] = None       # e.g. "smtp.gmail.com"
-    SMTP_PORT: Optional[int] = None       # e.g. 465 for SSL or 587 for TLS
-    SMTP_USER: Optional[str] = None       # SMTP username
-    SMTP_PASSWORD: Optional[str] = None   # SMTP password or app password
-    SMTP_FROM: Optional[str] = None       # default FROM address, e.g. "no-reply@mydomain.com"
-    SMTP_USE_SSL: bool = True             # true => use SMTP_SSL (port 465), false => starttls (587)
-
-    class Config:
-        env_file = ".env"
-
-settings = Settings()
-
+
+
+# config.py (add these fields to your existing Settings class)
+from pydantic import BaseSettings
+from typing import Optional  # 👈 add this
+
+class Settings(BaseSettings):
+    # ... existing fields ...
+    MONGO_URI: str = "mongodb://localhost:27017"
+    DB_NAME: str = "bus_booking"
+    JWT_SECRET: str = "..."  # your secret
+    JWT_ALGORITHM: str = "HS256"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+    RESERVATION_TTL_SECONDS: int = 10 * 60
+    INITIAL_BALANCE: float = 1000.0
+
+    # --- journey planner (multi-leg search) ---
+    DEFAULT_TRIP_MINUTES: int = 6 * 60        # assumed travel time when neither bus nor route has one
+    MIN_CONNECTION_MINUTES: int = 30          # minimum transfer time between legs
+    JOURNEY_HORIZON_HOURS: int = 48           # how far after the first departure itineraries may run
+
+    # --- group seat allocation (group_allocator.py) ---
+    FREE_SEAT_INDEX_TTL_SECONDS: float = 2.0  # how long a bus's free-block index is reused before a re-read
+
+    # --- background job runner (job_runner.py) ---
+    JOB_COORDINATION: bool = True             # leader election + job leases in MongoDB; false => every worker runs every job
+    JOB_HEARTBEAT_SECONDS: int = 5            # worker presence / leader lease renewal interval
+    JOB_LEASE_SECONDS: int = 20               # a worker (or leader) silent this long is considered gone
+
+    # --- event bus (event_bus.py) ---
+    EVENT_BUS: str = "auto"                   # "auto" | "change_stream" (replica set) | "local" | "off"
+    EVENT_BUS_CONSUMER: str = "busly"         # key of the persisted change stream resume token
+    EVENT_CHECKPOINT_SECONDS: float = 5.0     # how often the resume token is persisted
+    EVENT_QUEUE_SIZE: int = 1000              # per-subscriber queue before back-pressure / reset
+
+    # --- hot/cold archival of finalized departures (archive.py) ---
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_GRACE_DAYS: int = 30              # days after departure a finalized bus stays in the hot collections
+    ARCHIVE_BATCH_BUSES: int = 50             # buses archived per run (the rest wait for the next run)
+    ARCHIVE_INTERVAL_SECONDS: int = 10 * 60
+
+    # --- background cascade deletes of buses and routes (purge.py) ---
+    PURGE_BATCH_SIZE: int = 500               # documents deleted per delete_many
+    PURGE_BATCH_PAUSE_SECONDS: float = 0.05   # throttle between batches
+    PURGE_RUN_SECONDS: float = 30.0           # a run stops after this long; the next run resumes
+    PURGE_INTERVAL_SECONDS: int = 5
+
+    # --- bulk departure cancellation (cancellations.py) ---
+    CANCEL_BATCH_SIZE: int = 200              # bookings refunded per batch of bulk writes
+    CANCEL_NOTIFY_CONCURRENCY: int = 20       # cancellation emails in flight at once
+    CANCEL_INTERVAL_SECONDS: int = 5
+
+    # --- signed tickets (tickets.py) ---
+    TICKET_SECRET: Optional[str] = None       # ticket signing key shared with boarding devices (not JWT_SECRET); derived from it when unset
+    TICKET_PNR_LENGTH: int = 6                # characters in the short booking code
+    TICKET_VALID_HOURS: int = 12              # a ticket stops verifying this long after departure
+
+    # --- e-ticket rendering (ticket_renderer.py) ---
+    TICKET_RENDER_WORKERS: int = 2            # renderer processes (CPU-bound, never on the event loop)
+    TICKET_RENDER_MAX_PENDING: int = 8        # renders submitted to the pool at once; the rest wait
+    TICKET_CACHE_DAYS: int = 30               # rendered tickets are dropped this long after rendering
+    TICKET_HTTP_MAX_AGE: int = 24 * 3600      # Cache-Control max-age of /bookings/{id}/ticket
+
+    # --- dynamic pricing (pricing.py) ---
+    PRICING_ENABLED: bool = True
+    PRICING_INTERVAL_SECONDS: int = 5 * 60    # how often published buses are repriced
+    PRICING_MIN_MULTIPLIER: float = 0.8       # price never drops below this x price_per_seat
+    PRICING_MAX_MULTIPLIER: float = 2.0       # ... nor rises above this x price_per_seat
+    PRICING_ROUNDING: float = 1.0             # prices are rounded to a multiple of this
+    PRICING_HISTORY_DAYS: int = 90            # finalized buses considered for a route's load factor
+
+    # --- waitlist for sold-out buses (waitlist.py) ---
+    WAITLIST_OFFER_SECONDS: int = 5 * 60      # how long freed seats are held for the offered user
+    WAITLIST_SCAN_LIMIT: int = 50             # waiting entries considered per hand-off, in priority order
+
+    # --- read routing to replica set secondaries (db.py) ---
+    READ_ROUTING: bool = True
+    READ_MAX_STALENESS_SECONDS: int = 90                   # skip secondaries lagging more (driver minimum: 90)
+    READ_PREFERENCE_SEARCH: str = "secondaryPreferred"     # bus search and bus pages
+    READ_PREFERENCE_ANALYTICS: str = "secondaryPreferred"  # admin reports / top buses
+    READ_PREFERENCE_USER: str = "secondaryPreferred"       # a user's own bookings (causally consistent session)
+
+    # --- auth rate limiting (rate_limit.py) ---
+    AUTH_RATE_LIMIT: bool = True
+    AUTH_LIMIT_PER_IP: int = 20               # signin/signup attempts per client IP ...
+    AUTH_IP_WINDOW_SECONDS: float = 60.0      # ... per this sliding window
+    AUTH_LIMIT_PER_EMAIL: int = 5             # attempts per email address ...
+    AUTH_EMAIL_WINDOW_SECONDS: float = 300.0
+    AUTH_LIMIT_GLOBAL: int = 200              # attempts across all clients (that passed the IP and email limits) ...
+    AUTH_GLOBAL_WINDOW_SECONDS: float = 10.0
+    AUTH_HASH_CONCURRENCY: int = 4            # bcrypt hashes running at once (threadpool)
+    RATE_LIMIT_STORE: str = "memory"          # "memory" (per worker) or "mongo" (shared by workers)
+    RATE_LIMIT_SHARDS: int = 16               # in-memory counter shards
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # take the client IP from X-Forwarded-For (behind a proxy)
+
+    # --- admission control / waiting room for seat selection (admission.py) ---
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_RATE_PER_SECOND: float = 5.0    # users admitted to seat selection per bus per second
+    ADMISSION_BURST: int = 20                 # admitted immediately when nobody is waiting
+    ADMISSION_MAX_QUEUE: int = 5000           # waiting users per bus before joining is refused (429)
+    ADMISSION_WINDOW_SECONDS: int = 10 * 60   # how long an admitted ticket stays usable
+    ADMISSION_STORE: str = "memory"           # "memory" (one worker) or "mongo" (shared by workers)
+    ADMISSION_SECRET: Optional[str] = None    # ticket signing key; defaults to JWT_SECRET
+
+    # --- Idempotency-Key handling (idempotency.py) ---
+    IDEMPOTENCY_TTL_HOURS: int = 24           # how long stored responses are replayed
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0    # how long a duplicate waits on another worker's execution
+    IDEMPOTENCY_LOCK_SECONDS: int = 60        # an in-progress key older than this is considered abandoned
+
+    # --- logging (logging_config.py) ---
+    LOG_LEVEL: str = "INFO"                   # root level
+    LOG_LEVELS: str = ""                      # per-logger overrides, e.g. "routers.buses_routes=DEBUG"
+    LOG_JSON: bool = True                     # one JSON object per line; false => plain text
+    LOG_DEBUG_SAMPLE_RATE: float = 0.01       # fraction of hot-path debug events kept
+
+    # --- per-request query tracing (query_tracer.py) ---
+    QUERY_TRACING: bool = True                # Server-Timing header + budget/N+1 logging
+    QUERY_BUDGET: int = 25                    # log requests issuing more MongoDB commands than this
+    N_PLUS_ONE_THRESHOLD: int = 5             # same query shape this many times in one request => N+1
+
+    # --- SMTP settings for outgoing email ---
+    SMTP_HOST: Optional[str] = None       # e.g. "smtp.gmail.com"
+    SMTP_PORT: Optional[int] = None       # e.g. 465 for SSL or 587 for TLS
+    SMTP_USER: Optional[str] = None       # SMTP username
+    SMTP_PASSWORD: Optional[str] = None   # SMTP password or app password
+    SMTP_FROM: Optional[str] = None       # default FROM address, e.g. "no-reply@mydomain.com"
+    SMTP_USE_SSL: bool = True             # true => use SMTP_SSL (port 465), false => starttls (587)
+
+    class Config:
+        env_file = ".env"
+
+settings = Settings()
+
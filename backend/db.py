@@ -1,16 +1,94 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from config import settings
-
-client = AsyncIOMotorClient(settings.MONGO_URI)
-db = client[settings.DB_NAME]
-
-# Helpful collection references
-users_col = db["users"]
-routes_col = db["routes"]
-buses_col = db["buses"]
-seats_col = db["seats"]
-reservations_col = db["reservations"]
-bookings_col = db["bookings"]
-passengers_col = db["passengers"]
-transactions_col = db["transactions"]
-topup_requests_col = db["topup_requests"]
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from config import settings
+from metrics import mongo_metrics_listener
+from query_tracer import query_trace_listener
+
+MONGOMOCK = settings.MONGO_URI.startswith("mongomock://")
+if MONGOMOCK:
+    # in-process stand-in for benchmarks/experiments (pip install mongomock-motor); not for production
+    from mongomock_motor import AsyncMongoMockClient
+    client = AsyncMongoMockClient()
+else:
+    client = AsyncIOMotorClient(settings.MONGO_URI, event_listeners=[mongo_metrics_listener, query_trace_listener])
+db = client[settings.DB_NAME]
+
+# Helpful collection references
+users_col = db["users"]
+routes_col = db["routes"]
+buses_col = db["buses"]
+seats_col = db["seats"]
+reservations_col = db["reservations"]
+bookings_col = db["bookings"]
+passengers_col = db["passengers"]   # read-only view over bookings.passengers after migrate_embed_passengers.py
+passengers_legacy_col = db["passengers_legacy"]   # the old passengers collection, renamed by the migration
+transactions_col = db["transactions"]
+topup_requests_col = db["topup_requests"]
+seat_layouts_col = db["seat_layouts"]
+admission_col = db["admission"]
+admission_tickets_col = db["admission_tickets"]
+idempotency_col = db["idempotency_keys"]
+waitlist_col = db["waitlist"]
+job_leases_col = db["job_leases"]
+job_workers_col = db["job_workers"]
+event_offsets_col = db["event_offsets"]
+archive_buses_col = db["archive_buses"]
+archive_bookings_col = db["archive_bookings"]
+purge_jobs_col = db["purge_jobs"]
+cancellations_col = db["cancellations"]
+ticket_renders_col = db["ticket_renders"]
+rate_limits_col = db["rate_limits"]
+
+# --- read routing ---
+# The handles above read from the primary: seat writes, checkout and every read-modify-write use them.
+# Read-mostly traffic gets handles of its own so that, on a replica set, it can be served by
+# secondaries no further than READ_MAX_STALENESS_SECONDS behind the primary (a standalone server
+# ignores read preferences, and READ_ROUTING=False sends everything back to the primary).
+#
+# To try it locally, start a 3-node replica set:
+#   mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0   (and 27018, 27019 with their own dbpaths)
+#   mongosh --eval 'rs.initiate({_id: "rs0", members: [{_id: 0, host: "localhost:27017"},
+#                   {_id: 1, host: "localhost:27018"}, {_id: 2, host: "localhost:27019"}]})'
+#   MONGO_URI="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+# and watch mongo_query_seconds / the query trace: search and reports run on the secondaries.
+_READ_MODES = {"primaryPreferred": PrimaryPreferred, "secondary": Secondary,
+               "secondaryPreferred": SecondaryPreferred, "nearest": Nearest}
+
+
+def _read_preference(mode: str):
+    if not settings.READ_ROUTING or mode == "primary":
+        return Primary()
+    return _READ_MODES[mode](max_staleness=settings.READ_MAX_STALENESS_SECONDS)
+
+
+# bus search and bus pages: a few seconds of lag only shows a seat as free that select then refuses
+search_db = client.get_database(settings.DB_NAME, read_preference=_read_preference(settings.READ_PREFERENCE_SEARCH))
+search_buses_col = search_db["buses"]
+search_seats_col = search_db["seats"]
+
+# admin reports and analytics
+analytics_db = client.get_database(settings.DB_NAME, read_preference=_read_preference(settings.READ_PREFERENCE_ANALYTICS))
+analytics_bookings_col = analytics_db["bookings"]
+
+# a user's own data, read inside a causally consistent session (routers.deps.get_user_session) so a
+# secondary answers only once it has caught up with that user's writes
+user_reads_db = client.get_database(settings.DB_NAME, read_preference=_read_preference(settings.READ_PREFERENCE_USER))
+user_bookings_col = user_reads_db["bookings"]
+user_buses_col = user_reads_db["buses"]
+user_routes_col = user_reads_db["routes"]
+
+# mongomock has no sessions; without read routing every read is on the primary anyway
+CAUSAL_SESSIONS = settings.READ_ROUTING and not MONGOMOCK
+
+
+async def passenger_collections():
+    """
+    The collections that still hold passenger documents: passengers until migrate_embed_passengers.py
+    swaps in the read-only view, passengers_legacy after it (views are left out; they cannot be written).
+    """
+    names = ("passengers", "passengers_legacy")
+    if MONGOMOCK:
+        found = await db.list_collection_names()   # the stand-in has no views and no type filter
+    else:
+        found = await db.list_collection_names(filter={"type": "collection", "name": {"$in": list(names)}})
+    return [db[name] for name in names if name in found]
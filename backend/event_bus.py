@@ -0,0 +1,253 @@
+# event_bus.py
+"""
+Internal event bus: one typed event per write to the watched collections.
+
+Sources (EVENT_BUS setting):
+- "change_stream": a MongoDB change stream over buses, routes and users. Every worker sees every
+  write, whichever worker (or tool) made it. Seat writes are not streamed (a seat change carries
+  no bus id without a per-event lookup on the primary, on the hottest write path): writers call
+  seats_changed(bus_id) once per write batch, which bumps the bus's seats_version, and that
+  update is delivered to subscribers as a "seats" event for the bus. The resume token is checkpointed in
+  event_offsets every EVENT_CHECKPOINT_SECONDS, once the blocking subscribers have processed
+  everything up to it, so a restarted worker resumes where it stopped. When the token is too old
+  for the oplog, subscribers get a "reset" event instead.
+- "local": in-process publisher for standalone mongod (no change streams). Write sites call
+  event_bus.emit() (seats_changed() for seats), after the write; only this worker's writes are seen, other workers converge through the
+  scheduler's periodic reloads.
+- "auto" (default): change streams when the server supports them, local otherwise.
+
+Subscribers get their own bounded queue and task; the handler is called with a batch (everything
+queued at that moment, so a burst of writes costs one invalidation). A full queue either blocks the
+source (overflow="block": back-pressure reaches the change stream cursor, nothing is lost) or is
+dropped and replaced by one "reset" event (overflow="reset": for caches that can rebuild).
+
+Testing against a local single-node replica set:
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+    MONGO_URI="mongodb://localhost:27017/?replicaSet=rs0" uvicorn main:app
+"""
+import asyncio
+import inspect
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from pymongo.errors import OperationFailure, PyMongoError
+from config import settings
+from bson import ObjectId
+from db import db, event_offsets_col
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WATCHED = ("buses", "routes", "users")   # seats: see seats_changed()
+RESET = "reset"
+# server error codes meaning the stored resume token cannot be used any more
+HISTORY_LOST_CODES = (136, 280, 286)
+SEATS_VERSION = "seats_version"
+# keep events small: ids and changed fields
+PIPELINE = [
+    {"$match": {"ns.coll": {"$in": list(WATCHED)}}},
+    {"$project": {"operationType": 1, "ns": 1, "documentKey": 1, "updateDescription.updatedFields": 1}},
+]
+
+events_total = registry.counter("event_bus_events_total", "Events published by collection and source", ("collection", "source"))
+event_resets_total = registry.counter("event_bus_resets_total", "Reset events delivered (queue overflow or lost history)", ("subscriber",))
+
+
+class Event(NamedTuple):
+    collection: str
+    op: str                          # insert | update | replace | delete | reset
+    doc_id: Any = None
+    bus_id: Optional[str] = None     # the bus a seat (or bus) event concerns
+    fields: Tuple[str, ...] = ()     # updated field names for update events
+    token: Any = None                # change stream resume token (None for local events)
+
+
+Handler = Callable[[List[Event]], Union[None, Awaitable[None]]]
+
+
+class Subscription:
+    def __init__(self, name: str, handler: Handler, collections: Optional[Iterable[str]], max_queue: int, overflow: str):
+        self.name = name
+        self.handler = handler
+        self.collections = set(collections) if collections else None
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.task: Optional[asyncio.Task] = None
+
+    def wants(self, event: Event) -> bool:
+        return event.op == RESET or self.collections is None or event.collection in self.collections
+
+    async def put(self, event: Event):
+        if self.overflow == "block":
+            await self.queue.put(event)   # back-pressure: the source waits for this subscriber
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # too far behind: throw the backlog away, one reset makes the cache rebuild
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.queue.task_done()
+            self.queue.put_nowait(Event(event.collection, RESET))
+            event_resets_total.inc(subscriber=self.name)
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                result = self.handler(batch)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("event subscriber failed", extra={"subscriber": self.name, "events": len(batch)})
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+class EventBus:
+    def __init__(self):
+        self.source: Optional[str] = None   # "change_stream" | "local" once started
+        self._subs: List[Subscription] = []
+        self._task: Optional[asyncio.Task] = None
+        self._token: Any = None
+        self._checkpointed: Any = None
+        self._inbox: Optional[asyncio.Queue] = None   # local events, published in order by one task
+
+    def subscribe(self, name: str, handler: Handler, collections: Optional[Iterable[str]] = None,
+                  max_queue: Optional[int] = None, overflow: str = "reset") -> Subscription:
+        if overflow not in ("block", "reset"):
+            raise ValueError("overflow must be 'block' or 'reset'")
+        sub = Subscription(name, handler, collections, max_queue or settings.EVENT_QUEUE_SIZE, overflow)
+        self._subs.append(sub)
+        if self.source is not None:
+            sub.task = asyncio.get_running_loop().create_task(sub.run())
+        return sub
+
+    async def start(self):
+        mode = settings.EVENT_BUS
+        if mode == "off":
+            return
+        loop = asyncio.get_running_loop()
+        for sub in self._subs:
+            sub.task = sub.task or loop.create_task(sub.run())
+        if mode in ("auto", "change_stream") and await self._change_streams_supported():
+            self.source = "change_stream"
+            doc = await event_offsets_col.find_one({"_id": settings.EVENT_BUS_CONSUMER})
+            self._token = self._checkpointed = doc.get("token") if doc else None
+            self._task = loop.create_task(self._watch())
+        elif mode == "change_stream":
+            raise RuntimeError("EVENT_BUS=change_stream but the server does not support change streams")
+        else:
+            self.source = "local"
+            self._inbox = asyncio.Queue()
+            self._task = loop.create_task(self._drain_local())
+        logger.info("event bus started", extra={"source": self.source})
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            if self.source == "change_stream":
+                await self._checkpoint(wait=False)
+        for sub in self._subs:
+            if sub.task is not None:
+                sub.task.cancel()
+                sub.task = None
+        self.source = None
+
+    # --- publishing ---
+
+    def emit(self, collection: str, op: str, doc_id: Any = None, bus_id: Any = None, fields: Iterable[str] = ()):
+        """Announce a write made by this worker. A no-op when change streams already deliver it."""
+        if self.source != "local":
+            return
+        self._inbox.put_nowait(Event(collection, op, doc_id, str(bus_id) if bus_id is not None else None, tuple(fields)))
+
+    async def seats_changed(self, bus_id: Any, op: str = "update"):
+        """Announce a write to a bus's seats (call after the write, once per batch)."""
+        if self.source == "local":
+            self.emit("seats", op, bus_id=bus_id, fields=("status",))
+        elif self.source == "change_stream":
+            oid = ObjectId(bus_id) if isinstance(bus_id, str) and ObjectId.is_valid(bus_id) else bus_id
+            await db["buses"].update_one({"_id": oid}, {"$inc": {SEATS_VERSION: 1}})
+
+    async def _drain_local(self):
+        while True:
+            await self._publish(await self._inbox.get(), "local")
+
+    async def _publish(self, event: Event, source: str):
+        events_total.inc(collection=event.collection, source=source)
+        for sub in self._subs:
+            if sub.wants(event):
+                await sub.put(event)
+
+    # --- change streams ---
+
+    async def _change_streams_supported(self) -> bool:
+        try:
+            hello = await db.command("hello")
+        except Exception:
+            return False
+        return bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+
+    async def _watch(self):
+        backoff = 1.0
+        last_checkpoint = asyncio.get_running_loop().time()
+        while True:
+            try:
+                async with db.watch(PIPELINE, resume_after=self._token, max_await_time_ms=1000) as stream:
+                    backoff = 1.0
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            self._token = change["_id"]
+                            await self._publish(self._to_event(change), "change_stream")
+                        elif stream.resume_token is not None:
+                            self._token = stream.resume_token   # idle: keep the token fresh
+                        now = asyncio.get_running_loop().time()
+                        if now - last_checkpoint >= settings.EVENT_CHECKPOINT_SECONDS:
+                            await self._checkpoint()
+                            last_checkpoint = now
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in HISTORY_LOST_CODES and self._token is not None:
+                    logger.warning("change stream history lost, resetting subscribers", extra={"code": e.code})
+                    self._token = None
+                    await self._publish(Event("*", RESET), "change_stream")
+                    continue
+                logger.exception("change stream failed, retrying", extra={"retry_in": backoff})
+            except PyMongoError:
+                logger.exception("change stream failed, retrying", extra={"retry_in": backoff})
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    @staticmethod
+    def _to_event(change: Dict[str, Any]) -> Event:
+        collection = change["ns"]["coll"]
+        doc_id = change.get("documentKey", {}).get("_id")
+        bus_id = doc_id if collection == "buses" else None
+        fields = tuple((change.get("updateDescription") or {}).get("updatedFields", {}).keys())
+        if collection == "buses" and fields == (SEATS_VERSION,):
+            # seats_changed(): a write to this bus's seats
+            return Event("seats", "update", None, str(bus_id), ("status",), change["_id"])
+        return Event(collection, change["operationType"], doc_id, str(bus_id) if bus_id is not None else None,
+                     fields, change["_id"])
+
+    async def _checkpoint(self, wait: bool = True):
+        """Persist the resume token once blocking subscribers have processed everything before it."""
+        token = self._token
+        if token is None or token == self._checkpointed:
+            return
+        if wait:
+            await asyncio.gather(*(s.queue.join() for s in self._subs if s.overflow == "block"))
+        await event_offsets_col.update_one({"_id": settings.EVENT_BUS_CONSUMER},
+                                           {"$set": {"token": token, "updated_at": datetime.utcnow()}}, upsert=True)
+        self._checkpointed = token
+
+
+event_bus = EventBus()
@@ -0,0 +1,198 @@
+# group_allocator.py
+"""
+Group seat allocation: "N seats together".
+
+For each bus a free-block index is kept: the bus's static layout (seat_layouts.load_bus_layout)
+grouped into rows (deck, row) and sides, plus every maximal run of consecutive free seats on one
+side of a row, bucketed by run length. The index is rebuilt from one status read at most every
+FREE_SEAT_INDEX_TTL_SECONDS and patched in place when this worker reserves seats.
+
+Candidates for a group of N, best tier first:
+  same_row_side  N consecutive seats on one side of a row (taken from runs of length >= N)
+  same_row       N seats in one row across the aisle, closest to the aisle
+  adjacent_rows  N seats in two consecutive rows (one side of both rows, or both sides)
+  split          (only with allow_split) the N free seats spanning the fewest rows
+Within a tier, preferences (window seats, side) and then front rows decide. Row range and deck
+are hard filters.
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from config import settings
+from db import seats_col
+from seat_layouts import load_bus_layout
+
+TIERS = ("same_row_side", "same_row", "adjacent_rows", "split")
+
+RowKey = Tuple[int, int]   # (deck, row)
+
+
+class Preferences:
+    def __init__(self, window: bool = False, side: Optional[str] = None, row_min: Optional[int] = None,
+                 row_max: Optional[int] = None, deck: Optional[int] = None):
+        self.window = window
+        self.side = side
+        self.row_min = row_min
+        self.row_max = row_max
+        self.deck = deck
+
+    def allows(self, seat: Dict[str, Any]) -> bool:
+        row = seat.get("row") or 0
+        if self.row_min is not None and row < self.row_min:
+            return False
+        if self.row_max is not None and row > self.row_max:
+            return False
+        return self.deck is None or (seat.get("deck") or 1) == self.deck
+
+
+class FreeSeatIndex:
+    def __init__(self, layout_seats: List[Dict[str, Any]], statuses: Dict[str, str]):
+        self.seats: Dict[str, Dict[str, Any]] = {s["seat_number"]: s for s in layout_seats}
+        self.free: Set[str] = {n for n in self.seats if statuses.get(n, "available") == "available"}
+        # (deck, row) -> side -> seats ordered by column
+        self.rows: Dict[RowKey, Dict[str, List[Dict[str, Any]]]] = {}
+        for s in sorted(layout_seats, key=lambda s: ((s.get("deck") or 1), s.get("row") or 0, s.get("side") or "", s.get("col") or 0)):
+            self.rows.setdefault(((s.get("deck") or 1), s.get("row") or 0), {}).setdefault(s.get("side") or "left", []).append(s)
+        self._window: Set[str] = set()
+        for sides in self.rows.values():
+            if sides.get("left"):
+                self._window.add(sides["left"][0]["seat_number"])
+            if sides.get("right"):
+                self._window.add(sides["right"][-1]["seat_number"])
+        self.runs_by_len: Dict[int, List[Tuple[RowKey, str, List[str]]]] = {}
+        self._reindex(self.rows.keys())
+
+    def _runs(self, key: RowKey) -> Iterable[Tuple[RowKey, str, List[str]]]:
+        for side, seats in self.rows[key].items():
+            run: List[str] = []
+            prev_col = None
+            for s in seats:
+                n, col = s["seat_number"], s.get("col") or 0
+                if n in self.free:
+                    if run and col != prev_col + 1:   # a gap in a custom layout breaks the block
+                        yield key, side, run
+                        run = []
+                    run.append(n)
+                elif run:
+                    yield key, side, run
+                    run = []
+                prev_col = col
+            if run:
+                yield key, side, run
+
+    def _reindex(self, keys: Iterable[RowKey]):
+        keys = set(keys)
+        for length in list(self.runs_by_len):
+            self.runs_by_len[length] = [r for r in self.runs_by_len[length] if r[0] not in keys]
+        for key in keys:
+            for run in self._runs(key):
+                self.runs_by_len.setdefault(len(run), []).append(run)
+
+    def take(self, seat_numbers: Iterable[str]):
+        """Mark seats as no longer free (reserved here, or found taken) and patch the runs."""
+        touched = set()
+        for n in seat_numbers:
+            if n in self.free:
+                self.free.discard(n)
+                s = self.seats[n]
+                touched.add(((s.get("deck") or 1), s.get("row") or 0))
+        self._reindex(touched)
+
+    # --- candidates ---
+
+    def _score(self, tier: str, seats: List[str], prefs: Preferences) -> Tuple:
+        penalty = 0
+        for n in seats:
+            s = self.seats[n]
+            if prefs.side and s.get("side") != prefs.side:
+                penalty += 2
+            if prefs.window and n not in self._window:
+                penalty += 1
+        rows = [self.seats[n].get("row") or 0 for n in seats]
+        return TIERS.index(tier), penalty, max(rows) - min(rows), min(rows)
+
+    def candidates(self, count: int, prefs: Preferences, allow_split: bool = False) -> List[Tuple[str, List[str]]]:
+        """All candidate blocks, best first, as (tier, seat numbers)."""
+        out: List[Tuple[Tuple, str, List[str]]] = []
+
+        def add(tier, seats):
+            if len(seats) == count and all(prefs.allows(self.seats[n]) for n in seats):
+                out.append((self._score(tier, seats, prefs), tier, seats))
+
+        def add_two_rows(a: List[str], b: List[str]):
+            # about half from each row, both taken from the same end so the columns line up
+            if a and b and len(a) + len(b) >= count:
+                take_a = min(len(a), max(count - len(b), -(-count // 2)))
+                add("adjacent_rows", a[:take_a] + b[:count - take_a])
+
+        # same row, same side: windows inside free runs long enough
+        for length, runs in self.runs_by_len.items():
+            if length < count:
+                continue
+            for _, _, run in runs:
+                for i in range(len(run) - count + 1):
+                    add("same_row_side", run[i:i + count])
+
+        # same row across the aisle: free seats nearest the aisle on both sides
+        row_free: Dict[RowKey, Dict[str, List[str]]] = {}
+        for key, sides in self.rows.items():
+            row_free[key] = {side: [s["seat_number"] for s in seats if s["seat_number"] in self.free]
+                             for side, seats in sides.items()}
+            left = list(reversed(row_free[key].get("left", [])))   # nearest the aisle first
+            right = row_free[key].get("right", [])
+            if left and right and len(left) + len(right) >= count:
+                for k in range(max(1, count - len(right)), min(len(left), count - 1) + 1):
+                    add("same_row", sorted(left[:k] + right[:count - k], key=self._position))
+
+        # two consecutive rows: same side first (columns aligned), then whole rows
+        for key in self.rows:
+            nxt = (key[0], key[1] + 1)
+            if nxt not in row_free:
+                continue
+            for side in ("left", "right"):
+                add_two_rows(row_free[key].get(side, []), row_free[nxt].get(side, []))
+            add_two_rows([n for side in ("left", "right") for n in row_free[key].get(side, [])],
+                         [n for side in ("left", "right") for n in row_free[nxt].get(side, [])])
+
+        if allow_split and not out:
+            ordered = sorted((n for n in self.free if prefs.allows(self.seats[n])), key=self._position)
+            for i in range(len(ordered) - count + 1):
+                add("split", ordered[i:i + count])
+
+        out.sort(key=lambda c: c[0])
+        seen, unique = set(), []
+        for _, tier, seats in out:
+            key = frozenset(seats)
+            if key not in seen:
+                seen.add(key)
+                unique.append((tier, seats))
+        return unique
+
+    def _position(self, n: str):
+        s = self.seats[n]
+        return (s.get("deck") or 1), s.get("row") or 0, 0 if s.get("side") == "left" else 1, s.get("col") or 0
+
+
+# bus id -> (built at, layout version, index)
+_indexes: Dict[str, Tuple[float, int, FreeSeatIndex]] = {}
+
+
+async def free_seat_index(bus: Dict[str, Any]) -> FreeSeatIndex:
+    bus_id = str(bus["_id"])
+    layout = await load_bus_layout(bus)
+    cached = _indexes.get(bus_id)
+    if cached and cached[1] == layout["version"] and time.monotonic() - cached[0] < settings.FREE_SEAT_INDEX_TTL_SECONDS:
+        return cached[2]
+    statuses = {}
+    async for s in seats_col.find({"bus_id": bus["_id"]}, {"_id": 0, "seat_number": 1, "status": 1}):
+        statuses[str(s.get("seat_number"))] = s.get("status", "available")
+    index = FreeSeatIndex(layout["payload"]["seats"], statuses)
+    _indexes[bus_id] = (time.monotonic(), layout["version"], index)
+    return index
+
+
+def invalidate_free_seat_index(bus_id=None):
+    """Drop one bus's index (all of them when bus_id is None)."""
+    if bus_id is None:
+        _indexes.clear()
+    else:
+        _indexes.pop(str(bus_id), None)
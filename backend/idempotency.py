@@ -0,0 +1,228 @@
+# idempotency.py
+"""
+Idempotency-Key support for the money/seat mutations (select, confirm, cancel booking, top-up request).
+
+A client that sends `Idempotency-Key: <uuid>` gets at most one execution per (user, key):
+- the first request claims the key in idempotency_keys (insert on _id) and runs normally; its
+  status, headers and body are stored on the key document (TTL index on expires_at)
+- a retry after that is answered from the stored response (Idempotent-Replayed: true) with one
+  indexed lookup
+- duplicates arriving while the first is still running wait for it: in this worker on an
+  asyncio future (single-flight), across workers by polling the key document
+- the same key with a different body is rejected with 422; 5xx, validation (422), conflict (409:
+  seats taken, booking being cancelled) and 429 (waiting room, rate limits) responses and crashes
+  release the key so the client can retry with it; a key left in progress by a dead worker is
+  taken over after IDEMPOTENCY_LOCK_SECONDS
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+from auth import decode_token
+from config import settings
+from db import idempotency_col
+from metrics import route_template
+
+IDEMPOTENT_ROUTES = {
+    ("POST", "/reservations/select/{bus_id}"),
+    ("POST", "/reservations/confirm/{reservation_id}"),
+    ("POST", "/users/bookings/{booking_id}/cancel"),
+    ("POST", "/users/request-topup"),
+}
+
+# (status, headers, body)
+StoredResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+# nothing was committed and a retry may succeed: release the key instead of storing these
+_RETRYABLE_STATUSES = {409, 422, 429}
+
+# set by outer middlewares on every response; never stored or replayed
+_VOLATILE_HEADERS = {b"server-timing", b"x-request-id", b"content-length"}
+
+
+async def ensure_idempotency_indexes():
+    await idempotency_col.create_index("expires_at", expireAfterSeconds=0)
+
+
+def _user_of(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return decode_token(token or scheme)
+    return None
+
+
+def _header(scope, wanted: bytes) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == wanted:
+            return value.decode("latin-1")
+    return None
+
+
+def _json_error(status: int, detail: str) -> StoredResponse:
+    return status, [(b"content-type", b"application/json")], json.dumps({"detail": detail}).encode()
+
+
+_REUSED = _json_error(422, "Idempotency-Key was already used with a different request")
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware; requests without an Idempotency-Key header pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+        key = _header(scope, b"idempotency-key")
+        if not key or (scope["method"], route_template(scope)) not in IDEMPOTENT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+        user_id = _user_of(scope)
+        if not user_id:
+            # unauthenticated: let the route answer 401
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(scope["method"].encode() + scope["path"].encode() + b"\0" + body).hexdigest()
+        doc_id = hashlib.sha256(f"{user_id}\0{key[:200]}".encode()).hexdigest()
+
+        while True:
+            waiting = self._inflight.get(doc_id)
+            if waiting is not None:
+                done = await asyncio.shield(waiting)
+                if done is None:
+                    continue   # the first execution failed and released the key: try to claim it
+                stored, first_fingerprint = done
+                if first_fingerprint != fingerprint:
+                    await self._send(send, _REUSED)
+                else:
+                    await self._send(send, stored, replayed=True)
+                return
+
+            kind, stored = await self._claim(doc_id, fingerprint)
+            if kind == "busy":
+                # another worker holds the key; wait for it to finish
+                kind, stored = await self._wait_elsewhere(doc_id)
+            if kind == "replay":
+                await self._send(send, stored, replayed=True)
+                return
+            if kind == "reject":
+                await self._send(send, stored)
+                return
+            if kind == "claimed":
+                break
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[doc_id] = future
+        result: Optional[StoredResponse] = None
+        try:
+            result = await self._execute(scope, body, send)
+        finally:
+            self._inflight.pop(doc_id, None)
+            if result is not None and result[0] < 500 and result[0] not in _RETRYABLE_STATUSES:
+                await idempotency_col.update_one({"_id": doc_id}, {"$set": {
+                    "state": "completed", "status": result[0],
+                    "headers": [[n.decode("latin-1"), v.decode("latin-1")] for n, v in result[1]],
+                    "body": Binary(result[2]), "completed_at": datetime.utcnow(),
+                }})
+                future.set_result((result, fingerprint))
+            else:
+                await idempotency_col.delete_one({"_id": doc_id, "state": "in_progress"})
+                future.set_result(None)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    async def _claim(self, doc_id: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """("claimed"|"busy"|"retry", None) or ("replay"|"reject", response to send)."""
+        now = datetime.utcnow()
+        try:
+            await idempotency_col.insert_one({
+                "_id": doc_id, "state": "in_progress", "fingerprint": fingerprint, "created_at": now,
+                "expires_at": now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+            })
+            return "claimed", None
+        except DuplicateKeyError:
+            pass
+        doc = await idempotency_col.find_one({"_id": doc_id})
+        if doc is None:
+            return "retry", None   # released between insert and read
+        if doc.get("fingerprint") != fingerprint:
+            return "reject", _REUSED
+        if doc.get("state") == "completed":
+            return "replay", self._stored(doc)
+        if doc["created_at"] < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS):
+            # abandoned by a crashed worker
+            await idempotency_col.delete_one({"_id": doc_id, "state": "in_progress", "created_at": doc["created_at"]})
+            return "retry", None
+        return "busy", None
+
+    async def _wait_elsewhere(self, doc_id: str) -> Tuple[str, Optional[StoredResponse]]:
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            doc = await idempotency_col.find_one({"_id": doc_id})
+            if doc is None:
+                return "retry", None   # released: claim it
+            if doc.get("state") == "completed":
+                return "replay", self._stored(doc)
+        return "reject", _json_error(409, "A request with this Idempotency-Key is still in progress")
+
+    @staticmethod
+    def _stored(doc) -> StoredResponse:
+        headers = [(n.encode("latin-1"), v.encode("latin-1")) for n, v in doc.get("headers", [])]
+        return doc["status"], headers, bytes(doc.get("body", b""))
+
+    async def _execute(self, scope, body: bytes, send) -> Optional[StoredResponse]:
+        """Run the route with the buffered body, streaming the response out while recording it."""
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        status = 500
+        headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+
+        async def send_wrapper(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(n, v) for n, v in message.get("headers", []) if n.lower() not in _VOLATILE_HEADERS]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        return status, headers, b"".join(chunks)
+
+    @staticmethod
+    async def _send(send, stored: StoredResponse, replayed: bool = False):
+        status, headers, body = stored
+        headers = list(headers) + [(b"content-length", str(len(body)).encode())]
+        if replayed:
+            headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
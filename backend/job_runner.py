@@ -0,0 +1,248 @@
+# job_runner.py
+"""
+Background job runner for multi-worker deployments.
+
+Every uvicorn worker starts the runner, but database jobs are not run by every worker:
+- "leader" jobs run only on the worker holding the leader lease
+- "sharded" jobs run on every live worker, each over its share of buses: buses and reservations
+  carry shard_key (a stable hash of the bus id) and a worker only queries the documents whose
+  shard_key modulo the number of live workers is its index (Shard.query)
+- "local" jobs run on every worker (refreshing in-memory caches)
+
+Coordination lives in MongoDB:
+- job_workers: one document per live worker, refreshed every JOB_HEARTBEAT_SECONDS and expiring
+  after JOB_LEASE_SECONDS; the sorted list of live workers gives each worker its shard
+- job_leases: the "leader" lease and one lease per job (per shard for sharded jobs). A job lease is
+  held for the duration of a run, so a slow run is never overlapped by the next interval on any
+  worker: it expires after JOB_LEASE_SECONDS and is renewed every JOB_HEARTBEAT_SECONDS while the
+  run goes on (up to the job's max_runtime), so a worker that dies mid-run blocks the job for
+  JOB_LEASE_SECONDS at most. It also records the last run's start, duration, lag and outcome.
+
+A leader that stops heartbeating (crash, blocked event loop) loses its lease after JOB_LEASE_SECONDS
+and another worker takes over. Schedules are jittered so workers do not hit the database in lockstep;
+lag (actual start vs scheduled time) and duration are exported per job on /metrics.
+
+With JOB_COORDINATION off (single worker) every job simply runs locally.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_SUBMITTED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import job_leases_col, job_workers_col
+from metrics import registry, timed_job
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+MODES = ("leader", "sharded", "local")
+
+job_lag = registry.histogram("scheduler_job_lag_seconds", "Delay between a job's scheduled and actual start", ("job",),
+                             buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+job_skipped = registry.counter("scheduler_job_skipped_total", "Job runs skipped (not leader, still running)", ("job", "reason"))
+
+
+def stable_hash(key: str) -> int:
+    """Process-independent hash (the builtin hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def shard_key(bus_id) -> int:
+    """Stored as shard_key on buses and reservations so that sharded jobs can select their share in the query."""
+    return stable_hash(str(bus_id)) % 2**31
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def owns(self, bus_id) -> bool:
+        return self.count <= 1 or shard_key(bus_id) % self.count == self.index
+
+    def query(self) -> Dict[str, Any]:
+        """Filter on shard_key for this shard's documents; documents without one belong to shard 0."""
+        if self.count <= 1:
+            return {}
+        mine = {"shard_key": {"$mod": [self.count, self.index]}}
+        return {"$or": [mine, {"shard_key": {"$exists": False}}]} if self.index == 0 else mine
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+ALL = Shard(0, 1)
+
+
+class _Job:
+    def __init__(self, name: str, fn: Callable, seconds: float, mode: str, jitter: float, max_runtime: float):
+        self.name = name
+        self.fn = fn
+        self.seconds = seconds
+        self.mode = mode
+        self.jitter = jitter
+        self.max_runtime = max_runtime
+        self.lag: Optional[float] = None
+
+
+class JobRunner:
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self.shard = ALL
+        self._jobs: Dict[str, _Job] = {}
+        self._sched: Optional[AsyncIOScheduler] = None
+
+    def add(self, name: str, fn: Callable, seconds: float, mode: str = "leader",
+            jitter: Optional[float] = None, max_runtime: Optional[float] = None):
+        """
+        Register a job. Sharded jobs are called with their Shard, the others without arguments.
+        jitter defaults to 10% of the interval, max_runtime (how long a run's lease is renewed) to 10x
+        the interval.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown job mode {mode!r}")
+        self._jobs[name] = _Job(name, fn, seconds, mode,
+                                seconds * 0.1 if jitter is None else jitter,
+                                seconds * 10 if max_runtime is None else max_runtime)
+
+    async def start(self):
+        self._sched = AsyncIOScheduler()
+        self._sched.add_listener(self._on_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MAX_INSTANCES)
+        if settings.JOB_COORDINATION:
+            await job_workers_col.create_index("expires_at", expireAfterSeconds=0)
+            await self.heartbeat()
+            self._sched.add_job(self.heartbeat, "interval", seconds=settings.JOB_HEARTBEAT_SECONDS, id="_heartbeat",
+                                max_instances=1, coalesce=True)
+        for job in self._jobs.values():
+            # max_instances=1: a run still going on this worker makes the next tick skip
+            self._sched.add_job(self._run, "interval", args=[job], seconds=job.seconds, jitter=job.jitter or None,
+                                id=job.name, max_instances=1, coalesce=True)
+        self._sched.start()
+        logger.info("job runner started", extra={"worker_id": self.worker_id, "leader": self.is_leader, "shard": str(self.shard)})
+
+    async def stop(self):
+        """Stop scheduling and give up this worker's leases so another worker takes over at once."""
+        if self._sched is not None:
+            self._sched.shutdown(wait=False)
+            self._sched = None
+        if settings.JOB_COORDINATION:
+            now = datetime.utcnow()
+            await job_leases_col.update_many({"owner": self.worker_id}, {"$set": {"expires_at": now}})
+            await job_workers_col.delete_one({"_id": self.worker_id})
+        self.is_leader = False
+
+    # --- coordination ---
+
+    async def _acquire(self, key: str, seconds: float, extra: Optional[Dict[str, Any]] = None) -> bool:
+        """Take (or renew) a lease unless another worker holds an unexpired one."""
+        now = datetime.utcnow()
+        try:
+            doc = await job_leases_col.find_one_and_update(
+                {"_id": key, "$or": [{"owner": self.worker_id}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.worker_id, "expires_at": now + timedelta(seconds=seconds), "heartbeat_at": now, **(extra or {})}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            return False   # the lease exists and is held by someone else
+        return doc is not None
+
+    async def heartbeat(self):
+        """Refresh this worker's presence, renew or contend for leadership and recompute the shard."""
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        try:
+            await job_workers_col.update_one({"_id": self.worker_id},
+                                             {"$set": {"heartbeat_at": now, "expires_at": now + ttl}}, upsert=True)
+            leader = await self._acquire(LEADER_LEASE, settings.JOB_LEASE_SECONDS)
+            workers: List[str] = sorted([w["_id"] async for w in job_workers_col.find({"expires_at": {"$gt": now}}, {"_id": 1})])
+        except Exception:
+            # cannot prove we still hold the lease: stand down until the next heartbeat succeeds
+            logger.exception("job runner heartbeat failed")
+            self.is_leader = False
+            return
+        if leader != self.is_leader:
+            logger.info("leadership %s", "acquired" if leader else "lost", extra={"worker_id": self.worker_id})
+        self.is_leader = leader
+        self.shard = Shard(workers.index(self.worker_id), len(workers)) if self.worker_id in workers else ALL
+
+    # --- running ---
+
+    def _on_event(self, event):
+        job = self._jobs.get(event.job_id)
+        if job is None:
+            return
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            job_skipped.inc(job=job.name, reason="still_running")
+            return
+        scheduled = event.scheduled_run_times[-1]
+        job.lag = max(0.0, (datetime.now(timezone.utc) - scheduled).total_seconds())
+        job_lag.observe(job.lag, job=job.name)
+
+    async def _run(self, job: _Job):
+        if not settings.JOB_COORDINATION or job.mode == "local":
+            await timed_job(job.name, job.fn if job.mode != "sharded" else lambda: job.fn(ALL))()
+            return
+        if job.mode == "leader" and not self.is_leader:
+            job_skipped.inc(job=job.name, reason="not_leader")
+            return
+
+        shard = self.shard if job.mode == "sharded" else ALL
+        key = f"job:{job.name}" if job.mode == "leader" else f"job:{job.name}:{shard}"
+        started = datetime.utcnow()
+        if not await self._acquire(key, settings.JOB_LEASE_SECONDS, {"last_started_at": started, "last_lag_seconds": job.lag}):
+            job_skipped.inc(job=job.name, reason="running_elsewhere")
+            return
+        renew = asyncio.ensure_future(self._keep_lease(key, started + timedelta(seconds=job.max_runtime)))
+        outcome = "ok"
+        try:
+            await timed_job(job.name, job.fn if job.mode == "leader" else lambda: job.fn(shard))()
+        except Exception:
+            outcome = "error"
+            logger.exception("job failed", extra={"job": job.name, "shard": str(shard)})
+        finally:
+            renew.cancel()
+            now = datetime.utcnow()
+            await job_leases_col.update_one({"_id": key, "owner": self.worker_id}, {"$set": {
+                "expires_at": now,
+                "last_duration_seconds": (now - started).total_seconds(),
+                "last_outcome": outcome,
+            }})
+
+    async def _keep_lease(self, key: str, until: datetime):
+        """Renew a running job's lease every heartbeat, until the job's max_runtime is reached."""
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+            now = datetime.utcnow()
+            if now >= until:
+                logger.warning("job past its max_runtime, lease left to expire", extra={"lease": key})
+                return
+            try:
+                await job_leases_col.update_one({"_id": key, "owner": self.worker_id}, {"$set": {
+                    "expires_at": min(until, now + timedelta(seconds=settings.JOB_LEASE_SECONDS)), "heartbeat_at": now}})
+            except Exception:
+                logger.exception("job lease renewal failed", extra={"lease": key})
+
+    async def status(self) -> Dict[str, Any]:
+        leases = await job_leases_col.find({}).sort("_id", 1).to_list(length=None) if settings.JOB_COORDINATION else []
+        workers = await job_workers_col.find({}).sort("_id", 1).to_list(length=None) if settings.JOB_COORDINATION else []
+        return {
+            "worker_id": self.worker_id,
+            "is_leader": self.is_leader,
+            "shard": str(self.shard),
+            "jobs": [{"name": j.name, "mode": j.mode, "interval_seconds": j.seconds, "last_lag_seconds": j.lag}
+                     for j in self._jobs.values()],
+            "workers": workers,
+            "leases": leases,
+        }
+
+
+job_runner = JobRunner()
+
+registry.gauge("scheduler_is_leader", "1 if this worker holds the job leader lease", fn=lambda: int(job_runner.is_leader))
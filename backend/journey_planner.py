@@ -0,0 +1,272 @@
+# journey_planner.py
+"""
+Multi-leg journey planner (connection scan).
+
+Every published bus is one connection (src city -> dst city, departure, arrival, fare). Connections
+are kept in memory sorted by departure; a query scans the departure window once, keeping per city
+and per number of legs used:
+- the earliest arrival label (earliest-arrival itinerary)
+- a Pareto set of (arrival, fare) labels (cheapest itinerary that is still time-feasible)
+A leg can only be taken if the previous leg arrives MIN_CONNECTION_MINUTES before it departs.
+Cities that cannot reach the destination in the remaining number of legs are skipped.
+
+The connection list is updated incrementally when buses are created, edited, finalized or deleted,
+and fully reloaded by the scheduler so other workers converge.
+"""
+import asyncio
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+from bson import ObjectId
+from config import settings
+from db import buses_col, routes_col
+from route_catalogue import normalize_city
+
+EPOCH = datetime(1970, 1, 1)
+NEVER = float("inf")
+
+
+def _ts(dt: datetime) -> float:
+    return (dt - EPOCH).total_seconds()
+
+
+class Connection(NamedTuple):
+    dep: float          # departure, epoch seconds (naive UTC like the stored datetimes)
+    arr: float          # arrival, epoch seconds
+    src: str            # normalized city
+    dst: str
+    fare: float
+    bus_id: str
+    opens: float        # sales_open_time, epoch seconds (0 when sales are always open)
+
+
+class Label(NamedTuple):
+    arr: float
+    fare: float
+    conn: Connection
+    prev: Optional["Label"]
+
+
+class JourneyPlanner:
+    def __init__(self):
+        self._conns: List[Connection] = []
+        self._by_bus: Dict[str, Connection] = {}
+        self._route_of_bus: Dict[str, Any] = {}
+        self._routes: Dict[Any, Tuple[str, str, Optional[int]]] = {}  # route id -> (src, dst, duration)
+        self._display: Dict[str, str] = {}  # normalized city -> display name
+        self._into: Dict[str, Dict[str, int]] = {}  # dst -> {src: connection count}, for reachability
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    # --- building ---
+
+    def add_connection(self, conn: Connection):
+        self.remove_bus(conn.bus_id)
+        insort(self._conns, conn)
+        self._by_bus[conn.bus_id] = conn
+        into = self._into.setdefault(conn.dst, {})
+        into[conn.src] = into.get(conn.src, 0) + 1
+
+    def remove_bus(self, bus_id):
+        bus_id = str(bus_id)
+        conn = self._by_bus.pop(bus_id, None)
+        self._route_of_bus.pop(bus_id, None)
+        if conn is None:
+            return
+        i = bisect_left(self._conns, conn)
+        if i < len(self._conns) and self._conns[i] == conn:
+            del self._conns[i]
+        into = self._into.get(conn.dst, {})
+        if into.get(conn.src, 0) <= 1:
+            into.pop(conn.src, None)
+        else:
+            into[conn.src] -= 1
+
+    def _connection_for(self, bus: Dict[str, Any]) -> Optional[Connection]:
+        route = self._routes.get(bus.get("route_id"))
+        start = bus.get("start_time")
+        if not route or not isinstance(start, datetime):
+            return None
+        src, dst, duration = route
+        arrival = bus.get("arrival_time")
+        if not isinstance(arrival, datetime) or arrival <= start:
+            arrival = start + timedelta(minutes=duration or settings.DEFAULT_TRIP_MINUTES)
+        opens = bus.get("sales_open_time")
+        fare = bus.get("current_price") or bus.get("price_per_seat") or 0.0
+        return Connection(_ts(start), _ts(arrival), normalize_city(src), normalize_city(dst), float(fare),
+                          str(bus["_id"]), _ts(opens) if isinstance(opens, datetime) else 0.0)
+
+    def add_bus(self, bus: Dict[str, Any]):
+        """Add or replace a bus; anything not published just drops out of the graph."""
+        if bus.get("status") != "published":
+            self.remove_bus(bus["_id"])
+            return
+        conn = self._connection_for(bus)
+        if conn is None:
+            self.remove_bus(bus["_id"])
+            return
+        self.add_connection(conn)
+        self._route_of_bus[conn.bus_id] = bus.get("route_id")
+
+    def _add_route(self, route: Dict[str, Any]):
+        src, dst = route.get("src_city") or "", route.get("dst_city") or ""
+        self._routes[route["_id"]] = (src, dst, route.get("duration_minutes"))
+        for city in (src, dst):
+            self._display.setdefault(normalize_city(city), city.strip())
+
+    async def load(self):
+        async with self._lock:
+            fresh = JourneyPlanner()
+            async for r in routes_col.find({}, {"src_city": 1, "dst_city": 1, "duration_minutes": 1}):
+                fresh._add_route(r)
+            projection = {"route_id": 1, "start_time": 1, "arrival_time": 1, "sales_open_time": 1,
+                          "price_per_seat": 1, "current_price": 1, "status": 1}
+            async for b in buses_col.find({"status": "published", "start_time": {"$gte": datetime.utcnow()}}, projection):
+                fresh.add_bus(b)
+            self._conns, self._by_bus, self._route_of_bus = fresh._conns, fresh._by_bus, fresh._route_of_bus
+            self._routes, self._display, self._into = fresh._routes, fresh._display, fresh._into
+            self._loaded = True
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    async def refresh_bus(self, bus_id):
+        """Re-read one bus (after create/update) and update its connection."""
+        if not self._loaded:
+            return
+        oid = ObjectId(bus_id) if not isinstance(bus_id, ObjectId) else bus_id
+        bus = await buses_col.find_one({"_id": oid})
+        if not bus:
+            self.remove_bus(oid)
+            return
+        if bus.get("route_id") not in self._routes:
+            route = await routes_col.find_one({"_id": bus.get("route_id")})
+            if route:
+                self._add_route(route)
+        self.add_bus(bus)
+
+    def remove_route(self, route_id):
+        self._routes.pop(route_id, None)
+        for bus_id in [b for b, r in self._route_of_bus.items() if r == route_id]:
+            self.remove_bus(bus_id)
+
+    # --- querying ---
+
+    def _reachability(self, dst: str, max_legs: int) -> List[Set[str]]:
+        """reach[j] = cities that can get to dst in at most j legs (reach[0] = {dst})."""
+        reach = [{dst}]
+        frontier = {dst}
+        for _ in range(max_legs):
+            nxt = set()
+            for city in frontier:
+                nxt.update(self._into.get(city, ()))
+            frontier = nxt - reach[-1]
+            reach.append(reach[-1] | nxt)
+        return reach
+
+    def plan(self, src: str, dst: str, depart_after: datetime, depart_before: Optional[datetime] = None,
+             max_transfers: int = 2, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Best itineraries from src to dst whose first leg departs in [depart_after, depart_before].
+        Returns {"earliest_arrival": itinerary|None, "cheapest": itinerary|None}.
+        """
+        origin, target = normalize_city(src), normalize_city(dst)
+        max_legs = max_transfers + 1
+        if not origin or not target or origin == target:
+            return {"earliest_arrival": None, "cheapest": None}
+
+        mct = settings.MIN_CONNECTION_MINUTES * 60
+        start = _ts(depart_after)
+        first_leg_limit = _ts(depart_before) if depart_before else NEVER
+        end = (first_leg_limit if depart_before else start) + settings.JOURNEY_HORIZON_HOURS * 3600
+        sales_now = _ts(now or datetime.utcnow())
+        reach = self._reachability(target, max_legs)
+
+        # earliest[k][city] and pareto[k][city] hold labels for itineraries of exactly k legs
+        earliest: List[Dict[str, Label]] = [dict() for _ in range(max_legs + 1)]
+        pareto: List[Dict[str, List[Label]]] = [dict() for _ in range(max_legs + 1)]
+
+        conns = self._conns
+        i = bisect_left(conns, (start,))
+        n = len(conns)
+        while i < n:
+            c = conns[i]
+            i += 1
+            if c.dep > end:
+                break
+            if c.opens > sales_now:
+                continue
+            for k in range(1, max_legs + 1):
+                if c.dst not in reach[max_legs - k]:
+                    continue
+                if k == 1:
+                    if c.src != origin or c.dep > first_leg_limit:
+                        continue
+                    ea_prev = None
+                    cheap_prev = None
+                else:
+                    ea_prev = earliest[k - 1].get(c.src)
+                    if ea_prev is None or ea_prev.arr + mct > c.dep:
+                        continue
+                    cheap_prev = None
+                    for lab in pareto[k - 1].get(c.src, ()):
+                        if lab.arr + mct <= c.dep and (cheap_prev is None or lab.fare < cheap_prev.fare):
+                            cheap_prev = lab
+                if c.dst == origin:
+                    continue
+
+                cur = earliest[k].get(c.dst)
+                if cur is None or c.arr < cur.arr:
+                    earliest[k][c.dst] = Label(c.arr, (ea_prev.fare if ea_prev else 0.0) + c.fare, c, ea_prev)
+
+                if k > 1 and cheap_prev is None:
+                    continue
+                fare = (cheap_prev.fare if cheap_prev else 0.0) + c.fare
+                labels = pareto[k].setdefault(c.dst, [])
+                if any(l.arr <= c.arr and l.fare <= fare for l in labels):
+                    continue
+                labels[:] = [l for l in labels if not (c.arr <= l.arr and fare <= l.fare)]
+                labels.append(Label(c.arr, fare, c, cheap_prev))
+
+        best_ea: Optional[Label] = None
+        best_cheap: Optional[Label] = None
+        for k in range(1, max_legs + 1):
+            lab = earliest[k].get(target)
+            if lab and (best_ea is None or lab.arr < best_ea.arr):
+                best_ea = lab
+            for lab in pareto[k].get(target, ()):
+                if best_cheap is None or (lab.fare, lab.arr) < (best_cheap.fare, best_cheap.arr):
+                    best_cheap = lab
+        return {"earliest_arrival": self._itinerary(best_ea), "cheapest": self._itinerary(best_cheap)}
+
+    def _itinerary(self, label: Optional[Label]) -> Optional[Dict[str, Any]]:
+        if label is None:
+            return None
+        legs = []
+        while label is not None:
+            c = label.conn
+            legs.append({
+                "bus_id": c.bus_id,
+                "from": self._display.get(c.src, c.src),
+                "to": self._display.get(c.dst, c.dst),
+                "departure": EPOCH + timedelta(seconds=c.dep),
+                "arrival": EPOCH + timedelta(seconds=c.arr),
+                "fare": c.fare,
+            })
+            label = label.prev
+        legs.reverse()
+        return {
+            "legs": legs,
+            "transfers": len(legs) - 1,
+            "departure": legs[0]["departure"],
+            "arrival": legs[-1]["arrival"],
+            "total_fare": round(sum(l["fare"] for l in legs), 2),
+        }
+
+
+journey_planner = JourneyPlanner()
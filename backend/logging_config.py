@@ -0,0 +1,135 @@
+# logging_config.py
+"""
+Structured, non-blocking logging.
+
+- every record is rendered as one JSON object per line (LOG_JSON=false for plain text)
+- the request path only enqueues records (QueueHandler); a QueueListener thread formats them and
+  does the stdout I/O, so logging never blocks the event loop
+- per-logger levels from LOG_LEVELS, e.g. "routers.buses_routes=DEBUG,query_trace=WARNING"
+- RequestIdMiddleware assigns a request id (or honours X-Request-ID), echoes it on the response and
+  stamps it on every record logged while handling the request
+- hot-path debug events are logged with extra={"sampled": True}; only LOG_DEBUG_SAMPLE_RATE of
+  them are kept
+
+Guard hot-path debug calls with logger.isEnabledFor(logging.DEBUG) so a disabled level costs one
+cached lookup and no formatting or I/O.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from config import settings
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sampled"}
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only `rate` of the DEBUG records flagged with extra={"sampled": True}."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not getattr(record, "sampled", False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+def _parse_levels(spec: str):
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, level = item.partition("=")
+        yield name.strip(), level.strip().upper()
+
+
+def setup_logging():
+    """Install the queue handler on the root logger and start the listener (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if settings.LOG_JSON:
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(q)
+    # filters run in the caller's thread/context, so the request id is captured before enqueueing
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(settings.LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in _parse_levels(settings.LOG_LEVELS):
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class RequestIdMiddleware:
+    """Pure ASGI middleware: binds a request id for the duration of the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rid = ""
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")[:64]
+                break
+        rid = rid or uuid.uuid4().hex
+        token = request_id_var.set(rid)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", rid.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,41 +1,97 @@
-
-# main.py
-import uvicorn
-from fastapi import FastAPI
-from routers import auth_routes, buses_routes, reservations_routes, admin_routes, users_routes, admin_topups 
-from background_tasks import start_scheduler
-from fastapi.middleware.cors import CORSMiddleware
-
-app = FastAPI(title="Bus Booking System")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# include routers
-app.include_router(auth_routes.router)
-app.include_router(users_routes.router)               # <- ADDED
-app.include_router(buses_routes.router)
-app.include_router(reservations_routes.router)
-app.include_router(admin_routes.router)
-app.include_router(admin_topups.router)
-
-@app.on_event("startup")
-async def startup_event():
-    # start background scheduler
-    start_scheduler()
-
-@app.get("/")
-async def root():
-    return {"message": "Bus booking backend running"}
-
-# debug: list installed routes
-@app.get("/__routes")
-def list_routes():
-    return [{"path": r.path, "methods": list(getattr(r, "methods", [])), "name": getattr(r.endpoint, "__name__", str(r.endpoint))} for r in app.routes if hasattr(r, "path")]
-
-if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+
+# main.py
+import uvicorn
+from fastapi import FastAPI
+from routers import auth_routes, buses_routes, reservations_routes, admin_routes, users_routes, admin_topups, seatmap_routes, routes_routes, waitlist_routes, tickets_routes, bookings_routes
+from background_tasks import start_scheduler, stop_scheduler
+from route_catalogue import route_catalogue
+from journey_planner import journey_planner
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from metrics import MetricsMiddleware, registry
+from query_tracer import QueryTraceMiddleware
+from logging_config import setup_logging, RequestIdMiddleware
+from admission import ensure_admission_indexes
+from idempotency import IdempotencyMiddleware, ensure_idempotency_indexes
+from waitlist import ensure_waitlist_indexes
+from archive import ensure_archive_indexes
+from purge import ensure_purge_indexes
+from cancellations import ensure_cancellation_indexes
+from ticket_renderer import ensure_ticket_render_indexes, ticket_renderer
+from rate_limit import ensure_rate_limit_indexes
+from event_bus import event_bus
+import cache_events
+from config import settings
+
+setup_logging()
+
+app = FastAPI(title="Bus Booking System")
+
+# innermost: stored/replayed responses exclude headers the outer middlewares add per request
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Request-ID", "Server-Timing"],
+)
+app.add_middleware(QueryTraceMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)   # outermost: every log line of the request carries its id
+
+# include routers
+app.include_router(auth_routes.router)
+app.include_router(users_routes.router)               # <- ADDED
+app.include_router(buses_routes.router)
+app.include_router(seatmap_routes.router)
+app.include_router(routes_routes.router)
+app.include_router(reservations_routes.router)
+app.include_router(waitlist_routes.router)
+app.include_router(tickets_routes.router)
+app.include_router(bookings_routes.router)
+app.include_router(admin_routes.router)
+app.include_router(admin_topups.router)
+
+@app.on_event("startup")
+async def startup_event():
+    # warm the in-memory route catalogue used by search and autocomplete
+    await route_catalogue.load()
+    await journey_planner.load()
+    # caches follow writes from every worker through the event bus (change streams when available)
+    cache_events.register()
+    await event_bus.start()
+    await ensure_idempotency_indexes()
+    await ensure_waitlist_indexes()
+    await ensure_archive_indexes()
+    await ensure_purge_indexes()
+    await ensure_cancellation_indexes()
+    await ensure_ticket_render_indexes()
+    await ensure_rate_limit_indexes()
+    if settings.ADMISSION_STORE == "mongo":
+        await ensure_admission_indexes()
+    # start background jobs (leader election / work split across workers, see job_runner.py)
+    await start_scheduler()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # hand leadership and job leases over immediately instead of waiting for them to expire
+    await stop_scheduler()
+    await event_bus.stop()
+    ticket_renderer.shutdown()
+
+@app.get("/")
+async def root():
+    return {"message": "Bus booking backend running"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# debug: list installed routes
+@app.get("/__routes")
+def list_routes():
+    return [{"path": r.path, "methods": list(getattr(r, "methods", [])), "name": getattr(r.endpoint, "__name__", str(r.endpoint))} for r in app.routes if hasattr(r, "path")]
+
+if __name__ == "__main__":
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,274 @@
+# metrics.py
+"""
+Prometheus-style metrics without an external dependency.
+
+- Counter / Gauge / Histogram with label sets, rendered in the Prometheus text format at /metrics
+- MetricsMiddleware: per-route latency histogram and status-code counter (labels use the route
+  template, e.g. /buses/{bus_id}, never the raw path)
+- MongoMetricsListener: pymongo command listener recording per-collection/per-command counts and
+  durations; registered on the Motor client in db.py
+
+Metric updates may come from Motor's executor threads, so every metric guards its state with a lock.
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from pymongo import monitoring
+from starlette.routing import Match
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A gauge set explicitly, or computed at scrape time when `fn` is given."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        if self._fn is not None:
+            return self.header() + [f"{self.name} {float(self._fn())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = self.header()
+        for key, row in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += row[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {row[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+http_requests_total = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+
+# --- MongoDB ---
+mongo_commands_total = registry.counter("mongo_commands_total", "MongoDB commands by collection, command and outcome", ("collection", "command", "outcome"))
+mongo_command_duration = registry.histogram("mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command"))
+
+# --- seat locks ---
+seat_lock_contention_total = registry.counter("seat_lock_contention_total", "Seat selections rejected because a seat was already locked")
+
+# --- scheduler ---
+scheduler_job_runs_total = registry.counter("scheduler_job_runs_total", "Background job runs by outcome", ("job", "outcome"))
+scheduler_job_duration = registry.histogram("scheduler_job_duration_seconds", "Background job run duration", ("job",),
+                                            buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0))
+scheduler_job_backlog = registry.gauge("scheduler_job_backlog", "Items processed by the last run of a job", ("job",))
+
+# --- email ---
+email_queue_depth = registry.gauge("email_queue_depth", "Emails scheduled but not yet sent")
+email_queue_depth.set(0)
+emails_sent_total = registry.counter("emails_sent_total", "Email send attempts by outcome", ("outcome",))
+
+
+def timed_job(name: str, fn):
+    """Wrap a scheduler job: records duration and outcome; an int return value is the job's backlog."""
+    async def run():
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            processed = await fn()
+            if isinstance(processed, int):
+                scheduler_job_backlog.set(processed, job=name)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            scheduler_job_duration.observe(time.perf_counter() - started, job=name)
+            scheduler_job_runs_total.inc(job=name, outcome=outcome)
+    run.__name__ = fn.__name__
+    return run
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handles this request ("unmatched" when none does)."""
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: records latency and status for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = route_template(scope)
+            method = scope.get("method", "")
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_requests_total.inc(method=method, route=route, status=str(status["code"]))
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    def __init__(self):
+        self._inflight: Dict[Tuple[int, int], Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collection(event) -> str:
+        name = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        return name if isinstance(name, str) else "-"
+
+    def started(self, event):
+        with self._lock:
+            self._inflight[(event.request_id, event.operation_id)] = (self._collection(event), event.command_name)
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection, command = self._inflight.pop((event.request_id, event.operation_id), ("-", event.command_name))
+        mongo_commands_total.inc(collection=collection, command=command, outcome=outcome)
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=command)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+mongo_metrics_listener = MongoMetricsListener()
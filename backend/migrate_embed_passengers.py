@@ -0,0 +1,78 @@
+# migrate_embed_passengers.py
+"""
+One-off migration: embed passengers in their booking documents.
+
+1. backfill: bookings without a passengers array get passengers + seat_numbers from the
+   passengers collection (BATCH bookings per read and bulk write; rerunnable, done bookings are skipped)
+2. the passengers collection is renamed to passengers_legacy (kept as a backup)
+3. a read-only view named passengers replaces it, unwinding bookings.passengers into the old
+   document shape (booking_id, seat_number, passenger_name/email/mobile) for reports and tools
+   that still read passengers
+
+    MONGO_URI=mongodb://localhost:27017 DB_NAME=bus_booking python migrate_embed_passengers.py
+"""
+from pymongo import MongoClient, UpdateOne
+import os
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "bus_booking")
+BATCH = int(os.getenv("BATCH", "1000"))
+
+PASSENGER_FIELDS = ("seat_number", "passenger_name", "passenger_email", "passenger_mobile")
+VIEW_PIPELINE = [
+    {"$unwind": "$passengers"},
+    {"$project": {
+        "_id": 0,
+        "booking_id": "$_id",
+        "bus_id": 1,
+        "seat_number": "$passengers.seat_number",
+        "passenger_name": "$passengers.passenger_name",
+        "passenger_email": "$passengers.passenger_email",
+        "passenger_mobile": "$passengers.passenger_mobile",
+        "created_at": 1,
+    }},
+]
+
+client = MongoClient(MONGO_URI)
+db = client[DB_NAME]
+names = db.list_collection_names()
+source = "passengers_legacy" if "passengers_legacy" in names else "passengers"
+info = next(iter(db.list_collections(filter={"name": "passengers"})), None)
+if info is not None and info.get("type") == "view":
+    source = "passengers_legacy"   # an earlier run already swapped in the view
+
+
+def backfill(booking_ids):
+    """Embed the passengers of one batch of bookings: one passengers read, one bulk write."""
+    keys = booking_ids + [str(i) for i in booking_ids]
+    by_booking = {}
+    for p in db[source].find({"booking_id": {"$in": keys}}).sort("seat_number", 1):
+        by_booking.setdefault(str(p["booking_id"]), []).append({k: p.get(k) for k in PASSENGER_FIELDS})
+    ops = []
+    for booking_id in booking_ids:
+        passengers = by_booking.get(str(booking_id), [])
+        ops.append(UpdateOne({"_id": booking_id, "passengers": {"$exists": False}}, {"$set": {
+            "passengers": passengers,
+            "seat_numbers": [p["seat_number"] for p in passengers if p.get("seat_number")],
+        }}))
+    return db.bookings.bulk_write(ops, ordered=False).modified_count if ops else 0
+
+
+# 1. backfill
+updated = 0
+batch = []
+for booking in db.bookings.find({"passengers": {"$exists": False}}, {"_id": 1}):
+    batch.append(booking["_id"])
+    if len(batch) >= BATCH:
+        updated += backfill(batch)
+        batch = []
+updated += backfill(batch)
+print("Bookings backfilled:", updated)
+
+# 2 + 3. swap the collection for the compatibility view
+if source == "passengers" and "passengers" in names:
+    db.passengers.rename("passengers_legacy")
+    print("Renamed passengers -> passengers_legacy")
+if info is None or info.get("type") != "view":
+    db.command("create", "passengers", viewOn="bookings", pipeline=VIEW_PIPELINE)
+    print("Created view passengers on bookings")
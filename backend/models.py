@@ -1,96 +1,131 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional
-from datetime import datetime
-from bson import ObjectId
-
-# Utility for ObjectId
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid ObjectId")
-        return ObjectId(v)
-    @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
-
-# User models
-class UserCreate(BaseModel):
-    name: str
-    email: EmailStr
-    password: str
-    mobile: str
-
-class UserPublic(BaseModel):
-    id: PyObjectId = Field(..., alias="_id")
-    name: str
-    email: EmailStr
-    mobile: str
-    balance: float
-    created_at: datetime
-
-    class Config:
-        json_encoders = {ObjectId: str}
-        allow_population_by_field_name = True
-
-# Auth token
-class Token(BaseModel):
-    access_token: str
-    token_type: str = "bearer"
-
-# Route & bus
-class RouteCreate(BaseModel):
-    src_city: str
-    dst_city: str
-
-class BusCreate(BaseModel):
-    route_id: str
-    name: str
-    start_time: datetime
-    seats_count: int
-    price_per_seat: float
-    sales_open_time: Optional[datetime] = None
-    status: Optional[str] = "published"
-
-class BusPublic(BaseModel):
-    id: PyObjectId = Field(..., alias="_id")
-    route_id: str
-    name: str
-    start_time: datetime
-    seats_count: int
-    price_per_seat: float
-    sales_open_time: Optional[datetime]
-    status: str
-
-    class Config:
-        json_encoders = {ObjectId: str}
-        allow_population_by_field_name = True
-
-# Seat selection and reservation
-class SeatSelectionRequest(BaseModel):
-    seat_numbers: List[str]
-
-class ReservationResponse(BaseModel):
-    id: PyObjectId = Field(..., alias="_id")
-    user_id: str
-    bus_id: str
-    seat_numbers: List[str]
-    total_price: float
-    status: str
-    expires_at: datetime
-
-    class Config:
-        json_encoders = {ObjectId: str}
-        allow_population_by_field_name = True
-
-class PassengerInfo(BaseModel):
-    seat_number: str
-    name: str
-    email: EmailStr
-    mobile: str
-
-class ConfirmRequest(BaseModel):
-    passengers: List[PassengerInfo]
+from pydantic import BaseModel, EmailStr, Field, conint
+from typing import List, Optional
+from datetime import datetime
+from bson import ObjectId
+
+# Utility for ObjectId
+class PyObjectId(ObjectId):
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+    @classmethod
+    def validate(cls, v):
+        if not ObjectId.is_valid(v):
+            raise ValueError("Invalid ObjectId")
+        return ObjectId(v)
+    @classmethod
+    def __modify_schema__(cls, field_schema):
+        field_schema.update(type="string")
+
+# User models
+class UserCreate(BaseModel):
+    name: str
+    email: EmailStr
+    password: str
+    mobile: str
+
+class UserPublic(BaseModel):
+    id: PyObjectId = Field(..., alias="_id")
+    name: str
+    email: EmailStr
+    mobile: str
+    balance: float
+    created_at: datetime
+
+    class Config:
+        json_encoders = {ObjectId: str}
+        allow_population_by_field_name = True
+
+# Auth token
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+# Route & bus
+class RouteCreate(BaseModel):
+    src_city: str
+    dst_city: str
+    duration_minutes: Optional[int] = None  # typical travel time, used when a bus has no arrival_time
+
+MAX_BUS_SEATS = 100  # upper bound for seats_count; built-in layouts are cached per size
+
+class BusCreate(BaseModel):
+    route_id: str
+    name: str
+    start_time: datetime
+    seats_count: conint(ge=1, le=MAX_BUS_SEATS)
+    price_per_seat: float
+    sales_open_time: Optional[datetime] = None
+    status: Optional[str] = "published"
+    layout: Optional[str] = "2+2"
+    arrival_time: Optional[datetime] = None
+
+class BusPublic(BaseModel):
+    id: PyObjectId = Field(..., alias="_id")
+    route_id: str
+    name: str
+    start_time: datetime
+    seats_count: int
+    price_per_seat: float
+    sales_open_time: Optional[datetime]
+    status: str
+    layout: Optional[str] = "2+2"
+
+    class Config:
+        json_encoders = {ObjectId: str}
+        allow_population_by_field_name = True
+
+# Seat layout templates: one list of row strings per deck, e.g. ["SS|SS", "SS|S."]
+class SeatLayoutCreate(BaseModel):
+    name: str
+    decks: List[List[str]]
+
+# Seat selection and reservation
+class SeatSelectionRequest(BaseModel):
+    seat_numbers: List[str]
+
+class GroupAllocationRequest(BaseModel):
+    count: int = Field(..., ge=1, le=10)
+    prefer_window: bool = False
+    side: Optional[str] = Field(None, regex="^(left|right)$")
+    row_min: Optional[int] = None
+    row_max: Optional[int] = None
+    deck: Optional[int] = None
+    allow_split: bool = False     # fall back to the closest free seats when no block fits
+
+class WaitlistJoinRequest(BaseModel):
+    count: int = Field(..., ge=1, le=10)
+
+class ReservationResponse(BaseModel):
+    id: PyObjectId = Field(..., alias="_id")
+    user_id: str
+    bus_id: str
+    seat_numbers: List[str]
+    total_price: float
+    status: str
+    expires_at: datetime
+
+    class Config:
+        json_encoders = {ObjectId: str}
+        allow_population_by_field_name = True
+
+class PassengerInfo(BaseModel):
+    seat_number: str
+    name: str
+    email: EmailStr
+    mobile: str
+
+class ConfirmRequest(BaseModel):
+    passengers: List[PassengerInfo]
+
+class TicketVerifyRequest(BaseModel):
+    token: str                                 # ticket token or QR payload
+    bus_id: Optional[str] = None
+
+class CheckinItem(BaseModel):
+    token: str
+    seat_number: Optional[str] = None          # None: every seat on the ticket
+    checked_in_at: Optional[datetime] = None   # device time of the scan; defaults to upload time
+
+class CheckinSyncRequest(BaseModel):
+    checkins: List[CheckinItem] = Field(..., max_items=5000)
@@ -0,0 +1,152 @@
+# pricing.py
+"""
+Demand-based seat pricing.
+
+The price of a seat on a bus is its base fare (price_per_seat) times four demand factors:
+- occupancy: share of seats reserved or booked; fuller buses cost more (1 + OCC_WEIGHT * occ^2)
+- time to departure: early-bird discount far out, a last-minute premium close in (piecewise linear)
+- day of week of the departure (DOW_FACTORS, Monday first)
+- historical load factor of the route: average final occupancy of its finalized buses over the
+  last PRICING_HISTORY_DAYS (neutral when there is no history)
+clipped to [PRICING_MIN_MULTIPLIER, PRICING_MAX_MULTIPLIER] x base and rounded to PRICING_ROUNDING.
+
+reprice_buses() runs on the scheduler: it loads every published, not yet departed bus, reads
+occupancy for all of them with one aggregation, computes all prices at once with NumPy and writes
+back only the buses whose price changed, bumping their price_version. select_seats quotes the
+cached current_price into the reservation; confirm charges the quoted total.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from config import settings
+from db import buses_col, seats_col
+from archive import ARCHIVE_BUSES
+from event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+DOW_FACTORS = np.array([1.0, 0.95, 0.95, 1.0, 1.1, 1.15, 1.05])   # Monday .. Sunday
+OCC_WEIGHT = 0.6
+HIST_WEIGHT = 0.4
+NEUTRAL_LOAD_FACTOR = 0.7
+# hours to departure -> multiplier, interpolated linearly between the points
+TIME_CURVE_HOURS = np.array([0.0, 24.0, 72.0, 14 * 24.0, 30 * 24.0])
+TIME_CURVE_FACTORS = np.array([1.2, 1.1, 1.0, 0.95, 0.9])
+
+
+def compute_prices(base: np.ndarray, occupancy: np.ndarray, hours_to_departure: np.ndarray,
+                   day_of_week: np.ndarray, load_factor: np.ndarray) -> np.ndarray:
+    """Vectorized price per seat for many buses; all inputs are equal-length 1-D arrays."""
+    occ = np.clip(occupancy, 0.0, 1.0)
+    factor = (1.0 + OCC_WEIGHT * occ * occ)
+    factor *= np.interp(hours_to_departure, TIME_CURVE_HOURS, TIME_CURVE_FACTORS)
+    factor *= DOW_FACTORS[day_of_week]
+    factor *= 1.0 + HIST_WEIGHT * (np.nan_to_num(load_factor, nan=NEUTRAL_LOAD_FACTOR) - NEUTRAL_LOAD_FACTOR)
+    factor = np.clip(factor, settings.PRICING_MIN_MULTIPLIER, settings.PRICING_MAX_MULTIPLIER)
+    step = settings.PRICING_ROUNDING
+    return np.round(base * factor / step) * step
+
+
+def base_fare_update(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Update document for an admin edit of a bus. A new price_per_seat drops the cached current_price
+    (it was derived from the old fare) and bumps price_version, so quotes use the new base fare until
+    the next repricing, or for good while PRICING_ENABLED is off.
+    """
+    update: Dict[str, Any] = {"$set": fields}
+    if "price_per_seat" in fields:
+        update["$inc"] = {"price_version": 1}
+        if "current_price" not in fields:
+            update["$unset"] = {"current_price": ""}
+    return update
+
+
+def quote(bus: Dict[str, Any]) -> Dict[str, Any]:
+    """The cached price of a bus as quoted into a reservation (base fare until the first repricing)."""
+    price = bus.get("current_price")
+    if price is None:
+        price = bus.get("price_per_seat", 0.0)
+    return {"price_per_seat": float(price or 0.0), "price_version": int(bus.get("price_version", 0))}
+
+
+async def _occupancy(bus_ids: List[Any]) -> Dict[Any, float]:
+    # seats created by older code carry the bus id as a string; fold both forms into the ObjectId
+    pipeline = [
+        {"$match": {"bus_id": {"$in": bus_ids + [str(b) for b in bus_ids]}}},
+        {"$group": {
+            "_id": "$bus_id",
+            "total": {"$sum": 1},
+            "taken": {"$sum": {"$cond": [{"$eq": ["$status", "available"]}, 0, 1]}},
+        }},
+    ]
+    counts: Dict[Any, List[int]] = {}
+    async for row in seats_col.aggregate(pipeline):
+        key = ObjectId(row["_id"]) if isinstance(row["_id"], str) and ObjectId.is_valid(row["_id"]) else row["_id"]
+        taken, total = counts.setdefault(key, [0, 0])
+        counts[key] = [taken + row["taken"], total + row["total"]]
+    return {key: taken / total if total else 0.0 for key, (taken, total) in counts.items()}
+
+
+async def _route_load_factors(now: datetime) -> Dict[Any, float]:
+    match = {"status": "finalized", "load_factor": {"$ne": None},
+             "start_time": {"$gte": now - timedelta(days=settings.PRICING_HISTORY_DAYS)}}
+    pipeline = [
+        {"$match": match},
+        # buses past ARCHIVE_GRACE_DAYS live on as the bus field of their archive summary; match on
+        # the prefixed fields first so the (bus.status, bus.start_time) index applies
+        {"$unionWith": {"coll": ARCHIVE_BUSES, "pipeline": [
+            {"$match": {f"bus.{field}": cond for field, cond in match.items()}},
+            {"$replaceRoot": {"newRoot": "$bus"}},
+        ]}},
+        {"$group": {"_id": "$route_id", "load_factor": {"$avg": "$load_factor"}}},
+    ]
+    return {row["_id"]: row["load_factor"] async for row in buses_col.aggregate(pipeline)}
+
+
+async def reprice_buses(now: Optional[datetime] = None) -> int:
+    """Reprice all published future departures; returns the number of buses whose price changed."""
+    now = now or datetime.utcnow()
+    projection = {"price_per_seat": 1, "start_time": 1, "route_id": 1, "current_price": 1}
+    buses = await buses_col.find({"status": "published", "start_time": {"$gt": now}}, projection).to_list(length=None)
+    buses = [b for b in buses if isinstance(b.get("start_time"), datetime)]
+    if not buses:
+        return 0
+
+    occupancy = await _occupancy([b["_id"] for b in buses])
+    history = await _route_load_factors(now)
+
+    base = np.fromiter((float(b.get("price_per_seat") or 0.0) for b in buses), dtype=float, count=len(buses))
+    occ = np.fromiter((occupancy.get(b["_id"], 0.0) for b in buses), dtype=float, count=len(buses))
+    hours = np.fromiter(((b["start_time"] - now).total_seconds() / 3600.0 for b in buses), dtype=float, count=len(buses))
+    dow = np.fromiter((b["start_time"].weekday() for b in buses), dtype=np.int64, count=len(buses))
+    hist = np.fromiter((history.get(b.get("route_id"), np.nan) for b in buses), dtype=float, count=len(buses))
+    prices = compute_prices(base, occ, hours, dow, hist)
+
+    current = np.fromiter((b.get("current_price") if b.get("current_price") is not None else np.nan for b in buses),
+                          dtype=float, count=len(buses))
+    changed = np.flatnonzero(~np.isclose(prices, current))
+    if not len(changed):
+        return 0
+    writes = [
+        UpdateOne({"_id": buses[i]["_id"]},
+                  {"$set": {"current_price": float(prices[i]), "priced_at": now}, "$inc": {"price_version": 1}})
+        for i in changed
+    ]
+    await buses_col.bulk_write(writes, ordered=False)
+    for i in changed:
+        event_bus.emit("buses", "update", buses[i]["_id"], buses[i]["_id"], ("current_price", "price_version"))
+    logger.info("repriced buses", extra={"buses": len(buses), "changed": len(writes)})
+    return len(writes)
+
+
+async def record_load_factor(bus: Dict[str, Any]):
+    """Store the final occupancy of a departing bus; feeds the route's historical load factor."""
+    total = int(bus.get("seats_count") or 0) or await seats_col.count_documents({"bus_id": bus["_id"]})
+    if not total:
+        return
+    booked = await seats_col.count_documents({"bus_id": bus["_id"], "status": "booked"})
+    await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"load_factor": booked / total}})
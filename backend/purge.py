@@ -0,0 +1,209 @@
+# purge.py
+"""
+Background cascade deletes for buses and routes.
+
+DELETE /admin/buses/{id} and DELETE /admin/routes/{id} take the bus (the route's buses) off sale at
+once (withdraw: status "deleting", so search, select and confirm refuse it), delete the route document
+and queue a purge job in purge_jobs. The "purge" scheduler job works through queued jobs on the leader:
+- bus: the bus document, passenger documents of its bookings (live or archived; from passengers or
+  passengers_legacy, whichever is still a collection), waitlist entries, reservations, bookings, seats,
+  transactions (by bus_id; those written before they carried bus_id name the bus in their description
+  and are looked up once per bus) and any archived copy (archive.py), each in batches of
+  PURGE_BATCH_SIZE with PURGE_BATCH_PAUSE_SECONDS between batches so a large delete never saturates MongoDB
+- route: every bus of the route (matched by ObjectId or string route_id), each purged as above
+
+A bus or route is only deleted while none of its departures that have not run yet has bookings
+that are not fully cancelled (live_bookings): paid bookings are cancelled and refunded through
+POST /admin/buses/{id}/cancel first, never silently deleted. The purge job checks again before it
+deletes a bus (a confirm may have been in flight during the withdrawal); if it finds live bookings
+it puts the withdrawn buses back on sale and fails with the reason.
+
+Progress (documents deleted per collection, buses done) is $inc'ed on the job document after every
+batch and exposed at GET /admin/purge-jobs. A run stops after PURGE_RUN_SECONDS and the next run
+continues where it stopped; every step deletes by filter, so repeating a batch is harmless.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+from bson import ObjectId
+from config import settings
+from db import (archive_bookings_col, archive_buses_col, bookings_col, buses_col, passenger_collections,
+                purge_jobs_col, reservations_col, seats_col, transactions_col, waitlist_col)
+from event_bus import event_bus
+from journey_planner import journey_planner
+
+logger = logging.getLogger(__name__)
+
+DELETING = "deleting"
+
+# dependents of a bus holding its id in bus_id, purged in this order: (name, collection)
+BUS_DEPENDENTS = (
+    ("waitlist", waitlist_col),
+    ("reservations", reservations_col),
+    ("bookings", bookings_col),
+    ("seats", seats_col),
+    ("transactions", transactions_col),
+    ("archive_bookings", archive_bookings_col),
+)
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class _LiveBookings(Exception):
+    pass
+
+
+def _id_keys(oid: ObjectId) -> Dict[str, Any]:
+    # ids are stored as ObjectId or string depending on the writer: match both
+    return {"$in": [oid, str(oid)]}
+
+
+async def live_bookings(bus_filter: Dict[str, Any]) -> int:
+    """Bookings not (yet) cancelled on the matching buses that have not departed (finalized)."""
+    ids = [b["_id"] async for b in buses_col.find({**bus_filter, "status": {"$ne": "finalized"}}, {"_id": 1})]
+    if not ids:
+        return 0
+    return await bookings_col.count_documents({"bus_id": {"$in": ids + [str(i) for i in ids]},
+                                               "status": {"$ne": "cancelled"}})
+
+
+async def withdraw(bus_filter: Dict[str, Any]):
+    """Take the matching buses off sale ahead of a delete; their status is kept for restore()."""
+    for status in await buses_col.distinct("status", {**bus_filter, "status": {"$nin": ["finalized", DELETING]}}):
+        await buses_col.update_many({**bus_filter, "status": status},
+                                    {"$set": {"status": DELETING, "status_before_delete": status}})
+    async for bus in buses_col.find({**bus_filter, "status": DELETING}, {"_id": 1}):
+        _forget_bus(bus["_id"])
+
+
+async def restore(bus_filter: Dict[str, Any]):
+    """Undo withdraw() for the matching buses that are still waiting to be deleted."""
+    for status in await buses_col.distinct("status_before_delete", {**bus_filter, "status": DELETING}):
+        await buses_col.update_many({**bus_filter, "status": DELETING, "status_before_delete": status},
+                                    {"$set": {"status": status}, "$unset": {"status_before_delete": ""}})
+    async for bus in buses_col.find(bus_filter, {"_id": 1}):
+        event_bus.emit("buses", "update", bus["_id"], bus["_id"], ("status",))
+        await journey_planner.refresh_bus(bus["_id"])
+
+
+async def enqueue(kind: str, target_id: ObjectId) -> Dict[str, Any]:
+    """Queue a purge of a bus or route whose document has already been deleted."""
+    now = datetime.utcnow()
+    doc = {"kind": kind, "target_id": target_id, "status": "queued", "progress": {}, "created_at": now, "updated_at": now}
+    res = await purge_jobs_col.insert_one(doc)
+    doc["_id"] = res.inserted_id
+    return doc
+
+
+def _forget_bus(bus_id: ObjectId):
+    event_bus.emit("buses", "delete", bus_id, bus_id)
+    journey_planner.remove_bus(bus_id)
+
+
+class Purger:
+    def __init__(self):
+        self._deadline = 0.0
+
+    async def _progress(self, job_id: ObjectId, key: str, n: int):
+        await purge_jobs_col.update_one({"_id": job_id}, {"$inc": {f"progress.{key}": n},
+                                                          "$set": {"updated_at": datetime.utcnow()}})
+
+    async def _pause(self):
+        if time.monotonic() >= self._deadline:
+            raise _OutOfTime()
+        await asyncio.sleep(settings.PURGE_BATCH_PAUSE_SECONDS)
+
+    async def _purge_collection(self, job_id: ObjectId, name: str, col, query: Dict[str, Any]):
+        while True:
+            ids = [d["_id"] async for d in col.find(query, {"_id": 1}).limit(settings.PURGE_BATCH_SIZE)]
+            if not ids:
+                return
+            res = await col.delete_many({"_id": {"$in": ids}})
+            await self._progress(job_id, name, res.deleted_count)
+            await self._pause()
+
+    async def _purge_passengers(self, job_id: ObjectId, keys: Dict[str, Any]):
+        # passengers written before migrate_embed_passengers.py only carry the booking id
+        booking_ids = [b["_id"] async for b in bookings_col.find({"bus_id": keys}, {"_id": 1})]
+        booking_ids += [b["_id"] async for b in archive_bookings_col.find({"bus_id": keys}, {"_id": 1})]
+        if not booking_ids:
+            return
+        query = {"booking_id": {"$in": booking_ids + [str(i) for i in booking_ids]}}
+        for col in await passenger_collections():
+            await self._purge_collection(job_id, "passengers", col, query)
+
+    async def _purge_bus(self, job_id: ObjectId, bus_id: ObjectId):
+        live = await live_bookings({"_id": bus_id})
+        if live:
+            raise _LiveBookings(f"bus {bus_id} has {live} live bookings; cancel the departure first")
+        if (await buses_col.delete_one({"_id": bus_id})).deleted_count:
+            _forget_bus(bus_id)
+        keys = _id_keys(bus_id)
+        await self._purge_passengers(job_id, keys)
+        for name, col in BUS_DEPENDENTS:
+            await self._purge_collection(job_id, name, col, {"bus_id": keys})
+        # transactions from before bus_id only name the bus in their description: one scan per bus, then by _id
+        legacy = [t["_id"] async for t in transactions_col.find(
+            {"bus_id": {"$exists": False}, "description": {"$regex": str(bus_id)}}, {"_id": 1})]
+        if legacy:
+            await self._purge_collection(job_id, "transactions", transactions_col, {"_id": {"$in": legacy}})
+        await archive_buses_col.delete_one({"_id": bus_id})
+
+    async def _purge_route(self, job_id: ObjectId, route_id: ObjectId):
+        while True:
+            bus = await buses_col.find_one({"route_id": _id_keys(route_id)}, {"_id": 1})
+            if bus is None:
+                archived = await archive_buses_col.find_one({"bus.route_id": _id_keys(route_id)}, {"_id": 1})
+                if archived is None:
+                    return
+                bus = archived
+            await self._purge_bus(job_id, bus["_id"])
+            await self._progress(job_id, "buses", 1)
+
+    async def run_job(self, job: Dict[str, Any]):
+        await purge_jobs_col.update_one({"_id": job["_id"]}, {"$set": {"status": "running", "updated_at": datetime.utcnow()}})
+        try:
+            if job["kind"] == "route":
+                await self._purge_route(job["_id"], job["target_id"])
+            else:
+                await self._purge_bus(job["_id"], job["target_id"])
+        except _LiveBookings as e:
+            target = {"route_id": _id_keys(job["target_id"])} if job["kind"] == "route" else {"_id": job["target_id"]}
+            await restore(target)
+            await purge_jobs_col.update_one({"_id": job["_id"]}, {"$set": {
+                "status": "failed", "error": str(e), "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}})
+            logger.warning("purge refused", extra={"kind": job["kind"], "target_id": str(job["target_id"]), "error": str(e)})
+            return
+        await purge_jobs_col.update_one({"_id": job["_id"]}, {"$set": {
+            "status": "done", "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}})
+        logger.info("purge finished", extra={"kind": job["kind"], "target_id": str(job["target_id"])})
+
+    async def run_pending(self) -> int:
+        """Work through queued and interrupted purge jobs for up to PURGE_RUN_SECONDS; returns jobs finished."""
+        self._deadline = time.monotonic() + settings.PURGE_RUN_SECONDS
+        finished = 0
+        cursor = purge_jobs_col.find({"status": {"$in": ["queued", "running"]}}).sort("created_at", 1)
+        async for job in cursor:
+            try:
+                await self.run_job(job)
+            except _OutOfTime:
+                return finished
+            finished += 1
+        return finished
+
+
+purger = Purger()
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    if not ObjectId.is_valid(job_id):
+        return None
+    return await purge_jobs_col.find_one({"_id": ObjectId(job_id)})
+
+
+async def ensure_purge_indexes():
+    await purge_jobs_col.create_index([("status", 1), ("created_at", 1)])
@@ -0,0 +1,184 @@
+# query_tracer.py
+"""
+Per-request MongoDB query tracing.
+
+- QueryTraceMiddleware opens a RequestTrace in a context var for every HTTP request
+- QueryTraceListener (pymongo command monitor, registered on the Motor client in db.py) adds each
+  command to the trace of the request that issued it; Motor runs pymongo on executor threads with
+  a copy of the caller's context, so the listener sees the right trace
+- the response gets a Server-Timing header (db;dur=<ms>;desc="<n> queries")
+- requests over settings.QUERY_BUDGET are logged with their query breakdown, and any query shape
+  (collection, command, filter keys) repeated settings.N_PLUS_ONE_THRESHOLD times is logged as N+1
+
+assert_max_queries() turns the same trace into a regression check for tests and scripts.
+"""
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import monitoring
+from config import settings
+
+logger = logging.getLogger("query_trace")
+
+# cursor bookkeeping; counted but never an N+1 candidate
+_PLUMBING = {"getMore", "killCursors", "endSessions"}
+
+Shape = Tuple[str, str, str]
+
+
+def _shape(value: Any) -> Any:
+    """Structure of a filter with the literal values stripped: {'bus_id': ?, 'status': {'$in': ?}}."""
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{k}:{_shape(v)}" for k, v in sorted(value.items())) + "}"
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], dict):
+        return "[" + ",".join(_shape(v) for v in value) + "]"
+    return "?"
+
+
+def _filter_of(command_name: str, command: Dict[str, Any]) -> Any:
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query", {}))
+    if command_name == "findAndModify":
+        return command.get("query", {})
+    if command_name in ("update", "delete"):
+        stmts = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return stmts[0].get("q", {})
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or [{}]
+        return pipeline[0].get("$match", {})
+    return {}
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Shape:
+    collection = command.get(command_name)
+    collection = collection if isinstance(collection, str) else "-"
+    return collection, command_name, _shape(_filter_of(command_name, command))
+
+
+class RequestTrace:
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes: Counter = Counter()
+        self.shape_ms: Dict[Shape, float] = {}
+        self._pending: Dict[int, Shape] = {}
+        self._lock = threading.Lock()
+
+    def started(self, request_id: int, shape: Shape):
+        with self._lock:
+            self._pending[request_id] = shape
+            self.count += 1
+            self.shapes[shape] += 1
+
+    def finished(self, request_id: int, duration_ms: float):
+        with self._lock:
+            shape = self._pending.pop(request_id, None)
+            self.total_ms += duration_ms
+            if shape is not None:
+                self.shape_ms[shape] = self.shape_ms.get(shape, 0.0) + duration_ms
+
+    def n_plus_one(self, threshold: Optional[int] = None) -> List[Tuple[Shape, int]]:
+        threshold = threshold or settings.N_PLUS_ONE_THRESHOLD
+        return [(s, n) for s, n in self.shapes.most_common() if n >= threshold and s[1] not in _PLUMBING]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries"'
+
+    def summary(self, top: int = 10) -> str:
+        lines = [f"{self.label}: {self.count} queries, {self.total_ms:.1f} ms in MongoDB"]
+        for (collection, command, filt), n in self.shapes.most_common(top):
+            ms = self.shape_ms.get((collection, command, filt), 0.0)
+            lines.append(f"  {n:>4} x {command} {collection} {filt} ({ms:.1f} ms)")
+        return "\n".join(lines)
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("query_trace", default=None)
+
+# traces finished while an assert_max_queries() block is active
+_sinks: List[List[RequestTrace]] = []
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+class QueryTraceListener(monitoring.CommandListener):
+    def started(self, event):
+        trace = _current.get()
+        if trace is not None:
+            trace.started(event.request_id, command_shape(event.command_name, event.command))
+
+    def succeeded(self, event):
+        trace = _current.get()
+        if trace is not None:
+            trace.finished(event.request_id, event.duration_micros / 1000)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+query_trace_listener = QueryTraceListener()
+
+
+def _report(trace: RequestTrace):
+    for sink in list(_sinks):
+        sink.append(trace)
+    if trace.count > settings.QUERY_BUDGET:
+        logger.warning("query budget exceeded (%d > %d)\n%s", trace.count, settings.QUERY_BUDGET, trace.summary())
+    for (collection, command, filt), n in trace.n_plus_one():
+        logger.warning("possible N+1 in %s: %d x %s %s %s", trace.label, n, command, collection, filt)
+
+
+class QueryTraceMiddleware:
+    """Pure ASGI middleware: one RequestTrace per HTTP request, exposed via Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.QUERY_TRACING:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(f'{scope.get("method", "")} {scope.get("path", "")}')
+        token = _current.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _report(trace)
+
+
+@contextmanager
+def assert_max_queries(limit: int, label: str = "block"):
+    """
+    Fail with the query breakdown when a traced request (or code awaited directly inside the block)
+    issues more than `limit` MongoDB commands:
+
+        with assert_max_queries(5):
+            client.get("/users/me/bookings", headers=headers)
+    """
+    captured: List[RequestTrace] = []
+    direct = RequestTrace(label)
+    _sinks.append(captured)
+    token = _current.set(direct)
+    try:
+        yield captured
+    finally:
+        _current.reset(token)
+        _sinks.remove(captured)
+    for trace in captured + [direct]:
+        if trace.count > limit:
+            raise AssertionError(f"expected at most {limit} queries\n{trace.summary()}")
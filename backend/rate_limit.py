@@ -0,0 +1,129 @@
+# rate_limit.py
+"""
+Rate limiting for the auth endpoints (credential-stuffing defense).
+
+signin and signup are checked against three sliding windows before any database lookup or bcrypt
+work, and answer 429 + Retry-After when one is exceeded:
+- per client IP: AUTH_LIMIT_PER_IP attempts per AUTH_IP_WINDOW_SECONDS
+- per email: AUTH_LIMIT_PER_EMAIL attempts per AUTH_EMAIL_WINDOW_SECONDS (slow guessing of one account
+  from many IPs); only attempts the IP limit let through are counted here
+- global: AUTH_LIMIT_GLOBAL attempts per AUTH_GLOBAL_WINDOW_SECONDS (a distributed burst; keeps hashing
+  from eating the CPU that checkout needs). Counted last, only for attempts the IP and email limits
+  let through, so one client hammering past its own limit cannot fill it and lock everybody out.
+
+Sliding windows are approximated with two fixed windows: estimate = previous count x the share of the
+previous window still inside the sliding window + current count. An attempt rejected by a window
+still counts in that window, so hammering past the limit does not shorten the wait.
+
+Stores (RATE_LIMIT_STORE): "memory" keeps counters in this worker, in RATE_LIMIT_SHARDS dicts keyed by
+a hash of the key; expired counters are swept one shard per second so no sweep walks the whole table.
+"mongo" shares the counters between workers (one document per key and window in rate_limits, removed
+by a TTL index). Both implement hit(key, window, now) -> estimate.
+"""
+import math
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+from config import settings
+from db import rate_limits_col
+from metrics import registry
+
+rate_limited_total = registry.counter("auth_rate_limited_total", "Auth requests refused with 429 by limit", ("scope",))
+
+
+class MemoryRateLimitStore:
+    def __init__(self, shards: int):
+        # key -> [window index, previous count, current count, forget after]
+        self._shards: List[Dict[str, list]] = [{} for _ in range(max(1, shards))]
+        self._sweep = 0
+        self._next_sweep = 0.0
+
+    def _shard(self, key: str) -> Dict[str, list]:
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def _sweep_one(self, now: float):
+        # drop expired counters, one shard per second
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + 1.0
+        shard = self._shards[self._sweep]
+        self._sweep = (self._sweep + 1) % len(self._shards)
+        stale = [k for k, c in shard.items() if c[3] < now]
+        for k in stale:
+            del shard[k]
+
+    async def hit(self, key: str, window: float, now: float) -> float:
+        self._sweep_one(now)
+        idx = int(now // window)
+        shard = self._shard(key)
+        c = shard.get(key)
+        if c is None or c[0] < idx - 1:
+            c = shard[key] = [idx, 0, 0, 0.0]
+        elif c[0] == idx - 1:
+            c[0], c[1], c[2] = idx, c[2], 0
+        c[2] += 1
+        c[3] = (idx + 2) * window   # forget after the next window ends
+        return c[1] * (1 - (now - idx * window) / window) + c[2]
+
+
+class MongoRateLimitStore:
+    """One document per (key, window index): {_id: "key:idx", n, expires_at}."""
+
+    async def hit(self, key: str, window: float, now: float) -> float:
+        idx = int(now // window)
+        doc = await rate_limits_col.find_one_and_update(
+            {"_id": f"{key}:{idx}"},
+            {"$inc": {"n": 1}, "$setOnInsert": {"expires_at": datetime.utcfromtimestamp((idx + 2) * window)}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        prev = await rate_limits_col.find_one({"_id": f"{key}:{idx - 1}"}, {"n": 1})
+        return (prev["n"] if prev else 0) * (1 - (now - idx * window) / window) + doc["n"]
+
+
+class AuthRateLimiter:
+    def __init__(self):
+        self._memory = MemoryRateLimitStore(settings.RATE_LIMIT_SHARDS)
+        self._mongo = MongoRateLimitStore()
+
+    @property
+    def store(self):
+        return self._mongo if settings.RATE_LIMIT_STORE == "mongo" else self._memory
+
+    @staticmethod
+    def client_ip(request: Request) -> str:
+        if settings.RATE_LIMIT_TRUST_FORWARDED:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    def _limits(self, request: Request, email: Optional[str]) -> List[Tuple[str, str, int, float]]:
+        # in order: a limit is only counted for attempts that passed the ones before it
+        limits = [("ip", f"auth:ip:{self.client_ip(request)}", settings.AUTH_LIMIT_PER_IP, settings.AUTH_IP_WINDOW_SECONDS)]
+        if email:
+            limits.append(("email", f"auth:email:{email.strip().lower()}", settings.AUTH_LIMIT_PER_EMAIL,
+                           settings.AUTH_EMAIL_WINDOW_SECONDS))
+        limits.append(("global", "auth:*", settings.AUTH_LIMIT_GLOBAL, settings.AUTH_GLOBAL_WINDOW_SECONDS))
+        return limits
+
+    async def check(self, request: Request, email: Optional[str] = None):
+        """Count the attempt against each limit in turn; 429 (before any hashing) at the first one exceeded."""
+        if not settings.AUTH_RATE_LIMIT:
+            return
+        now = time.time()
+        for scope, key, limit, window in self._limits(request, email):
+            if await self.store.hit(key, window, now) > limit:
+                rate_limited_total.inc(scope=scope)
+                retry = math.ceil((int(now // window) + 1) * window - now)
+                raise HTTPException(status_code=429, detail="Too many attempts, try again later",
+                                    headers={"Retry-After": str(max(1, retry))})
+
+
+auth_rate_limiter = AuthRateLimiter()
+
+
+async def ensure_rate_limit_indexes():
+    if settings.RATE_LIMIT_STORE == "mongo":
+        await rate_limits_col.create_index("expires_at", expireAfterSeconds=0)
@@ -0,0 +1,99 @@
+# route_catalogue.py
+"""
+In-memory route catalogue.
+
+Routes change rarely (admin create/delete) but are resolved on every search, so the whole
+collection is held in memory:
+- a dict keyed by the normalized (case- and diacritics-folded) (src, dst) pair -> route ids
+- a sorted array of normalized city keys for prefix autocomplete (bisect, no Mongo round trip)
+
+The catalogue is loaded at startup, reloaded by create_route/delete_route in this worker and
+refreshed periodically by the scheduler so other workers converge.
+"""
+import asyncio
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from db import routes_col
+
+
+def normalize_city(name: Optional[str]) -> str:
+    """Fold case and diacritics and collapse whitespace: '  São  Paulo ' -> 'sao paulo'."""
+    if not name:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+class RouteCatalogue:
+    def __init__(self):
+        self._pairs: Dict[Tuple[str, str], List[ObjectId]] = {}
+        self._routes: Dict[ObjectId, Tuple[str, str]] = {}
+        # sorted (key, display name); a city is indexed under its full name and every later word,
+        # so "delhi" also suggests "New Delhi"
+        self._keys: List[str] = []
+        self._display: List[str] = []
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    async def load(self):
+        """Rebuild from routes_col and swap the new structures in at once."""
+        async with self._lock:
+            pairs: Dict[Tuple[str, str], List[ObjectId]] = {}
+            routes: Dict[ObjectId, Tuple[str, str]] = {}
+            cities: Dict[str, str] = {}
+            async for r in routes_col.find({}, {"src_city": 1, "dst_city": 1}).sort("_id", 1):
+                src, dst = r.get("src_city") or "", r.get("dst_city") or ""
+                pairs.setdefault((normalize_city(src), normalize_city(dst)), []).append(r["_id"])
+                routes[r["_id"]] = (src, dst)
+                for city in (src, dst):
+                    # first spelling seen wins as the display name
+                    cities.setdefault(normalize_city(city), city.strip())
+
+            index = []
+            for norm, display in cities.items():
+                if not norm:
+                    continue
+                words = norm.split(" ")
+                for i in range(len(words)):
+                    index.append((" ".join(words[i:]), display))
+            index.sort()
+
+            self._pairs = pairs
+            self._routes = routes
+            self._keys = [k for k, _ in index]
+            self._display = [d for _, d in index]
+            self._loaded = True
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    def resolve(self, src: str, dst: str) -> List[ObjectId]:
+        """Route ids serving src -> dst (normalized match), oldest first."""
+        return self._pairs.get((normalize_city(src), normalize_city(dst)), [])
+
+    def route_cities(self, route_id) -> Optional[Tuple[str, str]]:
+        return self._routes.get(route_id)
+
+    def suggest(self, query: str, limit: int = 10) -> List[str]:
+        """Display names of cities having a word starting with the normalized query."""
+        prefix = normalize_city(query)
+        if not prefix:
+            return []
+        out: List[str] = []
+        i = bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix) and len(out) < limit:
+            if self._display[i] not in out:
+                out.append(self._display[i])
+            i += 1
+        return out
+
+
+route_catalogue = RouteCatalogue()
@@ -1,324 +1,381 @@
-
-# routers/admin_routes.py
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from routers.deps import require_admin
-from db import routes_col, buses_col, seats_col, bookings_col, transactions_col
-from models import RouteCreate, BusCreate
-from datetime import datetime, timedelta, time
-from bson import ObjectId
-from typing import Optional, List, Dict, Any
-
-router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
-
-
-def _generate_40_seats(bus_obj_id: ObjectId) -> List[Dict[str, Any]]:
-    seats_docs = []
-    seat_counter = 1
-    ROWS = 10
-    for row in range(1, ROWS + 1):
-        for col in (1, 2):
-            seats_docs.append({
-                "bus_id": bus_obj_id,
-                "seat_number": str(seat_counter),
-                "status": "available",
-                "reserved_by_reservation_id": None,
-                "booked_by_booking_id": None,
-                "side": "left",
-                "row": row,
-                "col": col,
-                "created_at": datetime.utcnow()
-            })
-            seat_counter += 1
-        for col in (1, 2):
-            seats_docs.append({
-                "bus_id": bus_obj_id,
-                "seat_number": str(seat_counter),
-                "status": "available",
-                "reserved_by_reservation_id": None,
-                "booked_by_booking_id": None,
-                "side": "right",
-                "row": row,
-                "col": col,
-                "created_at": datetime.utcnow()
-            })
-            seat_counter += 1
-    return seats_docs
-
-
-@router.post("/routes", status_code=201)
-async def create_route(payload: RouteCreate):
-    doc = payload.dict()
-    doc["created_at"] = datetime.utcnow()
-    res = await routes_col.insert_one(doc)
-    return {"id": str(res.inserted_id)}
-
-
-@router.post("/buses", status_code=201)
-async def create_bus(payload: BusCreate):
-    if not ObjectId.is_valid(payload.route_id):
-        raise HTTPException(status_code=400, detail="Invalid route id")
-
-    route = await routes_col.find_one({"_id": ObjectId(payload.route_id)})
-    if not route:
-        raise HTTPException(status_code=404, detail="Route not found")
-
-    doc = payload.dict()
-    doc["route_id"] = ObjectId(payload.route_id)
-    doc["created_at"] = datetime.utcnow()
-
-    res = await buses_col.insert_one(doc)
-    bus_obj_id = res.inserted_id
-
-    seats_docs = _generate_40_seats(bus_obj_id)
-    try:
-        insert_res = await seats_col.insert_many(seats_docs)
-        inserted = len(insert_res.inserted_ids)
-    except Exception as e:
-        try:
-            await buses_col.delete_one({"_id": bus_obj_id})
-        except Exception:
-            pass
-        raise HTTPException(status_code=500, detail=f"Failed to initialize seats: {e}")
-
-    return {"id": str(bus_obj_id), "seats_created": inserted}
-
-
-@router.patch("/buses/{bus_id}")
-async def update_bus(bus_id: str, fields: dict = Body(...)):
-    if not ObjectId.is_valid(bus_id):
-        raise HTTPException(status_code=400, detail="Invalid bus id")
-    immutable = {"_id", "created_at", "route_id"}
-    for k in immutable:
-        if k in fields:
-            del fields[k]
-    await buses_col.update_one({"_id": ObjectId(bus_id)}, {"$set": fields})
-    return {"status": "ok"}
-
-
-@router.delete("/buses/{bus_id}")
-async def delete_bus(bus_id: str):
-    """
-    Delete bus and related records (seats, bookings, transactions).
-    Matches both ObjectId and string-stored bus_id fields.
-    """
-    if not ObjectId.is_valid(bus_id):
-        raise HTTPException(status_code=400, detail="Invalid bus id")
-
-    oid = ObjectId(bus_id)
-    # delete bus document
-    bus_del = await buses_col.delete_one({"_id": oid})
-
-    # delete seats - match both ObjectId and string forms for bus_id
-    seats_del = await seats_col.delete_many({"$or": [{"bus_id": oid}, {"bus_id": str(oid)}]})
-
-    # delete bookings - match both forms
-    bookings_del = await bookings_col.delete_many({"$or": [{"bus_id": oid}, {"bus_id": str(oid)}]})
-
-    # delete transactions - match both forms
-    transactions_del = await transactions_col.delete_many({"$or": [{"bus_id": oid}, {"bus_id": str(oid)}]})
-
-    return {
-        "status": "deleted",
-        "bus_deleted": bus_del.deleted_count,
-        "seats_deleted": seats_del.deleted_count,
-        "bookings_deleted": bookings_del.deleted_count,
-        "transactions_deleted": transactions_del.deleted_count
-    }
-
-
-def _parse_date_inclusive(start_str: str, end_str: str):
-    """
-    Robust parsing for date/time inputs from frontend.
-    If input is YYYY-MM-DD (length 10) treat it as whole-day inclusive.
-    Returns (start_dt, end_dt) both as datetimes.
-    """
-    try:
-        start = datetime.fromisoformat(start_str)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid from_date format; use YYYY-MM-DD or ISO datetime")
-
-    try:
-        end = datetime.fromisoformat(end_str)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid to_date format; use YYYY-MM-DD or ISO datetime")
-
-    # If the caller passed a date-only string like '2025-09-21' (len == 10),
-    # datetime.fromisoformat produces midnight; make end inclusive by adding the remainder of the day.
-    if len(end_str) == 10:
-        end = datetime.combine(end.date(), time.max)  # 23:59:59.999999
-
-    # If start is date-only, set start to start of day for clarity
-    if len(start_str) == 10:
-        start = datetime.combine(start.date(), time.min)
-
-    return start, end
-
-
-@router.get("/reports")
-async def reports(
-    from_date: str = Query(..., description="ISO date string, e.g. 2025-09-01"),
-    to_date: str = Query(...),
-    by: str = Query("day", regex="^(day|week|month|year)$"),
-    bus_id: Optional[str] = None
-):
-    """
-    Returns aggregated bookings grouped by day|week|month|year.
-    - Supports date-only inputs (YYYY-MM-DD) and ISO datetimes.
-    - If bus_id provided, will match either ObjectId or string-stored bus_id.
-    """
-    start, end = _parse_date_inclusive(from_date, to_date)
-
-    # Build base match
-    match = {"created_at": {"$gte": start, "$lte": end}}
-
-    # bus_id matching: support both ObjectId and string stored bus ids
-    if bus_id:
-        if ObjectId.is_valid(bus_id):
-            oid = ObjectId(bus_id)
-            match["$or"] = [{"bus_id": oid}, {"bus_id": str(oid)}]
-        else:
-            match["bus_id"] = bus_id
-
-    # Build aggregation pipeline based on 'by'
-    if by == "day":
-        fmt = "%Y-%m-%d"
-        key_name = "day"
-        group_id = {key_name: {"$dateToString": {"format": fmt, "date": "$created_at"}}}
-        sort_key = f"_id.{key_name}"
-    elif by == "month":
-        fmt = "%Y-%m"
-        key_name = "month"
-        group_id = {key_name: {"$dateToString": {"format": fmt, "date": "$created_at"}}}
-        sort_key = f"_id.{key_name}"
-    elif by == "year":
-        fmt = "%Y"
-        key_name = "year"
-        group_id = {key_name: {"$dateToString": {"format": fmt, "date": "$created_at"}}}
-        sort_key = f"_id.{key_name}"
-    else:
-        # week grouping: produce a readable "YYYY-WW" label using iso week/year operators.
-        # Note: this uses aggregation expressions ($isoWeekYear, $isoWeek) available in modern Mongo versions.
-        key_name = "week"
-        group_id = {
-            key_name: {
-                "$concat": [
-                    {"$toString": {"$isoWeekYear": "$created_at"}},
-                    "-W",
-                    {
-                        # zero-pad week number to 2 digits
-                        "$cond": [
-                            {"$lt": [{"$isoWeek": "$created_at"}, 10]},
-                            {"$concat": ["0", {"$toString": {"$isoWeek": "$created_at"}}]},
-                            {"$toString": {"$isoWeek": "$created_at"}}
-                        ]
-                    }
-                ]
-            }
-        }
-        sort_key = f"_id.{key_name}"
-
-    pipeline = [
-        {"$match": match},
-        {"$group": {
-            "_id": group_id,
-            "revenue": {"$sum": {"$ifNull": ["$total_price", 0]}},
-            "bookings": {"$sum": 1}
-        }},
-        {"$sort": {sort_key: 1}}
-    ]
-
-    agg = bookings_col.aggregate(pipeline)
-    out = []
-    async for doc in agg:
-        out.append(doc)
-    return {"data": out}
-
-
-@router.get("/top-buses")
-async def top_buses(
-    period_from: str = Query(...),
-    period_to: str = Query(...),
-    limit: int = Query(10, ge=1, le=100)
-):
-    try:
-        start = datetime.fromisoformat(period_from)
-        end = datetime.fromisoformat(period_to)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid date format; use ISO8601")
-
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start, "$lte": end}}},
-        {"$group": {
-            "_id": "$bus_id",
-            "total_amount": {"$sum": {"$ifNull": ["$total_price", 0]}},
-            "seats_booked": {"$sum": 1}
-        }},
-        {"$project": {
-            "total_amount": 1,
-            "seats_booked": 1,
-            "booking_rate": {"$cond": [{"$eq": ["$seats_booked", 0]}, 0, {"$divide": ["$total_amount", "$seats_booked"]}]}
-        }},
-        {"$sort": {"booking_rate": -1}},
-        {"$limit": limit}
-    ]
-
-    agg = bookings_col.aggregate(pipeline)
-    out = []
-    async for doc in agg:
-        out.append({
-            "bus_id": str(doc["_id"]) if doc.get("_id") is not None else None,
-            "total_amount": doc.get("total_amount", 0),
-            "seats_booked": doc.get("seats_booked", 0),
-            "booking_rate": doc.get("booking_rate", 0)
-        })
-    return {"data": out}
-
-
-@router.get("/routes")
-async def list_routes(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
-    cursor = routes_col.find({}).skip(skip).limit(limit)
-    out = []
-    async for r in cursor:
-        r["_id"] = str(r["_id"])
-        out.append(r)
-    return {"routes": out, "skip": skip, "limit": limit}
-
-
-@router.get("/buses")
-async def list_buses(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
-    cursor = buses_col.find({}).skip(skip).limit(limit)
-    out = []
-    async for b in cursor:
-        b["_id"] = str(b["_id"])
-        if isinstance(b.get("route_id"), ObjectId):
-            b["route_id"] = str(b["route_id"])
-        out.append(b)
-    return {"buses": out, "skip": skip, "limit": limit}
-
-
-@router.post("/buses/{bus_id}/open-sales")
-async def open_sales(bus_id: str, weeks_before: int = Query(1, ge=0)):
-    if not ObjectId.is_valid(bus_id):
-        raise HTTPException(status_code=400, detail="Invalid bus id")
-    bus = await buses_col.find_one({"_id": ObjectId(bus_id)})
-    if not bus:
-        raise HTTPException(status_code=404, detail="Bus not found")
-    if "start_time" not in bus or not bus["start_time"]:
-        raise HTTPException(status_code=400, detail="Bus start_time not set")
-    st = bus["start_time"]
-    if isinstance(st, str):
-        try:
-            st = datetime.fromisoformat(st)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Bus start_time stored in invalid format")
-    new_open = st - timedelta(weeks=weeks_before)
-    await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"sales_open_time": new_open}})
-    return {"status": "ok", "sales_open_time": new_open.isoformat()}
-
-
-@router.delete("/routes/{route_id}")
-async def delete_route(route_id: str):
-    if not ObjectId.is_valid(route_id):
-        raise HTTPException(status_code=400, detail="Invalid route id")
-    await routes_col.delete_one({"_id": ObjectId(route_id)})
-    return {"status": "deleted"}
+
+# routers/admin_routes.py
+from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from routers.deps import require_admin
+from db import routes_col, buses_col, seats_col, analytics_bookings_col, purge_jobs_col, cancellations_col
+from models import RouteCreate, BusCreate, SeatLayoutCreate
+from seat_layouts import get_seat_skeleton, stamp_seats, list_layouts, create_layout, LayoutExists
+from utils.json_response import FastJSONResponse
+from route_catalogue import route_catalogue
+from journey_planner import journey_planner
+from job_runner import job_runner, shard_key
+from event_bus import event_bus
+from archive import ARCHIVE_BOOKINGS
+import purge
+import pricing
+from cancellations import cancel_departure
+from datetime import datetime, timedelta, time
+from bson import ObjectId
+from typing import Optional, Dict, Any
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.post("/routes", status_code=201)
+async def create_route(payload: RouteCreate):
+    doc = payload.dict()
+    doc["created_at"] = datetime.utcnow()
+    res = await routes_col.insert_one(doc)
+    event_bus.emit("routes", "insert", res.inserted_id)
+    await route_catalogue.load()
+    return {"id": str(res.inserted_id)}
+
+
+@router.post("/buses", status_code=201)
+async def create_bus(payload: BusCreate):
+    if not ObjectId.is_valid(payload.route_id):
+        raise HTTPException(status_code=400, detail="Invalid route id")
+
+    route = await routes_col.find_one({"_id": ObjectId(payload.route_id)})
+    if not route:
+        raise HTTPException(status_code=404, detail="Route not found")
+
+    try:
+        skeleton = await get_seat_skeleton(payload.layout, payload.seats_count)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Unknown seat layout")
+
+    doc = payload.dict()
+    doc["route_id"] = ObjectId(payload.route_id)
+    doc["seats_count"] = len(skeleton)
+    doc["created_at"] = datetime.utcnow()
+    doc["_id"] = ObjectId()
+    doc["shard_key"] = shard_key(doc["_id"])   # background jobs split buses across workers by it
+
+    res = await buses_col.insert_one(doc)
+    bus_obj_id = res.inserted_id
+
+    seats_docs = stamp_seats(skeleton, bus_obj_id)
+    try:
+        insert_res = await seats_col.insert_many(seats_docs)
+        inserted = len(insert_res.inserted_ids)
+    except Exception as e:
+        try:
+            await buses_col.delete_one({"_id": bus_obj_id})
+        except Exception:
+            pass
+        raise HTTPException(status_code=500, detail=f"Failed to initialize seats: {e}")
+
+    event_bus.emit("buses", "insert", bus_obj_id, bus_obj_id)
+    await journey_planner.refresh_bus(bus_obj_id)
+    return {"id": str(bus_obj_id), "seats_created": inserted}
+
+
+@router.get("/seat-layouts")
+async def get_seat_layouts():
+    return {"layouts": await list_layouts()}
+
+
+@router.post("/seat-layouts", status_code=201)
+async def create_seat_layout(payload: SeatLayoutCreate):
+    try:
+        return await create_layout(payload.name, payload.decks)
+    except LayoutExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.patch("/buses/{bus_id}")
+async def update_bus(bus_id: str, fields: dict = Body(...)):
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    immutable = {"_id", "created_at", "route_id", "layout", "seats_count"}
+    for k in immutable:
+        if k in fields:
+            del fields[k]
+    update = pricing.base_fare_update(fields)
+    await buses_col.update_one({"_id": ObjectId(bus_id)}, update)
+    changed = set(fields) | set(update.get("$inc", {})) | set(update.get("$unset", {}))
+    event_bus.emit("buses", "update", ObjectId(bus_id), bus_id, tuple(changed))
+    await journey_planner.refresh_bus(bus_id)
+    return {"status": "ok"}
+
+
+@router.delete("/buses/{bus_id}", status_code=202)
+async def delete_bus(bus_id: str):
+    """
+    Delete a bus. It goes off sale at once (status "deleting"); the bus document, its seats, reservations,
+    bookings and transactions are removed in the background by a purge job (progress at
+    /admin/purge-jobs/{id}). Refused with 409 while an upcoming departure has live bookings: cancel it
+    first (POST /admin/buses/{id}/cancel).
+    """
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+
+    oid = ObjectId(bus_id)
+    # off sale before counting, so no new booking can slip in after the check
+    await purge.withdraw({"_id": oid})
+    live = await purge.live_bookings({"_id": oid})
+    if live:
+        await purge.restore({"_id": oid})
+        raise HTTPException(status_code=409, detail=f"Bus has {live} live bookings; cancel the departure first")
+
+    job = await purge.enqueue("bus", oid)
+    return {"status": "deleting", "job_id": str(job["_id"])}
+
+
+@router.post("/buses/{bus_id}/cancel", status_code=202)
+async def cancel_bus_departure(bus_id: str, payload: Dict[str, Any] = Body(default={})):
+    """
+    Cancel a departure: sales stop at once, every booking is refunded and its user notified by a
+    background job (progress at GET /admin/buses/{bus_id}/cancel). Repeating the call is harmless.
+    """
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    bus = await buses_col.find_one({"_id": ObjectId(bus_id)})
+    if not bus:
+        raise HTTPException(status_code=404, detail="Bus not found")
+    if bus.get("status") == "finalized":
+        raise HTTPException(status_code=400, detail="Bus already departed")
+    job = await cancel_departure(bus, payload.get("reason"))
+    return FastJSONResponse(job, status_code=202)
+
+
+@router.get("/buses/{bus_id}/cancel")
+async def cancel_bus_departure_status(bus_id: str):
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    job = await cancellations_col.find_one({"_id": ObjectId(bus_id)}, {"batch": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Departure not cancelled")
+    return FastJSONResponse(job)
+
+
+def _parse_date_inclusive(start_str: str, end_str: str):
+    """
+    Robust parsing for date/time inputs from frontend.
+    If input is YYYY-MM-DD (length 10) treat it as whole-day inclusive.
+    Returns (start_dt, end_dt) both as datetimes.
+    """
+    try:
+        start = datetime.fromisoformat(start_str)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid from_date format; use YYYY-MM-DD or ISO datetime")
+
+    try:
+        end = datetime.fromisoformat(end_str)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid to_date format; use YYYY-MM-DD or ISO datetime")
+
+    # If the caller passed a date-only string like '2025-09-21' (len == 10),
+    # datetime.fromisoformat produces midnight; make end inclusive by adding the remainder of the day.
+    if len(end_str) == 10:
+        end = datetime.combine(end.date(), time.max)  # 23:59:59.999999
+
+    # If start is date-only, set start to start of day for clarity
+    if len(start_str) == 10:
+        start = datetime.combine(start.date(), time.min)
+
+    return start, end
+
+
+@router.get("/reports")
+async def reports(
+    from_date: str = Query(..., description="ISO date string, e.g. 2025-09-01"),
+    to_date: str = Query(...),
+    by: str = Query("day", regex="^(day|week|month|year)$"),
+    bus_id: Optional[str] = None
+):
+    """
+    Returns aggregated bookings grouped by day|week|month|year.
+    - Supports date-only inputs (YYYY-MM-DD) and ISO datetimes.
+    - If bus_id provided, will match either ObjectId or string-stored bus_id.
+    """
+    start, end = _parse_date_inclusive(from_date, to_date)
+
+    # Build base match
+    match = {"created_at": {"$gte": start, "$lte": end}}
+
+    # bus_id matching: support both ObjectId and string stored bus ids
+    if bus_id:
+        if ObjectId.is_valid(bus_id):
+            oid = ObjectId(bus_id)
+            match["$or"] = [{"bus_id": oid}, {"bus_id": str(oid)}]
+        else:
+            match["bus_id"] = bus_id
+
+    # Build aggregation pipeline based on 'by'
+    if by == "day":
+        fmt = "%Y-%m-%d"
+        key_name = "day"
+        group_id = {key_name: {"$dateToString": {"format": fmt, "date": "$created_at"}}}
+        sort_key = f"_id.{key_name}"
+    elif by == "month":
+        fmt = "%Y-%m"
+        key_name = "month"
+        group_id = {key_name: {"$dateToString": {"format": fmt, "date": "$created_at"}}}
+        sort_key = f"_id.{key_name}"
+    elif by == "year":
+        fmt = "%Y"
+        key_name = "year"
+        group_id = {key_name: {"$dateToString": {"format": fmt, "date": "$created_at"}}}
+        sort_key = f"_id.{key_name}"
+    else:
+        # week grouping: produce a readable "YYYY-WW" label using iso week/year operators.
+        # Note: this uses aggregation expressions ($isoWeekYear, $isoWeek) available in modern Mongo versions.
+        key_name = "week"
+        group_id = {
+            key_name: {
+                "$concat": [
+                    {"$toString": {"$isoWeekYear": "$created_at"}},
+                    "-W",
+                    {
+                        # zero-pad week number to 2 digits
+                        "$cond": [
+                            {"$lt": [{"$isoWeek": "$created_at"}, 10]},
+                            {"$concat": ["0", {"$toString": {"$isoWeek": "$created_at"}}]},
+                            {"$toString": {"$isoWeek": "$created_at"}}
+                        ]
+                    }
+                ]
+            }
+        }
+        sort_key = f"_id.{key_name}"
+
+    pipeline = [
+        {"$match": match},
+        {"$unionWith": {"coll": ARCHIVE_BOOKINGS, "pipeline": [{"$match": match}]}},
+        {"$group": {
+            "_id": group_id,
+            "revenue": {"$sum": {"$ifNull": ["$total_price", 0]}},
+            "bookings": {"$sum": 1}
+        }},
+        {"$sort": {sort_key: 1}}
+    ]
+
+    agg = analytics_bookings_col.aggregate(pipeline)   # secondaries (db.analytics_db)
+    out = []
+    async for doc in agg:
+        out.append(doc)
+    return {"data": out}
+
+
+@router.get("/top-buses")
+async def top_buses(
+    period_from: str = Query(...),
+    period_to: str = Query(...),
+    limit: int = Query(10, ge=1, le=100)
+):
+    try:
+        start = datetime.fromisoformat(period_from)
+        end = datetime.fromisoformat(period_to)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid date format; use ISO8601")
+
+    match = {"created_at": {"$gte": start, "$lte": end}}
+    pipeline = [
+        {"$match": match},
+        {"$unionWith": {"coll": ARCHIVE_BOOKINGS, "pipeline": [{"$match": match}]}},
+        {"$group": {
+            "_id": "$bus_id",
+            "total_amount": {"$sum": {"$ifNull": ["$total_price", 0]}},
+            "seats_booked": {"$sum": 1}
+        }},
+        {"$project": {
+            "total_amount": 1,
+            "seats_booked": 1,
+            "booking_rate": {"$cond": [{"$eq": ["$seats_booked", 0]}, 0, {"$divide": ["$total_amount", "$seats_booked"]}]}
+        }},
+        {"$sort": {"booking_rate": -1}},
+        {"$limit": limit}
+    ]
+
+    agg = analytics_bookings_col.aggregate(pipeline)
+    out = []
+    async for doc in agg:
+        out.append({
+            "bus_id": str(doc["_id"]) if doc.get("_id") is not None else None,
+            "total_amount": doc.get("total_amount", 0),
+            "seats_booked": doc.get("seats_booked", 0),
+            "booking_rate": doc.get("booking_rate", 0)
+        })
+    return {"data": out}
+
+
+@router.get("/routes")
+async def list_routes(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    cursor = routes_col.find({}).skip(skip).limit(limit)
+    out = []
+    async for r in cursor:
+        r["_id"] = str(r["_id"])
+        out.append(r)
+    return {"routes": out, "skip": skip, "limit": limit}
+
+
+@router.get("/buses")
+async def list_buses(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    out = await buses_col.find({}).skip(skip).limit(limit).to_list(length=limit)
+    return FastJSONResponse({"buses": out, "skip": skip, "limit": limit})
+
+
+@router.post("/buses/{bus_id}/open-sales")
+async def open_sales(bus_id: str, weeks_before: int = Query(1, ge=0)):
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    bus = await buses_col.find_one({"_id": ObjectId(bus_id)})
+    if not bus:
+        raise HTTPException(status_code=404, detail="Bus not found")
+    if "start_time" not in bus or not bus["start_time"]:
+        raise HTTPException(status_code=400, detail="Bus start_time not set")
+    st = bus["start_time"]
+    if isinstance(st, str):
+        try:
+            st = datetime.fromisoformat(st)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Bus start_time stored in invalid format")
+    new_open = st - timedelta(weeks=weeks_before)
+    await buses_col.update_one({"_id": bus["_id"]}, {"$set": {"sales_open_time": new_open}})
+    event_bus.emit("buses", "update", bus["_id"], bus["_id"], ("sales_open_time",))
+    await journey_planner.refresh_bus(bus["_id"])
+    return {"status": "ok", "sales_open_time": new_open.isoformat()}
+
+
+@router.delete("/routes/{route_id}", status_code=202)
+async def delete_route(route_id: str):
+    if not ObjectId.is_valid(route_id):
+        raise HTTPException(status_code=400, detail="Invalid route id")
+    buses = {"route_id": {"$in": [ObjectId(route_id), route_id]}}
+    await purge.withdraw(buses)
+    live = await purge.live_bookings(buses)
+    if live:
+        await purge.restore(buses)
+        raise HTTPException(status_code=409, detail=f"Route has {live} live bookings on upcoming departures; cancel them first")
+    await routes_col.delete_one({"_id": ObjectId(route_id)})
+    event_bus.emit("routes", "delete", ObjectId(route_id))
+    await route_catalogue.load()
+    journey_planner.remove_route(ObjectId(route_id))
+    # the route's buses and everything under them go in the background
+    job = await purge.enqueue("route", ObjectId(route_id))
+    return {"status": "deleting", "job_id": str(job["_id"])}
+
+
+@router.get("/purge-jobs")
+async def purge_jobs(limit: int = Query(20, ge=1, le=100)):
+    """Recent bus/route purge jobs, newest first, with per-collection progress."""
+    jobs = await purge_jobs_col.find({}).sort("created_at", -1).limit(limit).to_list(length=limit)
+    return FastJSONResponse({"jobs": jobs})
+
+
+@router.get("/purge-jobs/{job_id}")
+async def purge_job(job_id: str):
+    job = await purge.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Purge job not found")
+    return FastJSONResponse(job)
+
+
+@router.get("/jobs")
+async def jobs_status():
+    """Background job runner state: this worker's role and shard, live workers and job leases (last run, lag, outcome)."""
+    return FastJSONResponse(await job_runner.status())
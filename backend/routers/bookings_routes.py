@@ -0,0 +1,45 @@
+# routers/bookings_routes.py
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from bson import ObjectId
+from routers.deps import get_user_session
+from db import archive_bookings_col, user_bookings_col
+from config import settings
+from ticket_renderer import cache_key, formats, ticket_renderer
+
+router = APIRouter(prefix="/bookings", tags=["bookings"])
+
+
+@router.get("/{booking_id}/ticket")
+async def get_ticket(booking_id: str, request: Request, format: Optional[str] = Query(None, regex="^(pdf|html)$"),
+                     user_session=Depends(get_user_session)):
+    """
+    The booking's printable e-ticket (PDF or HTML with the QR code; PDF by default when it can be
+    rendered, else HTML). Rendered once per booking version; the ETag is the content address, so
+    unchanged tickets revalidate with a 304.
+    """
+    user, session = user_session
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthenticated")
+    if not ObjectId.is_valid(booking_id):
+        raise HTTPException(status_code=400, detail="Invalid booking id")
+    format = format or formats()[-1]
+    if format not in formats():
+        raise HTTPException(status_code=406, detail=f"Ticket format {format} not available")
+    oid = ObjectId(booking_id)
+    booking = (await user_bookings_col.find_one({"_id": oid}, session=session)
+               or await archive_bookings_col.find_one({"_id": oid}))
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if str(booking.get("user_id")) != str(user.get("_id")) and user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Not your booking")
+
+    etag = f'"{cache_key(booking, format)}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.TICKET_HTTP_MAX_AGE}"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    ticket = await ticket_renderer.get(booking, format)
+    name = f"ticket-{booking.get('pnr') or booking_id}.{format}"
+    headers["Content-Disposition"] = f'inline; filename="{name}"'
+    return Response(content=ticket.content, media_type=ticket.media_type, headers=headers)
@@ -0,0 +1,12 @@
+# routers/routes_routes.py
+from fastapi import APIRouter, Query
+from route_catalogue import route_catalogue
+
+router = APIRouter(prefix="/routes", tags=["routes"])
+
+
+@router.get("/suggest")
+async def suggest(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """City autocomplete served from the in-memory route catalogue."""
+    await route_catalogue.ensure_loaded()
+    return {"cities": route_catalogue.suggest(q, limit)}
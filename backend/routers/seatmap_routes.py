@@ -0,0 +1,89 @@
+# routers/seatmap_routes.py
+"""
+Versioned seat-map API.
+
+The seat map is split in two:
+- GET /v2/buses/{bus_id}/layout  -> immutable seat positions (cacheable forever when fetched with ?v=<version>)
+- GET /v2/buses/{bus_id}/status  -> compact status vector indexed by seat position, polled by clients
+
+Status codes are 0=available, 1=reserved, 2=booked, 3=other. The default encoding packs them
+2 bits per seat and base64s the result (a 40-seat bus is a 16-character string).
+"""
+import hashlib
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from bson import ObjectId
+from db import buses_col, seats_col
+from utils.json_response import FastJSONResponse
+from seat_layouts import (
+    STATUS_CODES, UNKNOWN_STATUS_CODE, load_bus_layout, cached_bus_layout,
+    encode_status_bitmap, encode_status_rle,
+)
+
+router = APIRouter(prefix="/v2/buses", tags=["seatmap"])
+
+LAYOUT_CACHE_FOREVER = "public, max-age=31536000, immutable"
+LAYOUT_CACHE_REVALIDATE = "public, max-age=60"
+STATUS_CACHE = "no-cache"
+
+
+def _ensure_valid_bus_id(bus_id: str) -> ObjectId:
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    return ObjectId(bus_id)
+
+
+async def _get_bus(bus_oid: ObjectId):
+    bus = await buses_col.find_one({"_id": bus_oid}, {"layout": 1, "layout_version": 1})
+    if not bus:
+        raise HTTPException(status_code=404, detail="Bus not found")
+    return bus
+
+
+@router.get("/{bus_id}/layout")
+async def get_layout(bus_id: str, request: Request, v: Optional[int] = None):
+    """
+    Static seat layout. Requests pinned to the current version (?v=) are cached forever;
+    unpinned requests get a short max-age and an ETag.
+    """
+    bus_oid = _ensure_valid_bus_id(bus_id)
+    bus = await _get_bus(bus_oid)
+    layout = await load_bus_layout(bus)
+
+    etag = f'"layout-{bus_id}-{layout["version"]}"'
+    cache_control = LAYOUT_CACHE_FOREVER if v == layout["version"] else LAYOUT_CACHE_REVALIDATE
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(layout["payload"], headers=headers)
+
+
+@router.get("/{bus_id}/status")
+async def get_status(bus_id: str, request: Request, format: str = Query("bitmap", regex="^(bitmap|rle)$")):
+    """
+    Dynamic seat status vector, in layout position order.
+    `v` is the layout version the vector is indexed against; clients refetch the layout when it changes.
+    """
+    bus_oid = _ensure_valid_bus_id(bus_id)
+
+    statuses = {}
+    async for s in seats_col.find({"bus_id": bus_oid}, {"_id": 0, "seat_number": 1, "status": 1}):
+        statuses[str(s.get("seat_number"))] = s.get("status", "available")
+
+    # the cached layout is only trusted while it still describes the same set of seats
+    layout = cached_bus_layout(bus_id)
+    if layout is None or len(layout["order"]) != len(statuses) or any(n not in statuses for n in layout["order"]):
+        bus = await _get_bus(bus_oid)
+        layout = await load_bus_layout(bus, force=True)
+
+    codes = [STATUS_CODES.get(statuses.get(n), UNKNOWN_STATUS_CODE) for n in layout["order"]]
+    if format == "rle":
+        body = {"v": layout["version"], "n": len(codes), "rle": encode_status_rle(codes)}
+    else:
+        body = {"v": layout["version"], "n": len(codes), "bits": encode_status_bitmap(codes)}
+
+    etag = '"' + hashlib.blake2b(repr(body).encode(), digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": STATUS_CACHE}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(body, headers=headers)
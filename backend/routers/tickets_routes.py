@@ -0,0 +1,112 @@
+# routers/tickets_routes.py
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
+from pymongo import UpdateOne
+from routers.deps import require_admin
+from models import TicketVerifyRequest, CheckinSyncRequest
+from db import bookings_col
+from tickets import verify_ticket
+
+router = APIRouter(prefix="/tickets", tags=["tickets"], dependencies=[Depends(require_admin)])
+
+MANIFEST_FIELDS = ("pnr", "booking_id", "seat_number", "passenger_name", "status", "checked_in_at", "ticket_token")
+
+
+def _ensure_valid_bus_id(bus_id: str):
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    return ObjectId(bus_id)
+
+
+@router.post("/verify")
+async def verify(payload: TicketVerifyRequest):
+    """Signature/bus/expiry check of a scanned ticket; no database access (devices do the same offline)."""
+    ticket = verify_ticket(payload.token, payload.bus_id)
+    if ticket is None:
+        return {"valid": False}
+    return {"valid": True, **ticket._asdict()}
+
+
+async def _manifest_rows(bus_oid: ObjectId):
+    cursor = bookings_col.find({"bus_id": {"$in": [bus_oid, str(bus_oid)]}},
+                               {"pnr": 1, "seat_numbers": 1, "passengers": 1, "status": 1, "checkins": 1, "ticket_token": 1})
+    async for b in cursor.sort("_id", 1).batch_size(500):
+        names = {p.get("seat_number"): p.get("passenger_name") for p in b.get("passengers") or []}
+        checkins = b.get("checkins") or {}
+        for seat in b.get("seat_numbers") or list(names):
+            at = checkins.get(seat)
+            yield {
+                "pnr": b.get("pnr"),
+                "booking_id": str(b["_id"]),
+                "seat_number": seat,
+                "passenger_name": names.get(seat),
+                "status": b.get("status") or "confirmed",
+                "checked_in_at": at.isoformat() if isinstance(at, datetime) else None,
+                "ticket_token": b.get("ticket_token"),
+            }
+
+
+@router.get("/manifest/{bus_id}")
+async def manifest(bus_id: str, format: str = Query("ndjson", regex="^(ndjson|csv)$")):
+    """
+    The bus's passenger list, one row per booked seat (cancelled bookings included, flagged by status),
+    streamed as NDJSON or CSV for conductors' devices to preload before boarding.
+    """
+    bus_oid = _ensure_valid_bus_id(bus_id)
+
+    async def ndjson():
+        async for row in _manifest_rows(bus_oid):
+            yield json.dumps(row, separators=(",", ":")) + "\n"
+
+    async def csv_lines():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        async for row in _manifest_rows(bus_oid):
+            writer.writerow(row)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.getvalue():
+            yield buf.getvalue()
+
+    if format == "csv":
+        return StreamingResponse(csv_lines(), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="manifest-{bus_id}.csv"'})
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.post("/checkins/{bus_id}")
+async def sync_checkins(bus_id: str, payload: CheckinSyncRequest):
+    """
+    Bulk upload of a device's offline check-ins. Tokens are verified by signature, then every check-in
+    is written with one bulk write; the earliest scan of a seat wins, so re-uploads are harmless.
+    """
+    bus_oid = _ensure_valid_bus_id(bus_id)
+    now = datetime.utcnow()
+    ops, rejected = [], []
+    for i, item in enumerate(payload.checkins):
+        ticket = verify_ticket(item.token, bus_id)
+        if ticket is None or not ObjectId.is_valid(ticket.booking_id):
+            rejected.append({"index": i, "reason": "invalid ticket"})
+            continue
+        seats = [item.seat_number] if item.seat_number else ticket.seats
+        if any(s not in ticket.seats for s in seats):
+            rejected.append({"index": i, "reason": "seat not on ticket"})
+            continue
+        at = item.checked_in_at or now
+        if at.tzinfo is not None:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        ops.append(UpdateOne({"_id": ObjectId(ticket.booking_id), "bus_id": {"$in": [bus_oid, str(bus_oid)]},
+                              "status": {"$nin": ["cancelled", "cancelling"]}},
+                             {"$min": {f"checkins.{s}": at for s in seats}}))
+    matched = 0
+    if ops:
+        result = await bookings_col.bulk_write(ops, ordered=False)
+        matched = result.matched_count
+    return {"accepted": matched, "not_found_or_cancelled": len(ops) - matched, "rejected": rejected}
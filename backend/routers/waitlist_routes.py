@@ -0,0 +1,65 @@
+# routers/waitlist_routes.py
+from fastapi import APIRouter, Depends, HTTPException
+from bson import ObjectId
+from routers.deps import get_current_user
+from models import WaitlistJoinRequest
+from db import buses_col, reservations_col, seats_col
+from waitlist import waitlist
+from routers.reservations_routes import _cancel_reservation
+
+router = APIRouter(prefix="/waitlist", tags=["waitlist"])
+
+
+def _ensure_valid_bus_id(bus_id: str):
+    if not ObjectId.is_valid(bus_id):
+        raise HTTPException(status_code=400, detail="Invalid bus id")
+    return ObjectId(bus_id)
+
+
+@router.post("/{bus_id}", status_code=201)
+async def join_waitlist(bus_id: str, payload: WaitlistJoinRequest, user=Depends(get_current_user)):
+    """
+    Wait for `count` seats on a (sold-out) bus. When seats free up they are reserved for the head of
+    the waitlist and the user is emailed; the entry then carries the offer's reservation id.
+    Refused (409) for departures not on sale and while `count` seats are free to select directly.
+    """
+    bus_oid = _ensure_valid_bus_id(bus_id)
+    bus = await buses_col.find_one({"_id": bus_oid}, {"status": 1})
+    if not bus:
+        raise HTTPException(status_code=404, detail="Bus not found")
+    if bus.get("status") == "finalized":
+        raise HTTPException(status_code=400, detail="Bus has departed")
+    if bus.get("status") == "cancelled":
+        raise HTTPException(status_code=409, detail="Departure cancelled")
+    if bus.get("status") != "published":
+        raise HTTPException(status_code=409, detail="Departure not on sale")
+    # free seats go through select (and admission), not through a waitlist offer
+    free = await seats_col.count_documents({"bus_id": bus_oid, "status": "available"})
+    if free >= payload.count:
+        raise HTTPException(status_code=409, detail=f"{free} seats are free; select them instead")
+    return await waitlist.join(bus_id, user, payload.count)
+
+
+@router.get("/{bus_id}")
+async def waitlist_status(bus_id: str, user=Depends(get_current_user)):
+    """The user's entry: position while waiting, the held seats once offered."""
+    _ensure_valid_bus_id(bus_id)
+    entry = await waitlist.get(bus_id, str(user["_id"]))
+    if not entry:
+        raise HTTPException(status_code=404, detail="Not on the waitlist")
+    return await waitlist.describe(entry)
+
+
+@router.delete("/{bus_id}")
+async def leave_waitlist(bus_id: str, user=Depends(get_current_user)):
+    """Leave the waitlist; a pending offer is released to the next entry."""
+    _ensure_valid_bus_id(bus_id)
+    entry = await waitlist.get(bus_id, str(user["_id"]))
+    if not entry:
+        raise HTTPException(status_code=404, detail="Not on the waitlist")
+    await waitlist.leave(entry)
+    if entry.get("reservation_id"):
+        reservation = await reservations_col.find_one({"_id": ObjectId(entry["reservation_id"]), "status": "pending"})
+        if reservation:
+            await _cancel_reservation(reservation)
+    return {"status": "cancelled"}
@@ -0,0 +1,232 @@
+# seat_allocator.py
+"""
+asyncio-native seat allocation, one actor per bus.
+
+Every select / confirm / release for a bus is queued on that bus's actor. The actor drains its
+queue in batches: all commands that arrived while the previous batch was being written are decided
+together, in arrival order, against the in-memory holds, then applied with one bulk_write
+(releases first, then selects and confirms). Only when the write modified fewer seats than decided
+(another worker got there first) is one verification read issued to find which commands lost.
+
+No locks are taken on the event loop: the actor is the only writer of its bus's holds, and the
+MongoDB filters (status / reserved_by_reservation_id) stay the source of truth across workers.
+Holds carry the reservation's expiry, so a hold whose release ran on another worker stops
+blocking the seat once the reservation has expired.
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateMany
+from db import seats_col
+from event_bus import event_bus
+from metrics import registry, seat_lock_contention_total
+
+MAX_BATCH = 256
+
+allocator_batch_size = registry.histogram("seat_allocator_batch_size", "Commands decided per allocator batch",
+                                          buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+def _bus_oid(bus_id):
+    if isinstance(bus_id, ObjectId):
+        return bus_id
+    return ObjectId(bus_id) if ObjectId.is_valid(bus_id) else bus_id
+
+
+class _Command:
+    __slots__ = ("kind", "seats", "reservation_id", "expires_at", "booking_id", "future")
+
+    def __init__(self, kind: str, seats: List[str], reservation_id: str, expires_at=None, booking_id=None):
+        self.kind = kind
+        self.seats = list(seats)
+        self.reservation_id = reservation_id
+        self.expires_at = expires_at
+        self.booking_id = booking_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class BusActor:
+    def __init__(self, bus_id: str):
+        self.bus_id = bus_id
+        self.bus_oid = _bus_oid(bus_id)
+        self.holds: Dict[str, Tuple[str, Optional[datetime]]] = {}   # seat -> (reservation id, expires_at)
+        self._pending: List[_Command] = []
+        self._running = False
+
+    def submit(self, cmd: _Command) -> asyncio.Future:
+        self._pending.append(cmd)
+        if not self._running:
+            self._running = True
+            asyncio.get_running_loop().create_task(self._drain())
+        return cmd.future
+
+    async def _drain(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending[:MAX_BATCH], self._pending[MAX_BATCH:]
+                allocator_batch_size.observe(len(batch))
+                try:
+                    await self._process(batch)
+                except Exception as e:
+                    for cmd in batch:
+                        if not cmd.future.done():
+                            cmd.future.set_exception(e)
+        finally:
+            self._running = False
+
+    def _held_by_other(self, seat: str, reservation_id: str, now: datetime) -> bool:
+        hold = self.holds.get(seat)
+        if hold is None or hold[0] == reservation_id:
+            return False
+        if hold[1] is not None and hold[1] <= now:
+            del self.holds[seat]   # expired; its release may have run on another worker
+            return False
+        return True
+
+    async def _process(self, batch: List[_Command]):
+        now = datetime.utcnow()
+        releases: List[UpdateMany] = []
+        writes: List[UpdateMany] = []   # selects and confirms, in arrival order
+        granted: List[_Command] = []
+
+        # decide in arrival order against the holds
+        for cmd in batch:
+            rid = cmd.reservation_id
+            if cmd.kind == "release":
+                for s in cmd.seats:
+                    if self.holds.get(s, (None,))[0] == rid:
+                        del self.holds[s]
+                releases.append(UpdateMany(
+                    {"bus_id": self.bus_oid, "seat_number": {"$in": cmd.seats}, "status": "reserved",
+                     "reserved_by_reservation_id": rid},
+                    {"$set": {"status": "available", "reserved_by_reservation_id": None}}))
+            elif cmd.kind == "select":
+                conflicts = [s for s in cmd.seats if self._held_by_other(s, rid, now)]
+                if conflicts:
+                    cmd.future.set_result((False, conflicts))
+                    continue
+                for s in cmd.seats:
+                    self.holds[s] = (rid, cmd.expires_at)
+                granted.append(cmd)
+                writes.append(UpdateMany(
+                    {"bus_id": self.bus_oid, "seat_number": {"$in": cmd.seats}, "status": "available"},
+                    {"$set": {"status": "reserved", "reserved_by_reservation_id": rid}}))
+            else:  # confirm
+                granted.append(cmd)
+                writes.append(UpdateMany(
+                    {"bus_id": self.bus_oid, "seat_number": {"$in": cmd.seats}, "status": "reserved",
+                     "reserved_by_reservation_id": rid},
+                    {"$set": {"status": "booked", "booked_by_booking_id": str(cmd.booking_id)}}))
+
+        if releases:
+            await seats_col.bulk_write(releases, ordered=False)
+            await event_bus.seats_changed(self.bus_id)
+            for cmd in batch:
+                if cmd.kind == "release":
+                    cmd.future.set_result(True)
+        if not writes:
+            return
+        try:
+            await self._write(granted, writes)
+        except Exception:
+            # _drain fails the futures; the holds of selects left without an answer must go with them,
+            # or seats selected without an expiry stay locked in this worker for good
+            for cmd in granted:
+                if cmd.kind == "select" and not cmd.future.done():
+                    self._drop_holds(cmd)
+            raise
+
+    async def _write(self, granted: List[_Command], writes: List[UpdateMany]):
+        result = await seats_col.bulk_write(writes, ordered=True)
+        # announced after the write: a subscriber rebuilding from the database must see it
+        await event_bus.seats_changed(self.bus_id)
+        expected = sum(len(c.seats) for c in granted)
+        if result.modified_count == expected:
+            for cmd in granted:
+                self._succeeded(cmd)
+            return
+
+        # some seats were taken elsewhere: one read tells which commands got all their seats
+        seats = sorted({s for c in granted for s in c.seats})
+        owner: Dict[str, Any] = {}
+        async for doc in seats_col.find({"bus_id": self.bus_oid, "seat_number": {"$in": seats}},
+                                        {"seat_number": 1, "status": 1, "reserved_by_reservation_id": 1, "booked_by_booking_id": 1}):
+            owner[doc["seat_number"]] = doc
+        lost: List[UpdateMany] = []
+        for cmd in granted:
+            if cmd.kind == "select":
+                mine = [s for s in cmd.seats if owner.get(s, {}).get("status") == "reserved"
+                        and owner[s].get("reserved_by_reservation_id") == cmd.reservation_id]
+                if len(mine) == len(cmd.seats):
+                    self._succeeded(cmd)
+                    continue
+                if mine:
+                    lost.append(UpdateMany(
+                        {"bus_id": self.bus_oid, "seat_number": {"$in": mine}, "reserved_by_reservation_id": cmd.reservation_id},
+                        {"$set": {"status": "available", "reserved_by_reservation_id": None}}))
+                self._drop_holds(cmd)
+                cmd.future.set_result((False, [s for s in cmd.seats if s not in mine]))
+            else:
+                booked = all(owner.get(s, {}).get("booked_by_booking_id") == str(cmd.booking_id) for s in cmd.seats)
+                if booked:
+                    self._succeeded(cmd)
+                else:
+                    cmd.future.set_result(False)
+        if lost:
+            await seats_col.bulk_write(lost, ordered=False)
+
+    def _succeeded(self, cmd: _Command):
+        if cmd.kind == "select":
+            cmd.future.set_result((True, []))
+        else:
+            self._drop_holds(cmd)
+            cmd.future.set_result(True)
+
+    def _drop_holds(self, cmd: _Command):
+        for s in cmd.seats:
+            if self.holds.get(s, (None,))[0] == cmd.reservation_id:
+                del self.holds[s]
+
+    @property
+    def idle(self) -> bool:
+        return not self._running and not self._pending and not self.holds
+
+
+class SeatAllocator:
+    """Entry point shared by the routes and the scheduler (one instance per worker)."""
+
+    def __init__(self):
+        self._actors: Dict[str, BusActor] = {}
+
+    def _actor(self, bus_id) -> BusActor:
+        key = str(bus_id)
+        actor = self._actors.get(key)
+        if actor is None:
+            if len(self._actors) > 1000:
+                self._actors = {k: a for k, a in self._actors.items() if not a.idle}
+            actor = self._actors[key] = BusActor(key)
+        return actor
+
+    async def select(self, bus_id, seats: List[str], reservation_id: str, expires_at: Optional[datetime] = None) -> Tuple[bool, List[str]]:
+        """Reserve all seats for the reservation or none; returns (ok, conflicting seats)."""
+        ok, conflicts = await self._actor(bus_id).submit(_Command("select", seats, reservation_id, expires_at=expires_at))
+        if not ok:
+            seat_lock_contention_total.inc()
+        return ok, conflicts
+
+    async def confirm(self, bus_id, seats: List[str], reservation_id: str, booking_id) -> bool:
+        """Turn the reservation's seats into booked seats; False if any is no longer reserved by it."""
+        return await self._actor(bus_id).submit(_Command("confirm", seats, reservation_id, booking_id=booking_id))
+
+    async def release(self, bus_id, seats: List[str], reservation_id: str):
+        """Free the seats still reserved by the reservation."""
+        await self._actor(bus_id).submit(_Command("release", seats, reservation_id))
+
+    def held_seats(self) -> int:
+        return sum(len(a.holds) for a in self._actors.values())
+
+
+seat_allocator = SeatAllocator()
+
+registry.gauge("seat_locks_held", "Seats held in memory by pending reservations", fn=seat_allocator.held_seats)
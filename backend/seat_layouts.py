@@ -0,0 +1,254 @@
+# seat_layouts.py
+"""
+Seat layout templates.
+
+A template describes where seats sit in a bus (side / row / col, deck and seat type).
+Built-in templates are sized by the bus's seats_count; custom templates are stored once in
+the `seat_layouts` collection as an explicit row/column map and referenced by name from buses.
+
+The seat skeleton (every seat document minus bus_id) is computed once per template and cached,
+so creating a bus only has to stamp its id onto copies of the cached documents.
+"""
+import base64
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from db import seat_layouts_col, seats_col
+from models import MAX_BUS_SEATS
+
+DEFAULT_LAYOUT = "2+2"
+
+# name -> (left seats per row, right seats per row, number of decks, seat type)
+BUILTIN_LAYOUTS: Dict[str, Tuple[int, int, int, str]] = {
+    "2+2": (2, 2, 1, "seater"),
+    "2+1": (2, 1, 1, "seater"),
+    "sleeper": (1, 2, 2, "sleeper"),
+    "double-decker": (2, 2, 2, "seater"),
+}
+
+# characters accepted in custom row maps
+SEAT_CELL = "S"
+BERTH_CELL = "B"
+GAP_CELL = "."
+AISLE_CELL = "|"
+
+# custom template name -> cached skeleton
+_custom_skeletons: Dict[str, Tuple[Dict[str, Any], ...]] = {}
+
+
+def _seat(number: int, side: str, row: int, col: int, deck: int, seat_type: str) -> Dict[str, Any]:
+    return {
+        "seat_number": str(number),
+        "status": "available",
+        "reserved_by_reservation_id": None,
+        "booked_by_booking_id": None,
+        "side": side,
+        "row": row,
+        "col": col,
+        "deck": deck,
+        "seat_type": seat_type,
+    }
+
+
+@lru_cache(maxsize=128)
+def _builtin_skeleton(name: str, seats_count: int) -> Tuple[Dict[str, Any], ...]:
+    """
+    Lay out `seats_count` seats row-wise (left seats then right seats per row).
+    Multi-deck templates split the rows between decks; row numbers keep counting on the upper deck
+    so (row, side, col) stays unique across the bus.
+    """
+    left, right, decks, seat_type = BUILTIN_LAYOUTS[name]
+    per_row = left + right
+    total_rows = -(-seats_count // per_row)
+    rows_per_deck = -(-total_rows // decks)
+
+    seats = []
+    seat_counter = 1
+    for row in range(1, total_rows + 1):
+        deck = (row - 1) // rows_per_deck + 1
+        for side, cols in (("left", left), ("right", right)):
+            for col in range(1, cols + 1):
+                if seat_counter > seats_count:
+                    break
+                seats.append(_seat(seat_counter, side, row, col, deck, seat_type))
+                seat_counter += 1
+    return tuple(seats)
+
+
+def parse_row_map(decks: List[List[str]]) -> Tuple[Dict[str, Any], ...]:
+    """
+    Build a skeleton from an explicit row/column map, one list of row strings per deck.
+    In each row 'S' is a seat, 'B' a berth, '.' an empty slot and '|' the aisle; cells before the
+    aisle are on the left side, cells after it on the right. Rows without an aisle are all left.
+    """
+    seats = []
+    seat_counter = 1
+    row = 0
+    for deck_idx, rows in enumerate(decks, start=1):
+        for line in rows:
+            row += 1
+            left_part, _, right_part = line.partition(AISLE_CELL)
+            for side, cells in (("left", left_part), ("right", right_part)):
+                for col, cell in enumerate(cells, start=1):
+                    if cell == GAP_CELL:
+                        continue
+                    if cell not in (SEAT_CELL, BERTH_CELL):
+                        raise ValueError(f"Invalid cell {cell!r} in row {row}")
+                    seat_type = "sleeper" if cell == BERTH_CELL else "seater"
+                    seats.append(_seat(seat_counter, side, row, col, deck_idx, seat_type))
+                    seat_counter += 1
+    if not seats:
+        raise ValueError("Layout has no seats")
+    return tuple(seats)
+
+
+async def get_seat_skeleton(layout: Optional[str], seats_count: int) -> Tuple[Dict[str, Any], ...]:
+    """
+    Return the cached skeleton for a layout. Built-in layouts are sized by seats_count,
+    custom layouts have a fixed capacity and ignore it.
+    Raises KeyError if the layout is unknown.
+    """
+    name = layout or DEFAULT_LAYOUT
+    if name in BUILTIN_LAYOUTS:
+        return _builtin_skeleton(name, seats_count)
+
+    skeleton = _custom_skeletons.get(name)
+    if skeleton is None:
+        doc = await seat_layouts_col.find_one({"_id": name})
+        if not doc:
+            raise KeyError(name)
+        skeleton = parse_row_map(doc["decks"])
+        _custom_skeletons[name] = skeleton
+    return skeleton
+
+
+def stamp_seats(skeleton: Tuple[Dict[str, Any], ...], bus_obj_id: ObjectId) -> List[Dict[str, Any]]:
+    """Copy the skeleton for one bus. Copies are required because insert_many adds _id in place."""
+    created_at = datetime.utcnow()
+    return [{**s, "bus_id": bus_obj_id, "created_at": created_at} for s in skeleton]
+
+
+async def list_layouts() -> List[Dict[str, Any]]:
+    out = []
+    for name, (left, right, decks, seat_type) in BUILTIN_LAYOUTS.items():
+        out.append({"name": name, "builtin": True, "left": left, "right": right, "decks": decks, "seat_type": seat_type})
+    async for doc in seat_layouts_col.find({}):
+        out.append({
+            "name": doc["_id"],
+            "builtin": False,
+            "decks": doc["decks"],
+            "capacity": doc.get("capacity"),
+            "created_at": doc.get("created_at"),
+        })
+    return out
+
+
+class LayoutExists(ValueError):
+    """A custom layout with this name is already stored."""
+
+
+async def create_layout(name: str, decks: List[List[str]]) -> Dict[str, Any]:
+    """
+    Store a custom template. Templates are immutable once created (buses reference them by name),
+    so an existing name is rejected with LayoutExists; reserved names, parse errors and templates with
+    more than MAX_BUS_SEATS seats raise ValueError.
+    """
+    if name in BUILTIN_LAYOUTS:
+        raise ValueError("Layout name is reserved")
+    skeleton = parse_row_map(decks)
+    if len(skeleton) > MAX_BUS_SEATS:
+        raise ValueError(f"Layout has {len(skeleton)} seats; a bus has at most {MAX_BUS_SEATS}")
+    doc = {"_id": name, "decks": decks, "capacity": len(skeleton), "created_at": datetime.utcnow()}
+    try:
+        await seat_layouts_col.insert_one(doc)
+    except DuplicateKeyError:
+        raise LayoutExists("Layout already exists")
+    _custom_skeletons[name] = skeleton
+    return {"name": name, "capacity": len(skeleton)}
+
+
+# --- seat map: static layout vs dynamic status ---
+
+# 2-bit status codes packed 4 seats per byte in the status bitmap
+STATUS_CODES = {"available": 0, "reserved": 1, "booked": 2}
+UNKNOWN_STATUS_CODE = 3
+
+# bus id string -> cached layout (version, seat order, seat index, public payload)
+_bus_layouts: Dict[str, Dict[str, Any]] = {}
+
+
+def _seat_sort_key(seat_number: str):
+    try:
+        return (0, int(seat_number), "")
+    except (TypeError, ValueError):
+        return (1, 0, str(seat_number))
+
+
+async def load_bus_layout(bus: Dict[str, Any], force: bool = False) -> Dict[str, Any]:
+    """
+    Return the static layout of a bus: its seats in position order without status.
+    Cached per bus and layout_version (bumped whenever the seats are recreated).
+    """
+    bus_id = str(bus["_id"])
+    version = int(bus.get("layout_version", 0))
+    cached = _bus_layouts.get(bus_id)
+    if cached and cached["version"] == version and not force:
+        return cached
+
+    projection = {"_id": 0, "seat_number": 1, "side": 1, "row": 1, "col": 1, "deck": 1, "seat_type": 1}
+    seats = [s async for s in seats_col.find({"bus_id": bus["_id"]}, projection)]
+    seats.sort(key=lambda s: _seat_sort_key(s.get("seat_number")))
+    order = [str(s.get("seat_number")) for s in seats]
+    layout = {
+        "version": version,
+        "order": order,
+        "index": {n: i for i, n in enumerate(order)},
+        "payload": {
+            "bus_id": bus_id,
+            "layout": bus.get("layout") or DEFAULT_LAYOUT,
+            "version": version,
+            "seats": [
+                {
+                    "seat_number": str(s.get("seat_number")),
+                    "side": s.get("side"),
+                    "row": s.get("row"),
+                    "col": s.get("col"),
+                    "deck": s.get("deck", 1),
+                    "seat_type": s.get("seat_type", "seater"),
+                }
+                for s in seats
+            ],
+        },
+    }
+    _bus_layouts[bus_id] = layout
+    return layout
+
+
+def cached_bus_layout(bus_id: str) -> Optional[Dict[str, Any]]:
+    return _bus_layouts.get(bus_id)
+
+
+def invalidate_bus_layout(bus_id: str):
+    _bus_layouts.pop(str(bus_id), None)
+
+
+def encode_status_bitmap(codes: List[int]) -> str:
+    """Pack 2-bit status codes (seat i in bits 2*(i%4) of byte i//4) and base64 them."""
+    packed = bytearray((len(codes) + 3) // 4)
+    for i, code in enumerate(codes):
+        packed[i >> 2] |= code << ((i & 3) << 1)
+    return base64.b64encode(bytes(packed)).decode("ascii")
+
+
+def encode_status_rle(codes: List[int]) -> str:
+    """Run-length encode status codes as "<code>x<count>" runs, e.g. "0x12,2x3,0x25"."""
+    runs = []
+    for code in codes:
+        if runs and runs[-1][0] == code:
+            runs[-1][1] += 1
+        else:
+            runs.append([code, 1])
+    return ",".join(f"{c}x{n}" for c, n in runs)
@@ -0,0 +1,62 @@
+# tests/test_query_budgets.py
+"""
+MongoDB command budgets for the hot request paths (see query_tracer.assert_max_queries).
+The budgets are what the endpoints issue today; a change that adds a query per booking or
+per seat fails here with the query breakdown.
+"""
+import pytest
+from query_tracer import assert_max_queries, current_trace
+
+# user, bookings, archived bookings, buses $in, routes $in
+MY_BOOKINGS_BUDGET = 5
+CONFIRM_BUDGET = 13
+
+
+def _select(loop, client, headers, bus_id, seats):
+    r = loop.run_until_complete(client.post(f"/reservations/select/{bus_id}", json={"seat_numbers": seats}, headers=headers))
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _confirm(loop, client, headers, reservation_id, seats):
+    passengers = [{"seat_number": s, "name": f"P{s}", "email": "p@test.io", "mobile": "1"} for s in seats]
+    r = loop.run_until_complete(
+        client.post(f"/reservations/confirm/{reservation_id}", json={"passengers": passengers}, headers=headers)
+    )
+    assert r.status_code == 201, r.text
+    return r
+
+
+def test_assert_max_queries_counts_direct_commands():
+    with assert_max_queries(1):
+        current_trace().started(1, ("bookings", "find", "{}"))
+
+    with pytest.raises(AssertionError, match="expected at most 1 queries"):
+        with assert_max_queries(1):
+            current_trace().started(1, ("bookings", "find", "{}"))
+            current_trace().started(2, ("bookings", "find", "{}"))
+
+
+def test_my_bookings_query_count_does_not_grow_with_bookings(client, loop, make_bus, make_user):
+    user = make_user()
+    bus_ids = [make_bus(), make_bus()]
+    counts = []
+    for n, seats in enumerate((["1"], ["2"], ["3", "4"])):
+        _confirm(loop, client, user, _select(loop, client, user, bus_ids[n % 2], seats), seats)
+
+        with assert_max_queries(MY_BOOKINGS_BUDGET) as traces:
+            r = loop.run_until_complete(client.get("/users/me/bookings", headers=user))
+        assert r.status_code == 200
+        assert len(r.json()["bookings"]) == n + 1
+        counts.append(traces[0].count)
+
+    assert len(set(counts)) == 1, counts
+
+
+def test_confirm_query_budget(client, loop, make_bus, make_user):
+    user = make_user()
+    bus_id = make_bus()
+    for seats in (["1"], ["2", "3", "4"]):
+        reservation_id = _select(loop, client, user, bus_id, seats)
+        with assert_max_queries(CONFIRM_BUDGET):
+            _confirm(loop, client, user, reservation_id, seats)
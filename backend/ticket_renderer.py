@@ -0,0 +1,155 @@
+# ticket_renderer.py
+"""
+E-ticket rendering off the event loop, rendered once per booking version.
+
+Rendering (utils/ticket_templates.py: HTML with an SVG QR code, PDF with reportlab) is CPU work, so
+it runs in a ProcessPoolExecutor of TICKET_RENDER_WORKERS processes ("spawn": children do not
+inherit the app's event loop or Mongo client); at most TICKET_RENDER_MAX_PENDING renders are
+submitted at a time, the rest wait on a semaphore.
+
+Output is content-addressed: the key is a hash of the template version, format, booking id, status
+and ticket token, so a booking is rendered once per format until it changes (cancellation, new
+token) and the key doubles as the HTTP ETag. Rendered files are kept in ticket_renders (shared by
+all workers, expiring TICKET_CACHE_DAYS after rendering); concurrent requests for the same key on a
+worker share one render.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+from bson import Binary, ObjectId
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import archive_buses_col, buses_col, routes_col, ticket_renders_col
+from metrics import registry
+from tickets import QR_PREFIX
+from utils.email_utils import send_email_async
+from utils.ticket_templates import PDF_AVAILABLE, TEMPLATE_VERSION, render
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"html": "text/html", "pdf": "application/pdf"}   # the response adds charset=utf-8 to text types
+
+renders_total = registry.counter("ticket_renders_total", "E-tickets rendered (cache misses) by format", ("format",))
+render_cache_hits = registry.counter("ticket_render_cache_hits_total", "E-tickets served from the render cache", ("format",))
+
+
+class RenderedTicket(NamedTuple):
+    key: str
+    content: bytes
+    media_type: str
+
+
+def formats() -> List[str]:
+    return ["html", "pdf"] if PDF_AVAILABLE else ["html"]
+
+
+def cache_key(booking: Dict[str, Any], fmt: str) -> str:
+    raw = f"{TEMPLATE_VERSION}:{fmt}:{booking['_id']}:{booking.get('status') or 'confirmed'}:{booking.get('ticket_token')}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+async def _context(booking: Dict[str, Any]) -> Dict[str, Any]:
+    bus_id = booking.get("bus_id")
+    bus_oid = ObjectId(bus_id) if isinstance(bus_id, str) and ObjectId.is_valid(bus_id) else bus_id
+    bus = await buses_col.find_one({"_id": bus_oid})
+    if bus is None:
+        archived = await archive_buses_col.find_one({"_id": bus_oid}, {"bus": 1})
+        bus = archived["bus"] if archived else {}
+    src, dst = bus.get("src_city") or bus.get("route_src"), bus.get("dst_city") or bus.get("route_dst")
+    route_id = bus.get("route_id")
+    if route_id and not (src and dst):
+        route = await routes_col.find_one({"_id": ObjectId(route_id) if ObjectId.is_valid(str(route_id)) else route_id})
+        if route:
+            src, dst = src or route.get("src_city"), dst or route.get("dst_city")
+    start = bus.get("start_time")
+    return {
+        "booking_id": str(booking["_id"]),
+        "pnr": booking.get("pnr") or str(booking["_id"])[-6:].upper(),
+        "status": booking.get("status") or "confirmed",
+        "src": src or "",
+        "dst": dst or "",
+        "bus_name": bus.get("name") or "",
+        "departure": start.strftime("%Y-%m-%d %H:%M UTC") if isinstance(start, datetime) else "",
+        "passengers": [{"seat_number": p.get("seat_number"), "name": p.get("passenger_name") or p.get("name")}
+                       for p in booking.get("passengers") or []],
+        "total_price": float(booking.get("total_price") or 0.0),
+        "qr_payload": QR_PREFIX + (booking.get("ticket_token") or str(booking["_id"])),
+    }
+
+
+class TicketRenderer:
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=settings.TICKET_RENDER_WORKERS,
+                                             mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(settings.TICKET_RENDER_MAX_PENDING)
+        return self._pool
+
+    async def _render(self, fmt: str, booking: Dict[str, Any]) -> bytes:
+        ctx = await _context(booking)
+        pool = self._executor()
+        async with self._slots:
+            try:
+                content = await asyncio.get_running_loop().run_in_executor(pool, render, fmt, ctx)
+            except BrokenProcessPool:
+                # a renderer process died (OOM, crash): start a fresh pool for the next render
+                if self._pool is pool:
+                    self._pool = None
+                pool.shutdown(wait=False)
+                raise
+        renders_total.inc(format=fmt)
+        return content
+
+    async def get(self, booking: Dict[str, Any], fmt: str) -> RenderedTicket:
+        """The booking's e-ticket in this format, from the cache or rendered (once) in the pool."""
+        key = cache_key(booking, fmt)
+        cached = await ticket_renders_col.find_one({"_id": key}, {"content": 1})
+        if cached is not None:
+            render_cache_hits.inc(format=fmt)
+            return RenderedTicket(key, bytes(cached["content"]), MEDIA_TYPES[fmt])
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(self._render(fmt, booking))
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        content = await asyncio.shield(future)
+        try:
+            await ticket_renders_col.insert_one({"_id": key, "booking_id": booking["_id"], "format": fmt,
+                                                 "content": Binary(content), "created_at": datetime.utcnow()})
+        except DuplicateKeyError:
+            pass   # rendered concurrently by another request or worker
+        return RenderedTicket(key, content, MEDIA_TYPES[fmt])
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+ticket_renderer = TicketRenderer()
+
+
+async def email_ticket(booking: Dict[str, Any], to_email: str, subject: str, body: str):
+    """Send the confirmation email with the e-ticket attached (PDF when available, else HTML)."""
+    attachments = []
+    fmt = formats()[-1]
+    try:
+        ticket = await ticket_renderer.get(booking, fmt)
+        attachments.append((f"ticket-{booking.get('pnr') or booking['_id']}.{fmt}", ticket.content, ticket.media_type))
+    except Exception:
+        logger.exception("ticket render failed, emailing without attachment", extra={"booking_id": str(booking["_id"])})
+    await send_email_async(to_email, subject, body, attachments=attachments)
+
+
+async def ensure_ticket_render_indexes():
+    await ticket_renders_col.create_index("created_at", expireAfterSeconds=settings.TICKET_CACHE_DAYS * 86400)
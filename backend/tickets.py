@@ -0,0 +1,102 @@
+# tickets.py
+"""
+Signed e-tickets that boarding staff can verify without a database call.
+
+confirm issues every booking a ticket token: base64url(JSON payload) + "." + base64url(HMAC-SHA256
+truncated to 16 bytes), the payload holding the booking id, bus id, seats, departure (unix seconds)
+and the booking's PNR. The PNR is a short human-readable code (TICKET_PNR_LENGTH Crockford base32
+characters derived from the booking id with the same key), the QR code carries QR_PREFIX + token.
+
+A conductor's device holding the ticket key checks a scanned token with verify_ticket() alone; the
+per-bus manifest (GET /tickets/manifest/{bus_id}, NDJSON or CSV, streamed) tells it which tokens
+belong to live bookings, and its check-ins are synced back in one bulk upload
+(POST /tickets/checkins/{bus_id}). The ticket key is handed out to devices, so it is never the JWT
+key: it is TICKET_SECRET (which must differ from JWT_SECRET) or, when unset, HMAC(JWT_SECRET,
+"busly ticket key"), which cannot be turned back into the JWT key.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional
+from config import settings
+
+QR_PREFIX = "BUSLY1:"
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+class Ticket(NamedTuple):
+    booking_id: str
+    bus_id: str
+    seats: List[str]
+    departure: int          # unix seconds
+    pnr: str
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _secret() -> bytes:
+    if settings.TICKET_SECRET:
+        if settings.TICKET_SECRET == settings.JWT_SECRET:
+            raise RuntimeError("TICKET_SECRET must differ from JWT_SECRET: the ticket key is shared with boarding devices")
+        return settings.TICKET_SECRET.encode()
+    return hmac.new(settings.JWT_SECRET.encode(), b"busly ticket key", hashlib.sha256).digest()
+
+
+def _mac(data: bytes) -> bytes:
+    return hmac.new(_secret(), data, hashlib.sha256).digest()
+
+
+def pnr_for(booking_id: Any) -> str:
+    """Short booking code: the first TICKET_PNR_LENGTH base32 characters of a MAC over the booking id."""
+    n = int.from_bytes(_mac(b"pnr:" + str(booking_id).encode())[:8], "big")
+    chars = []
+    for _ in range(settings.TICKET_PNR_LENGTH):
+        n, r = divmod(n, 32)
+        chars.append(CROCKFORD[r])
+    return "".join(chars)
+
+
+def _epoch(dt: Optional[datetime]) -> int:
+    if dt is None:
+        return 0
+    return int(dt.replace(tzinfo=timezone.utc).timestamp()) if dt.tzinfo is None else int(dt.timestamp())
+
+
+def issue_ticket(booking_id: Any, bus_id: Any, seats: List[str], departure: Optional[datetime]) -> Dict[str, str]:
+    """Token, PNR and QR payload for a booking (stored on the booking by confirm)."""
+    pnr = pnr_for(booking_id)
+    payload = _b64(json.dumps({"b": str(booking_id), "bus": str(bus_id), "s": list(seats), "t": _epoch(departure), "p": pnr},
+                              separators=(",", ":")).encode())
+    token = f"{payload}.{_b64(_mac(payload.encode())[:16])}"
+    return {"pnr": pnr, "ticket_token": token, "qr_payload": QR_PREFIX + token}
+
+
+def verify_ticket(token: str, bus_id: Optional[str] = None, now: Optional[datetime] = None) -> Optional[Ticket]:
+    """
+    The ticket if the signature checks out, it is for bus_id (when given) and its departure is less
+    than TICKET_VALID_HOURS ago; None otherwise. Accepts the raw token or the QR payload.
+    """
+    if token.startswith(QR_PREFIX):
+        token = token[len(QR_PREFIX):]
+    try:
+        payload, sig = token.split(".", 1)
+        if not hmac.compare_digest(sig, _b64(_mac(payload.encode())[:16])):
+            return None
+        data = json.loads(_unb64(payload))
+        ticket = Ticket(data["b"], data["bus"], list(data["s"]), int(data["t"]), data["p"])
+    except (ValueError, TypeError, KeyError):
+        return None
+    if bus_id is not None and ticket.bus_id != str(bus_id):
+        return None
+    now = now or datetime.utcnow()
+    if ticket.departure and _epoch(now - timedelta(hours=settings.TICKET_VALID_HOURS)) > ticket.departure:
+        return None
+    return ticket
@@ -1,54 +1,87 @@
-# utils/email_utils.py
-import smtplib
-from email.message import EmailMessage
-from typing import Optional
-from config import settings
-import logging
-
-logger = logging.getLogger("uvicorn.error")
-
-def send_email_sync(to_email: str, subject: str, body: str, html: Optional[str] = None) -> bool:
-    """
-    Synchronous email send using smtplib.
-    Returns True on success, False on failure.
-    """
-    host = getattr(settings, "SMTP_HOST", None)
-    port = getattr(settings, "SMTP_PORT", None)
-    user = getattr(settings, "SMTP_USER", None)
-    password = getattr(settings, "SMTP_PASSWORD", None)
-    from_addr = getattr(settings, "SMTP_FROM", None)
-    use_ssl = getattr(settings, "SMTP_USE_SSL", True)
-
-    if not host or not port or not from_addr:
-        logger.warning("SMTP not configured - skipping email send")
-        return False
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = from_addr
-    msg["To"] = to_email
-    msg.set_content(body)
-
-    if html:
-        msg.add_alternative(html, subtype="html")
-
-    try:
-        if use_ssl:
-            with smtplib.SMTP_SSL(host, port, timeout=30) as server:
-                if user and password:
-                    server.login(user, password)
-                server.send_message(msg)
-        else:
-            # STARTTLS flow
-            with smtplib.SMTP(host, port, timeout=30) as server:
-                server.ehlo()
-                server.starttls()
-                server.ehlo()
-                if user and password:
-                    server.login(user, password)
-                server.send_message(msg)
-        logger.info("Email sent to %s subject=%s", to_email, subject)
-        return True
-    except Exception as e:
-        logger.exception("Failed to send email to %s: %s", to_email, e)
-        return False
+# utils/email_utils.py
+import asyncio
+import smtplib
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+from config import settings
+from metrics import email_queue_depth, emails_sent_total
+import logging
+
+logger = logging.getLogger("uvicorn.error")
+
+Attachment = Tuple[str, bytes, str]   # filename, content, media type
+
+def send_email_sync(to_email: str, subject: str, body: str, html: Optional[str] = None,
+                    attachments: Optional[List[Attachment]] = None) -> bool:
+    """
+    Synchronous email send using smtplib.
+    Returns True on success, False on failure.
+    """
+    host = getattr(settings, "SMTP_HOST", None)
+    port = getattr(settings, "SMTP_PORT", None)
+    user = getattr(settings, "SMTP_USER", None)
+    password = getattr(settings, "SMTP_PASSWORD", None)
+    from_addr = getattr(settings, "SMTP_FROM", None)
+    use_ssl = getattr(settings, "SMTP_USE_SSL", True)
+
+    if not host or not port or not from_addr:
+        logger.warning("SMTP not configured - skipping email send")
+        emails_sent_total.inc(outcome="skipped")
+        return False
+
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = from_addr
+    msg["To"] = to_email
+    msg.set_content(body)
+
+    if html:
+        msg.add_alternative(html, subtype="html")
+
+    for filename, content, media_type in attachments or []:
+        maintype, _, subtype = media_type.split(";")[0].partition("/")
+        msg.add_attachment(content, maintype=maintype, subtype=subtype, filename=filename)
+
+    try:
+        if use_ssl:
+            with smtplib.SMTP_SSL(host, port, timeout=30) as server:
+                if user and password:
+                    server.login(user, password)
+                server.send_message(msg)
+        else:
+            # STARTTLS flow
+            with smtplib.SMTP(host, port, timeout=30) as server:
+                server.ehlo()
+                server.starttls()
+                server.ehlo()
+                if user and password:
+                    server.login(user, password)
+                server.send_message(msg)
+        logger.info("Email sent to %s subject=%s", to_email, subject)
+        emails_sent_total.inc(outcome="sent")
+        return True
+    except Exception as e:
+        logger.exception("Failed to send email to %s: %s", to_email, e)
+        emails_sent_total.inc(outcome="failed")
+        return False
+
+
+def _send_queued(to_email: str, subject: str, body: str, html: Optional[str] = None,
+                 attachments: Optional[List[Attachment]] = None) -> bool:
+    try:
+        return send_email_sync(to_email, subject, body, html, attachments)
+    finally:
+        email_queue_depth.dec()
+
+
+def queue_email(background_tasks, to_email: str, subject: str, body: str, html: Optional[str] = None):
+    """Schedule send_email_sync as a FastAPI background task, tracking the queue depth."""
+    email_queue_depth.inc()
+    background_tasks.add_task(_send_queued, to_email, subject, body, html)
+
+
+async def send_email_async(to_email: str, subject: str, body: str, html: Optional[str] = None,
+                           attachments: Optional[List[Attachment]] = None) -> bool:
+    """Send from code running outside a request (scheduler jobs, hand-offs) without blocking the event loop."""
+    email_queue_depth.inc()
+    return await asyncio.get_running_loop().run_in_executor(None, _send_queued, to_email, subject, body, html, attachments)
@@ -0,0 +1,40 @@
+# utils/json_response.py
+"""
+Fast JSON response class for hot handlers.
+
+Returning FastJSONResponse(content) from a handler bypasses FastAPI's jsonable_encoder walk;
+the content is serialized in one pass by orjson, which handles datetime natively. ObjectId values
+are stringified, so handlers can hand over Mongo documents without converting ids first.
+Falls back to the stdlib json module (slower, same output) when orjson is not installed.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,114 @@
+# utils/ticket_templates.py
+"""
+E-ticket templates (HTML and PDF), run inside the ticket renderer's worker processes.
+
+Pure functions of a plain-dict context (no database, no settings) so they can be pickled to a
+process pool. The QR code is drawn with qrcode (HTML, inline SVG) and reportlab's own QR widget
+(PDF); without qrcode the HTML shows the QR payload as text, without reportlab PDF rendering is
+unavailable (PDF_AVAILABLE).
+"""
+import html
+import io
+from typing import Any, Dict
+
+try:
+    import qrcode
+    import qrcode.image.svg
+except ImportError:  # pragma: no cover - qrcode is listed in requirements.txt
+    qrcode = None
+
+try:
+    from reportlab.graphics import renderPDF
+    from reportlab.graphics.barcode.qr import QrCodeWidget
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib.pagesizes import A5
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+    PDF_AVAILABLE = True
+except ImportError:  # pragma: no cover - reportlab is listed in requirements.txt
+    PDF_AVAILABLE = False
+
+TEMPLATE_VERSION = 1   # bump when the layout changes: every cached ticket is re-rendered
+
+
+def _qr_svg(data: str) -> str:
+    if qrcode is None:
+        return f'<code class="qr-text">{html.escape(data)}</code>'
+    img = qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage, box_size=8)
+    return img.to_string(encoding="unicode")
+
+
+def render_html(ctx: Dict[str, Any]) -> bytes:
+    e = lambda v: html.escape(str(v if v is not None else ""))
+    rows = "".join(f"<tr><td>{e(p['seat_number'])}</td><td>{e(p['name'])}</td></tr>" for p in ctx["passengers"])
+    cancelled = '<p class="cancelled">CANCELLED</p>' if ctx["status"] == "cancelled" else ""
+    page = f"""<!doctype html>
+<html><head><meta charset="utf-8"><title>Ticket {e(ctx['pnr'])}</title>
+<style>
+body{{font-family:sans-serif;max-width:640px;margin:2em auto;color:#222}}
+.pnr{{font-size:2em;letter-spacing:.15em;font-weight:bold}}
+.cancelled{{color:#b00;font-size:1.5em;font-weight:bold}}
+table{{border-collapse:collapse;width:100%}}td,th{{border-bottom:1px solid #ddd;padding:.4em;text-align:left}}
+.qr svg{{width:180px;height:180px}}
+</style></head><body>
+<h1>Busly e-ticket</h1>
+{cancelled}
+<p class="pnr">{e(ctx['pnr'])}</p>
+<p>{e(ctx['src'])} &rarr; {e(ctx['dst'])}<br>Departure: {e(ctx['departure'])}<br>Bus: {e(ctx['bus_name'])}</p>
+<table><tr><th>Seat</th><th>Passenger</th></tr>{rows}</table>
+<p>Total paid: &#8377;{ctx['total_price']:.2f}<br>Booking: {e(ctx['booking_id'])}</p>
+<div class="qr">{_qr_svg(ctx['qr_payload'])}</div>
+</body></html>"""
+    return page.encode("utf-8")
+
+
+def render_pdf(ctx: Dict[str, Any]) -> bytes:
+    if not PDF_AVAILABLE:
+        raise RuntimeError("reportlab is not installed")
+    buf = io.BytesIO()
+    width, height = A5
+    c = canvas.Canvas(buf, pagesize=A5, pageCompression=1)
+    c.setTitle(f"Ticket {ctx['pnr']}")
+    y = height - 20 * mm
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(15 * mm, y, "Busly e-ticket")
+    if ctx["status"] == "cancelled":
+        c.setFillColorRGB(0.7, 0, 0)
+        c.drawRightString(width - 15 * mm, y, "CANCELLED")
+        c.setFillColorRGB(0, 0, 0)
+    y -= 14 * mm
+    c.setFont("Helvetica-Bold", 24)
+    c.drawString(15 * mm, y, ctx["pnr"])
+    c.setFont("Helvetica", 11)
+    for line in (f"{ctx['src']} -> {ctx['dst']}", f"Departure: {ctx['departure']}", f"Bus: {ctx['bus_name']}"):
+        y -= 7 * mm
+        c.drawString(15 * mm, y, line)
+    y -= 10 * mm
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(15 * mm, y, "Seat")
+    c.drawString(35 * mm, y, "Passenger")
+    c.setFont("Helvetica", 11)
+    for p in ctx["passengers"]:
+        y -= 6 * mm
+        c.drawString(15 * mm, y, str(p["seat_number"]))
+        c.drawString(35 * mm, y, str(p["name"] or ""))
+    y -= 10 * mm
+    c.drawString(15 * mm, y, f"Total paid: Rs. {ctx['total_price']:.2f}    Booking: {ctx['booking_id']}")
+
+    size = 45 * mm
+    widget = QrCodeWidget(ctx["qr_payload"])
+    x0, y0, x1, y1 = widget.getBounds()
+    drawing = Drawing(size, size, transform=[size / (x1 - x0), 0, 0, size / (y1 - y0), 0, 0])
+    drawing.add(widget)
+    renderPDF.draw(drawing, c, width - size - 15 * mm, 15 * mm)
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+RENDERERS = {"html": render_html, "pdf": render_pdf}
+
+
+def render(fmt: str, ctx: Dict[str, Any]) -> bytes:
+    """Process pool entry point."""
+    return RENDERERS[fmt](ctx)
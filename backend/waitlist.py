@@ -0,0 +1,269 @@
+# waitlist.py
+"""
+Per-bus waitlist with automatic hand-off of freed seats.
+
+Entries live in `waitlist_col`, one per user and bus, ordered by (priority, created_at): lower
+priority values are served first (0 by default; ops can lower it to move an entry up).
+
+Whenever seats free up (a reservation expires or is cancelled, a booking is cancelled) the bus's
+waiting entries are scanned in order and each one whose seat count still fits is offered seats:
+a pending reservation held for WAITLIST_OFFER_SECONDS, reserved through the seat allocator like
+any other, and an email to the user. Confirming that reservation fulfils the entry; letting it
+expire or cancelling it lapses the entry and hands the seats to the next one.
+
+Entry status: waiting -> offering (claimed by one worker) -> offered -> fulfilled | lapsed,
+or cancelled when the user leaves. An 'offering' claim older than a minute is considered abandoned.
+Active entries carry active=True, which a unique partial index on (bus_id, user_id) keys on, so a
+user has at most one active entry per bus however many joins race; closing an entry unsets it.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import buses_col, waitlist_col
+from group_allocator import Preferences, free_seat_index, invalidate_free_seat_index
+from utils.email_utils import send_email_async
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ["waiting", "offering", "offered"]
+CLAIM_TIMEOUT_SECONDS = 60
+OFFER_ATTEMPTS = 3
+QUEUE_ORDER = [("priority", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]
+
+
+def closing_update(status: str) -> Dict[str, Any]:
+    """Update that closes an active entry with the given final status."""
+    return {"$set": {"status": status, "closed_at": datetime.utcnow()}, "$unset": {"active": ""}}
+
+
+def _claimable(now: datetime) -> Dict[str, Any]:
+    return {"$or": [{"status": "waiting"},
+                    {"status": "offering", "claimed_at": {"$lte": now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)}}]}
+
+
+class Waitlist:
+    def __init__(self):
+        self._running: Set[str] = set()
+        self._again: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    # --- entries ---
+
+    async def join(self, bus_id: str, user: Dict[str, Any], count: int) -> Dict[str, Any]:
+        """Add the user to the bus's waitlist (or return their active entry)."""
+        user_id = str(user["_id"])
+        entry = await self.get(bus_id, user_id)
+        if entry is None:
+            now = datetime.utcnow()
+            entry = {
+                "bus_id": bus_id,
+                "user_id": user_id,
+                "email": user.get("email"),
+                "count": count,
+                "priority": 0,
+                "status": "waiting",
+                "active": True,
+                # BSON dates have millisecond precision; truncate so positions computed from this dict match
+                "created_at": now.replace(microsecond=now.microsecond // 1000 * 1000),
+            }
+            try:
+                entry["_id"] = (await waitlist_col.insert_one(entry)).inserted_id
+            except DuplicateKeyError:
+                # a concurrent join won; report its entry
+                entry = await self.get(bus_id, user_id)
+                if entry is None:
+                    raise HTTPException(status_code=409, detail="Waitlist entry changed; try again")
+            else:
+                # seats may already be free (e.g. a lapsed offer nobody else wanted)
+                self.seats_freed(bus_id)
+        return await self.describe(entry)
+
+    async def get(self, bus_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await waitlist_col.find_one({"bus_id": bus_id, "user_id": user_id, "status": {"$in": ACTIVE_STATUSES}},
+                                           sort=[("created_at", -1)])
+
+    async def leave(self, entry: Dict[str, Any]):
+        await waitlist_col.update_one({"_id": entry["_id"], "status": {"$in": ACTIVE_STATUSES}}, closing_update("cancelled"))
+
+    async def describe(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        out = {
+            "id": str(entry["_id"]),
+            "bus_id": entry["bus_id"],
+            "count": entry["count"],
+            "status": entry["status"],
+            "created_at": entry["created_at"].isoformat(),
+        }
+        if entry["status"] == "waiting":
+            ahead = await waitlist_col.count_documents({
+                "bus_id": entry["bus_id"], "status": {"$in": ["waiting", "offering"]},
+                "$or": [{"priority": {"$lt": entry["priority"]}},
+                        {"priority": entry["priority"], "created_at": {"$lt": entry["created_at"]}},
+                        {"priority": entry["priority"], "created_at": entry["created_at"], "_id": {"$lt": entry["_id"]}}],
+            })
+            out["position"] = ahead + 1
+        elif entry["status"] == "offered":
+            out["offer"] = {
+                "reservation_id": entry["reservation_id"],
+                "seat_numbers": entry["seat_numbers"],
+                "expires_at": entry["offer_expires_at"].isoformat(),
+            }
+        return out
+
+    async def fulfilled(self, reservation_id: str):
+        await waitlist_col.update_one({"reservation_id": reservation_id, "status": "offered"}, closing_update("fulfilled"))
+
+    async def lapsed(self, reservation_ids: Iterable[str]):
+        """Offers whose reservation expired or was cancelled; the seats go to the next entry."""
+        ids = list(reservation_ids)
+        if ids:
+            await waitlist_col.update_many({"reservation_id": {"$in": ids}, "status": "offered"}, closing_update("lapsed"))
+
+    # --- hand-off ---
+
+    def seats_freed(self, bus_id):
+        """Schedule a hand-off for the bus without making the caller wait for it."""
+        task = asyncio.get_running_loop().create_task(self.hand_off(bus_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def hand_off(self, bus_id) -> int:
+        """
+        Offer the bus's free seats to waiting entries. Concurrent calls for one bus coalesce:
+        a call arriving while a hand-off runs makes it scan once more instead of racing it.
+        Returns the number of offers made.
+        """
+        key = str(bus_id)
+        if key in self._running:
+            self._again.add(key)
+            return 0
+        self._running.add(key)
+        offered = 0
+        try:
+            while True:
+                self._again.discard(key)
+                try:
+                    offered += await self._hand_off(key)
+                except Exception:
+                    logger.exception("waitlist hand-off failed", extra={"bus_id": key})
+                    break
+                if key not in self._again:
+                    break
+        finally:
+            self._running.discard(key)
+        return offered
+
+    async def _hand_off(self, bus_id: str) -> int:
+        if not ObjectId.is_valid(bus_id):
+            return 0
+        bus = await buses_col.find_one({"_id": ObjectId(bus_id)})
+        if not bus or bus.get("status") != "published":
+            return 0
+        now = datetime.utcnow()
+        cursor = waitlist_col.find({"bus_id": bus_id, **_claimable(now)}).sort(QUEUE_ORDER).limit(settings.WAITLIST_SCAN_LIMIT)
+        waiting = await cursor.to_list(length=settings.WAITLIST_SCAN_LIMIT)
+        if not waiting:
+            return 0
+
+        # the seats were just freed, so the cached index is stale by definition
+        invalidate_free_seat_index(bus_id)
+        index = await free_seat_index(bus)
+        offered = 0
+        for entry in waiting:
+            if len(index.free) < entry["count"]:
+                continue
+            claimed = await waitlist_col.find_one_and_update(
+                {"_id": entry["_id"], **_claimable(now)}, {"$set": {"status": "offering", "claimed_at": now}})
+            if not claimed:
+                continue
+            made = False
+            try:
+                made = await self._offer(bus, index, entry)
+            finally:
+                if made:
+                    offered += 1
+                else:
+                    await waitlist_col.update_one({"_id": entry["_id"], "status": "offering"},
+                                                  {"$set": {"status": "waiting"}, "$unset": {"claimed_at": ""}})
+            if not index.free:
+                break
+        return offered
+
+    async def _offer(self, bus: Dict[str, Any], index, entry: Dict[str, Any]) -> bool:
+        # imported here: the reservation routes import this module
+        from routers.reservations_routes import _reserve
+
+        for _ in range(OFFER_ATTEMPTS):
+            candidates = index.candidates(entry["count"], Preferences(), allow_split=True)
+            if not candidates:
+                return False
+            _, seats = candidates[0]
+            try:
+                res = await _reserve(bus, seats, {"_id": entry["user_id"]},
+                                     ttl_seconds=settings.WAITLIST_OFFER_SECONDS, waitlist_id=entry["_id"])
+            except HTTPException as e:
+                # only a seat conflict is worth another pick; anything else (e.g. the departure was
+                # cancelled meanwhile) ends the hand-off
+                if e.status_code != 409 or not isinstance(e.detail, dict):
+                    raise
+                index.take(e.detail.get("conflicting_seats") or seats)
+                continue
+            index.take(seats)
+            expires_at = datetime.fromisoformat(res["expires_at"])
+            await waitlist_col.update_one({"_id": entry["_id"]}, {"$set": {
+                "status": "offered",
+                "reservation_id": res["id"],
+                "seat_numbers": seats,
+                "offered_at": datetime.utcnow(),
+                "offer_expires_at": expires_at,
+            }})
+            logger.info("waitlist offer made", extra={"bus_id": res["bus_id"], "reservation_id": res["id"], "seats": seats})
+            if entry.get("email"):
+                self._notify(entry["email"], bus, seats, res["id"], expires_at)
+            return True
+        return False
+
+    def _notify(self, email: str, bus: Dict[str, Any], seats: List[str], reservation_id: str, expires_at: datetime):
+        start_time = bus.get("start_time")
+        subject = f"Seats available on {bus.get('name') or 'your bus'}"
+        body = f"""Good news - seats opened up on a bus you are waitlisted for.
+
+Bus: {bus.get('name') or bus['_id']}{f" departing {start_time.isoformat()}" if isinstance(start_time, datetime) else ""}
+Seats held for you: {', '.join(seats)}
+Reservation: {reservation_id}
+Hold expires at: {expires_at.isoformat()} UTC
+
+Confirm the reservation before it expires, or the seats go to the next person on the waitlist.
+
+BusBooking Team
+"""
+        task = asyncio.get_running_loop().create_task(send_email_async(email, subject, body))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+waitlist = Waitlist()
+
+
+async def ensure_waitlist_indexes():
+    await waitlist_col.create_index([("bus_id", ASCENDING), ("status", ASCENDING)] + QUEUE_ORDER)
+    await waitlist_col.create_index("reservation_id", sparse=True)
+
+    # entries from before the active flag: mark them, and close all but the oldest duplicate
+    await waitlist_col.update_many({"status": {"$in": ACTIVE_STATUSES}, "active": {"$exists": False}},
+                                   {"$set": {"active": True}})
+    duplicates = waitlist_col.aggregate([
+        {"$match": {"active": True}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": {"bus_id": "$bus_id", "user_id": "$user_id"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ])
+    async for group in duplicates:
+        await waitlist_col.update_many({"_id": {"$in": group["ids"][1:]}}, closing_update("cancelled"))
+    await waitlist_col.create_index([("bus_id", ASCENDING), ("user_id", ASCENDING)], unique=True,
+                                    partialFilterExpression={"active": True})
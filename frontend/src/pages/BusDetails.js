@@ -140,9 +140,11 @@ export default function BusDetails() {
     try {
       console.log("Reserving seats:", Array.from(selected), "for bus:", busId);
       
+      // waiting-room ticket from an earlier 429, if any
+      const ticket = localStorage.getItem(`queue_ticket_${busId}`);
       const res = await api.post(`/reservations/select/${busId}`, {
         seat_numbers: Array.from(selected)
-      });
+      }, ticket ? { headers: { "X-Queue-Ticket": ticket } } : undefined);
       
       console.log("Reservation response:", res.data);
       
@@ -168,7 +170,17 @@ export default function BusDetails() {
       const errorData = error.response?.data;
       let errorMessage = "Failed to reserve seats";
       
-      if (errorData) {
+      if (error.response?.status === 429) {
+        // sales rush: keep our place in the queue and tell the user when to retry
+        const queue = errorData?.detail;
+        if (queue && queue.ticket) {
+          localStorage.setItem(`queue_ticket_${busId}`, queue.ticket);
+          errorMessage = `High demand right now. You are number ${queue.position} in line; try again in about ${queue.eta_seconds}s.`;
+        } else {
+          const retry = error.response.headers?.["retry-after"];
+          errorMessage = `Too many people are booking this bus. Please try again${retry ? ` in ${retry}s` : " shortly"}.`;
+        }
+      } else if (errorData) {
         if (typeof errorData === 'string') {
           errorMessage = errorData;
         } else if (errorData.detail) {
@@ -263,9 +275,9 @@ export default function BusDetails() {
             <strong>Departure:</strong> {new Date(bus.start_time).toLocaleString()}
           </div>
         )}
-        {bus.price_per_seat && (
+        {(bus.current_price || bus.price_per_seat) && (
           <div>
-            <strong>Price per seat:</strong> ₹{bus.price_per_seat}
+            <strong>Price per seat:</strong> ₹{bus.current_price || bus.price_per_seat}
           </div>
         )}
         {bus.status && (
@@ -325,9 +337,9 @@ export default function BusDetails() {
           }
         </div>
         
-        {selected.size > 0 && bus.price_per_seat && (
+        {selected.size > 0 && (bus.current_price || bus.price_per_seat) && (
           <div style={{ marginTop: '10px' }}>
-            <strong>Total Price:</strong> ₹{selected.size * bus.price_per_seat}
+            <strong>Total Price:</strong> ₹{selected.size * (bus.current_price || bus.price_per_seat)}
           </div>
         )}
         
@@ -46,9 +46,10 @@ export default function ConfirmReservation() {
     }
     setConfirmLoading(true);
     try {
+      // one confirmation per reservation: a retried request replays the first result
       const res = await api.post(`/reservations/confirm/${reservationId}`, {
         passengers
-      });
+      }, { headers: { "Idempotency-Key": `confirm-${reservationId}` } });
       setSuccess(res.data.booking_id);
       localStorage.removeItem(`reservation_${reservationId}`);
       setTimeout(() => navigate("/"), 2500);
@@ -228,6 +228,33 @@ export default function Home() {
   `${process.env.PUBLIC_URL}/images/Gemini_Generated_Image_g7obbxg7obbxg7ob.png`,
   ];
 
+  // city autocomplete (served from the backend's in-memory route catalogue)
+  const [srcSuggestions, setSrcSuggestions] = useState([]);
+  const [dstSuggestions, setDstSuggestions] = useState([]);
+
+  const fetchSuggestions = async (q, setter) => {
+    if (!q || !q.trim()) {
+      setter([]);
+      return;
+    }
+    try {
+      const res = await api.get("/routes/suggest", { params: { q } });
+      setter(res.data.cities || []);
+    } catch (error) {
+      setter([]);
+    }
+  };
+
+  useEffect(() => {
+    const t = setTimeout(() => fetchSuggestions(src, setSrcSuggestions), 150);
+    return () => clearTimeout(t);
+  }, [src]);
+
+  useEffect(() => {
+    const t = setTimeout(() => fetchSuggestions(dst, setDstSuggestions), 150);
+    return () => clearTimeout(t);
+  }, [dst]);
+
   const search = async (e) => {
     e && e.preventDefault();
     setErr(null);
@@ -252,8 +279,14 @@ export default function Home() {
       <div className="card" style={{ marginTop: 16 }}>
         <h3>Search buses</h3>
         <form className="row" onSubmit={search} style={{ gap: 8, alignItems: "center" }}>
-          <input placeholder="Source city" value={src} onChange={(e) => setSrc(e.target.value)} required />
-          <input placeholder="Destination city" value={dst} onChange={(e) => setDst(e.target.value)} required />
+          <input placeholder="Source city" list="src-cities" value={src} onChange={(e) => setSrc(e.target.value)} required />
+          <datalist id="src-cities">
+            {srcSuggestions.map((c) => <option key={c} value={c} />)}
+          </datalist>
+          <input placeholder="Destination city" list="dst-cities" value={dst} onChange={(e) => setDst(e.target.value)} required />
+          <datalist id="dst-cities">
+            {dstSuggestions.map((c) => <option key={c} value={c} />)}
+          </datalist>
           <button className="btn" type="submit" disabled={loading}>
             {loading ? "Searching..." : "Search"}
           </button>
@@ -272,7 +305,7 @@ export default function Home() {
                 <div style={{ fontSize: 13, color: "#666" }}>Starts: {b.start_time ? new Date(b.start_time).toLocaleString() : "TBD"}</div>
               </div>
               <div style={{ textAlign: "right" }}>
-                <div>Price per seat: <strong>₹{b.price_per_seat}</strong></div>
+                <div>Price per seat: <strong>₹{b.current_price || b.price_per_seat}</strong></div>
                 <div style={{ marginTop: 8 }}>
                   <Link to={`/buses/${b._id}`} className="btn-small">View & Book</Link>
                 </div>
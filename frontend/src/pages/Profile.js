@@ -280,7 +280,8 @@ export default function Profile() {
     if (!window.confirm("Cancel this booking and get a refund?")) return;
     setActionLoading(bookingId);
     try {
-      const res = await api.post(`/users/bookings/${bookingId}/cancel`);
+      const res = await api.post(`/users/bookings/${bookingId}/cancel`, null,
+        { headers: { "Idempotency-Key": `cancel-${bookingId}` } });
       alert(`Booking cancelled. Refunded ₹${res.data.refunded}. New balance: ₹${res.data.new_balance.toFixed(2)}`);
       const me = await api.get("/users/me");
       setProfile(me.data);
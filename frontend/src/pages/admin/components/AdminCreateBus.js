@@ -6,7 +6,8 @@ export default function AdminCreateBus({ routes = [], onCreated }) {
     route_id: routes[0]?._id || "",
     name: "",
     start_time: "",
-    seats_count: 20,
+    seats_count: 40,
+    layout: "2+2",
     price_per_seat: 200,
     sales_open_time: ""
   });
@@ -28,12 +29,13 @@ export default function AdminCreateBus({ routes = [], onCreated }) {
         name: form.name,
         start_time: new Date(form.start_time).toISOString(),
         seats_count: Number(form.seats_count),
+        layout: form.layout,
         price_per_seat: Number(form.price_per_seat),
         sales_open_time: form.sales_open_time ? new Date(form.sales_open_time).toISOString() : undefined,
         status: "published"
       };
       await api.post("/admin/buses", payload);
-      setForm({ route_id: routes[0]?._id || "", name: "", start_time: "", seats_count: 20, price_per_seat: 200, sales_open_time: "" });
+      setForm({ route_id: routes[0]?._id || "", name: "", start_time: "", seats_count: 40, layout: "2+2", price_per_seat: 200, sales_open_time: "" });
       onCreated && onCreated();
     } catch (e) {
       setErr(e.response?.data || e.message);
@@ -54,6 +56,12 @@ export default function AdminCreateBus({ routes = [], onCreated }) {
         <label>Start time (UTC)</label>
         <input type="datetime-local" value={form.start_time} onChange={e => setForm({ ...form, start_time: e.target.value })} required />
         <input placeholder="Seats count" type="number" value={form.seats_count} onChange={e => setForm({ ...form, seats_count: e.target.value })} required />
+        <select value={form.layout} onChange={e => setForm({ ...form, layout: e.target.value })}>
+          <option value="2+2">Seater 2+2</option>
+          <option value="2+1">Seater 2+1</option>
+          <option value="sleeper">Sleeper (2 decks)</option>
+          <option value="double-decker">Double-decker 2+2</option>
+        </select>
         <input placeholder="Price per seat" type="number" value={form.price_per_seat} onChange={e => setForm({ ...form, price_per_seat: e.target.value })} required />
         <label>Optional: sales open time (datetime-local)</label>
         <input type="datetime-local" value={form.sales_open_time} onChange={e => setForm({ ...form, sales_open_time: e.target.value })} />